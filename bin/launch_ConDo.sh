@@ -34,7 +34,35 @@ srun cp -arp ${DB_DSK_PATH}/uniclust30_2018_08 ${DB_SHM_PATH}/
 srun tree /dev/shm/
 
 # Enter the working directory.
-cd /mnt/ceph/users/dberenberg/Nastyomics/DomainPrediction/ConDo
+export CONDO_DIR=/mnt/ceph/users/dberenberg/Nastyomics/DomainPrediction/ConDo
+cd ${CONDO_DIR}
+
+# The paths of ConDo.sh, among them WEIGHT_FILE for the prediction server.
+source ${CONDO_DIR}/ConDo.PATH.djb
+
+# One warm prediction server per node: the socket is node-local, so each
+# node's tasks talk to their own server. condo-helper-suite predicts
+# in-process on a node where it is not up.
+export CONDO_SOCKET=/tmp/condo-predict-${SLURM_JOB_ID}.sock
+SERVER_PID=""
+if [ -z "${WEIGHT_FILE}" ]; then
+    echo "WEIGHT_FILE is not set by ConDo.PATH.djb; the tasks predict in-process." >&2
+else
+    srun --overlap --ntasks-per-node=1 bin/condo-helper-suite serve -w ${WEIGHT_FILE} --socket ${CONDO_SOCKET} &
+    SERVER_PID=$!
+
+    # Wait for the socket on every node before the tasks start.
+    srun --overlap --ntasks-per-node=1 bash -c \
+        "for i in \$(seq 300); do [ -S ${CONDO_SOCKET} ] && exit 0; sleep 1; done; exit 1"
+    if [ $? -ne 0 ]; then
+        echo "The prediction server did not come up on every node; those tasks predict in-process." >&2
+    fi
+fi
 
 # Run all the tasks.
 disBatch.py -c 10 ConDoTestTasks
+
+if [ ! -z "${SERVER_PID}" ]; then
+    kill ${SERVER_PID}
+    wait ${SERVER_PID}
+fi
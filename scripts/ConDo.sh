@@ -100,6 +100,30 @@ _notfound() {
     echo $1 $2 not found. Something may be wrong with $1. Returning $NO_OUTPUT. 
 }
 
+check_feature() {
+    # bin/feature must be built from this src/feature.c: run_feature uses -base, and PROFILE=msa
+    # uses -profile_only and -qij, which the binary built before them does not know.
+    local prefix="[feature]"
+    local flags="-base"
+    if [ "${PROFILE}" == "msa" ]; then
+        flags="${flags} -profile_only -qij"
+    fi
+
+    for flag in ${flags}; do
+        if ! grep -q -a -- "${flag}" ${CONDO_BIN}/feature; then
+            echo "$prefix ${CONDO_BIN}/feature does not know ${flag}; it was built from an older src/feature.c."
+            echo "$prefix Rebuild it: gcc ${CONDO_DIR}/src/feature.c -o ${CONDO_BIN}/feature -lm -fopenmp -O2"
+            return $POOR_INPUT
+        fi
+    done
+
+    if [ ${CONDO_BIN}/feature -ot ${CONDO_DIR}/src/feature.c ]; then
+        echo "$prefix ${CONDO_BIN}/feature is older than src/feature.c; rebuild it if the source changed."
+    fi
+
+    return $SUCCESS
+}
+
 run_ccmpred() {
     local prefix="[ccmpred]"
 
@@ -165,7 +189,14 @@ run_alignment() {
     ${HHPATH}/scripts/reformat.pl -r ${KEY}.a2m ${KEY}.hmm.fas >> ${logdir}/reformat.log
     # Generates a .aln file. 
     # (Removes all headers information from a2m file to generate one large alignment mat.
-    ${PY3} ${CONDO_BIN}/aln ${KEY} 
+    # (Set ALN_OPTIONS=-merge to stitch the domain hits of each subject into one row.)
+    ${PY3} ${CONDO_BIN}/aln ${KEY} ${ALN_OPTIONS}
+
+    # Caps the alignment depth by identity to the query before ccmpred and feature.
+    # (Set MAX_ALIGNMENTS to enable; keeps the rows above the identity of the MAX_ALIGNMENTS+1-th best.)
+    if [ ! -z ${MAX_ALIGNMENTS} ]; then
+        ${PY3} ${CONDO_SCRIPTS}/si.py ${KEY} -n ${MAX_ALIGNMENTS} --msa >> ${logdir}/si.log
+    fi
     
     if [ ! -s ${KEY}.aln ]; then
         _notfound ${prefix} ${KEY}.aln
@@ -187,6 +218,13 @@ run_blast() {
         NPROCESSORS=$2
     fi
 
+    # (Set PROFILE=msa to skip BLAST; run_sann then computes target.ck2 from the alignment.
+    # scripts/compare_profiles.py reports whether the boundary calls stay the same.)
+    if [ "${PROFILE}" == "msa" ]; then
+        echo "$prefix PROFILE=msa. Skipping BLAST."
+        return $SUCCESS
+    fi
+
     if [ ! -s "${target}.chk" ]; then  # run BLAST
         ${BLAST_BIN}/blastpgp -b 0 -v 5000 -j 3 -h 0.001 -a ${NPROCESSORS} -d ${UNIREF90} -i $target.fasta -C $target.chk > ${logdir}/blast.log
     else
@@ -253,9 +291,15 @@ run_sann() {
     fi
     
     if [[ ! -s $target.a22 && ! -s $target.a3 ]]; then
-        echo "$prefix Running mkchk2."
         LOG=$logdir/sann.log
-        ${CONDO_BIN}/mkchk2 ${target} --qij ${CONDO_DATA}/qij | tee -a ${LOG}
+        if [ "${PROFILE}" == "msa" ]; then
+            echo "$prefix Computing the profile from ${target}.msa."
+            ${CONDO_BIN}/feature ${target} ${NPROCESSORS} -profile_only -qij ${CONDO_DATA}/qij | tee -a ${LOG}
+            cp ${target}.msa.ck2 ${target}.ck2
+        else
+            echo "$prefix Running mkchk2."
+            ${CONDO_BIN}/mkchk2 ${target} --qij ${CONDO_DATA}/qij | tee -a ${LOG}
+        fi
         echo "$prefix Running sann.sh"
 
         echo "${SANN}/bin/sann.sh ${target}.fasta ${NPROCESSORS}"
@@ -291,9 +335,9 @@ run_feature() {
         NPROCESSORS=$2
     fi
     # /path/to/data/prefix
-    ${CONDO_BIN}/feature $target ${NPROCESSORS}
-    if [ ! -e $target".feature.txt" ]; then
-        _notfound $prefix "${target}_feature.txt"
+    ${CONDO_BIN}/feature $target ${NPROCESSORS} -base
+    if [ ! -e $target".base.npy" ]; then
+        _notfound $prefix "${target}.base.npy"
         return $NO_OUTPUT
     fi
 
@@ -318,6 +362,11 @@ CONDO_LOGS=${CONDO_SESSION}/logs
 mkdir -p ${CONDO_LOGS}
 echo "$PRFX session=${CONDO_SESSION}, fasta=$target, threads=$NPROCESSORS"
 
+check_feature
+if [ $? -gt $SUCCESS ]; then
+    exit $POOR_INPUT
+fi
+
 echo "$PRFX Starting hhblits."
 run_alignment $target ${NPROCESSORS}
 if [ $? -gt $SUCCESS ]; then 
@@ -1,15 +1,23 @@
 #!/usr/bin/env python
 
+from collections import Counter
 from itertools import groupby
 import numpy as np
+import struct
 import sys
 
 USAGE="""
-aln.py target
-Generates an aln file from 
+aln.py target [-binary] [-merge]
+Generates an aln file from target.hmm.fas, and target.msa with the aligned
+range of each hit in its header. With -binary the alignment is also written
+as a (hits x N) uint8 target.aln.npy of the aligned residues' ASCII codes.
+With -merge the non-overlapping hits of each subject are stitched into one
+row, its header listing the covered ranges (1-based) as /a-b,c-d.
 """
 
 seqcode1="ARNDCQEGHILKMFPSTWYV-"
+GAP = b'-'
+MAX_GAP = 25  # merged hits further apart than this keep separate ranges in the header
 
 def parse_sequence_from_fasta(fastafile):
     """Retrieve the sequence from a single sequence fasta file."""
@@ -19,157 +27,132 @@ def parse_sequence_from_fasta(fastafile):
     return sequence
         
 
-def parse_alignment_file(query_sequence, filename):
-    """Parse an alignment file aligned to `query_sequence`.
+def aligned_range(seq):
+    """First and last non-gap column of an aligned sequence (bytes), (0, N - 1) if there are none."""
+    fin = len(seq.rstrip(GAP)) - 1
+    if fin < 0:
+        return 0, len(seq) - 1
+    return len(seq) - len(seq.lstrip(GAP)), fin
+
+def parse_alignment_file(query_sequence, filename, report=True):
+    """Parse an alignment file aligned to `query_sequence`, one record at a time.
 
     Parsing entails retrieving the aligned sequence title, the alignment lines, the initial gap placement
-    and the final gap placement
+    and the final gap placement. Titles and sequences are bytes.
     """
     N = len(query_sequence)
-    with open(filename, 'r') as handle:
-        for i, (is_header, group) in enumerate(groupby(handle, key=lambda line: line.startswith('>'))):
+    with open(filename, 'rb') as handle:
+        for is_header, group in groupby(handle, key=lambda line: line.startswith(b'>')):
             if is_header:
-                title = group.__next__().lstrip('>').rstrip()
+                title = next(group).lstrip(b'>').rstrip()
             else:
-                seq    = ''.join(line.strip() for line in group)
+                seq    = b''.join(line.strip() for line in group)
                 if len(seq) == N:
-                    is_not_gap = list(filter(lambda i: seq[i] != '-', range(len(seq))))
-                    if is_not_gap: # non empty
-                        ini = min(is_not_gap)
-                        fin = max(is_not_gap)
-                    else:
-                        ini, fin = 0, N - 1
-                    yield [title, seq, ini, fin]
-                else:
+                    yield [title, seq, *aligned_range(seq)]
+                elif report:
                     print(len(seq), '!=', N, '!')
 
+class _NpyRows:
+    """Appends uint8 rows of width N to an .npy file whose header is completed on close."""
+
+    HEADER = 128  # bytes, room for any row count
+
+    def __init__(self, filename, N):
+        self.handle, self.N, self.rows = open(filename, 'wb', buffering=1 << 20), N, 0
+        self.handle.write(self._header())
+
+    def _header(self):
+        header = f"{{'descr': '|u1', 'fortran_order': False, 'shape': ({self.rows}, {self.N}), }}"
+        header = header.ljust(self.HEADER - 11) + '\n'
+        return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+    def write(self, row):
+        self.handle.write(row)
+        self.rows += 1
+
+    def close(self):
+        self.handle.seek(0)
+        self.handle.write(self._header())
+        self.handle.close()
+
+def hit_records(query_sequence, filename):
+    """(header, row) of every hit on its own, the aligned range in the header as it has always been written."""
+    for h, a, ini, fin in parse_alignment_file(query_sequence, filename):
+        yield b'%s/%d-%d' % (h.split()[0], ini, fin), a
+
+def merge_hits(name, hits, N, maxgap=MAX_GAP):
+    """Stitches the hits of one subject into as few rows as possible.
+
+    The hits are sorted by their first aligned column; each sweep takes every hit that starts after
+    the end of the last one taken into one row, the others are left for the next sweep. The header
+    lists the 1-based ranges of the row, hits less than `maxgap` apart as one range.
+    args:
+        :hits (list) - (seq, ini, fin) of the hits
+    yields:
+        :(header, row)
+    """
+    hits = sorted(hits, key=lambda hit: hit[1])
+    while hits:
+        chain, rest = [hits[0]], []
+        for hit in hits[1:]:
+            (chain if hit[1] > chain[-1][2] else rest).append(hit)
+        hits = rest
+        # each hit contributes its columns up to the start of the next one
+        starts = [0] + [ini for _, ini, _ in chain[1:]] + [N]
+        row = b''.join(seq[start:end] for (seq, _, _), start, end in zip(chain, starts, starts[1:]))
+        ranges = [[chain[0][1], chain[0][2]]]
+        for _, ini, fin in chain[1:]:
+            if ini - ranges[-1][1] > maxgap:
+                ranges.append([ini, fin])
+            else:
+                ranges[-1][1] = fin
+        yield name + b'/' + b','.join(b'%d-%d' % (ini + 1, fin + 1) for ini, fin in ranges), row
+
+def merged_records(query_sequence, filename, maxgap=MAX_GAP):
+    """(header, row) of the hits with the hits of each subject merged (see merge_hits), wherever they
+    appear in the file. A first pass counts the hits per subject; the second holds the hits of a subject
+    only until its last one is read, so memory is bounded by the subjects open at a time."""
+    remaining = Counter(h.split()[0] for h, *_ in parse_alignment_file(query_sequence, filename, report=False))
+    pending = dict()
+    for h, a, ini, fin in parse_alignment_file(query_sequence, filename):
+        name = h.split()[0]
+        remaining[name] -= 1
+        if remaining[name] == 0 and name not in pending:
+            yield name + b'/%d-%d' % (ini + 1, fin + 1), a
+            continue
+        pending.setdefault(name, []).append((a, ini, fin))
+        if remaining[name] == 0:
+            yield from merge_hits(name, pending.pop(name), len(query_sequence), maxgap)
+
 def main():
     try:
         target = sys.argv[1]
     except IndexError:
         print(USAGE)
         sys.exit()
+    binary = '-binary' in sys.argv[2:]
+    merge  = '-merge' in sys.argv[2:]
 
     a2mfile = target + ".hmm.fas"
     fasta   = target + ".fasta"
 
     seq = parse_sequence_from_fasta(fasta)
-    aln = list(parse_alignment_file(seq, a2mfile))
-    Nseq, Naln = map(len, (seq, aln))
-    
-    _, alignments, _, _ = zip(*aln)
-    with open(target + '.aln', 'w') as alnfile:
-        print(*alignments, sep='\n', file=alnfile)
-
-    with open(target + '.msa', 'w') as msafile:
-        for h, a, ini, fin in aln:
-            print(f">{h.split()[0]}/{ini}-{fin}", file=msafile)
-            print(a, file=msafile)
-
-    print(f"[aln]: Wrote {target}.aln and {target}.msa.")
-    
-    #old_title = ""
-    #aln2 = []
-    #check = False
-    #for i, item in enumerate(aln):
-    #    title, alignment, ini, fin = item 
-    #    if title != old_title:
-    #        if check:
-    #            #print("Appending to aln2")
-    #            aln2.append(con)
-    #        con = item
-    #        check = True
-    #        old_title = title
-    #    else:
-    #        #print("appending...")
-    #        con.append(item)
-    #aln2 += con
-    #print(len(aln2), len(aln))
-
-        
-    #aln2=[]
-    #k=0
-    #title_old=""
-    #check=0
-
-    #for i in range(0,Naln) :
-    #    title=aln[i][0]
-    #    seq=aln[i][1]
-    #    ini1=aln[i][2]
-    #    fin1=aln[i][3]
-
-    #    if title!=title_old:
-    #        if check!=0:
-    #            aln2+=[con]
-    #        check=1
-    #        k+=1
-    #        title_old=title
-    #        con=[aln[i]]
-    #    else:
-    #        con+=[aln[i]]
-    #aln2+=[con]
-
-    #alnfile=target+".aln"
-    #fp_aln=open(alnfile,"w")
-
-    #msafile=target+".msa"
-    #fp_msa=open(msafile,"w")
-
-    #Naln2=len(aln2)
-    #for k in range(0,Naln2) :
-    #    dom=aln2[k]
-    #    Ndom=len(dom)
-    #    title= dom[0][0]
-    #    if Ndom==1 :
-    #        seq= dom[0][1]
-    #        ini1=dom[0][2]
-    #        fin1=dom[0][3]
-
-    #        print >>fp_msa, "%s/%d-%d" %(title, ini1+1, fin1+1)
-    #        print >>fp_msa, seq
-    #        print >>fp_aln, seq
-    #        continue
-    #    check_use=[]
-    #    for m in range(0,Ndom):
-    #        check_use+=[0]
-    #    for m in range(0,Ndom):
-    #        dm=dom[m]
-    #        seq1=dm[1]
-    #        ini1=dm[2]
-    #        fin1=dm[3]
-    #        for n in range(m+1,Ndom):
-    #            dn=dom[n]
-    #            seq2=dn[1]
-    #            ini2=dn[2]
-    #            fin2=dn[3]
-    #            if (ini1<ini2 and fin1<ini2):
-    #                seq_new=seq1[0:ini2]+seq2[ini2:]
-    #                if(ini2-fin1>25):
-    #                    print >>fp_msa, "%s/%d-%d,%d-%d" %(title, ini1+1, fin1+1,ini2+1,fin2+1)
-    #                else :
-    #                    print >>fp_msa, "%s/%d-%d" %(title, ini1+1, fin2+1)
-    #                print >>fp_msa, seq_new
-    #                print >>fp_aln, seq_new
-    #                check_use[m]=1
-    #                check_use[n]=1
-
-    #            elif (ini1>ini2 and fin2<ini1):
-    #                seq_new=seq2[0:ini1]+seq1[ini1:]
-    #                if(ini1-fin2>25):
-    #                    print >>fp_msa, "%s/%d-%d,%d-%d" %(title, ini2+1, fin2+1,ini1+1,fin1+1)
-    #                else :
-    #                    print >>fp_msa, "%s/%d-%d" %(title, ini2+1, fin1+1)
-    #                print >>fp_msa, seq_new
-    #                print >>fp_aln, seq_new
-    #                check_use[m]=1
-    #                check_use[n]=1
-    #        if (check_use[m]==0):
-    #            print >>fp_msa, "%s/%d-%d" %(title, ini1+1, fin1+1)
-    #            print >>fp_msa, seq1
-    #            print >>fp_aln, seq1
-
-    #fp_aln.close()
-    #fp_msa.close()
+    records = merged_records(seq, a2mfile) if merge else hit_records(seq, a2mfile)
+    # records are written as they are parsed, so memory does not grow with the number of hits
+    naln = 0
+    npy = _NpyRows(target + '.aln.npy', len(seq)) if binary else None
+    with open(target + '.aln', 'wb', buffering=1 << 20) as alnfile, \
+         open(target + '.msa', 'wb', buffering=1 << 20) as msafile:
+        for header, a in records:
+            alnfile.write(a + b'\n')
+            msafile.write(b'>%s\n%s\n' % (header, a))
+            if npy:
+                npy.write(a)
+            naln += 1
+    if npy:
+        npy.close()
+
+    print(f"[aln]: Wrote {naln} alignments to {target}.aln{', ' + target + '.aln.npy' if binary else ''} and {target}.msa.")
 
 if __name__ == '__main__':
     main()
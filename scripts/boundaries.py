@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Domain boundary calls from the per-residue predictions, as made by
+`condo-helper-suite generate-result`.
+"""
+
+import numpy as np
+
+
+FW = 40  # boundaries closer than this to a terminus are not called, candidates closer than this to each other merge
+
+def boundary_scores(pred_boundary):
+    """Summed score of each residue: each row of the predictions is a 4 tuple, the sum of which yields the score.
+    The columns are added left to right in the predictions' dtype, as sum() over the rows did."""
+    pred_boundary = np.asarray(pred_boundary)
+    scores = pred_boundary[:, 0].copy()
+    for column in range(1, pred_boundary.shape[1]):
+        scores += pred_boundary[:, column]
+    return scores
+
+def _prefix_length(arg_scores, cutoff):
+    # the walk stops at the first residue *index* not above the cutoff, rather than the first score;
+    # calls have always been made this way
+    stop = np.flatnonzero(arg_scores <= cutoff)
+    return stop[0] if len(stop) else len(arg_scores)
+
+def _accepted(scores, order, N, fw):
+    """Greedy suppression in score order over the residues `order`: a candidate i is inside of a
+    predefined domain when i + 1 is within fw of an accepted left bound. Each pass jumps to the next
+    candidate that is not, so there is one pass per accepted boundary rather than per residue.
+    returns:
+        :lbounds, positions (arrays) - the accepted left bounds and their positions in `order`
+    """
+    inside = (order >= 1) & (order <= N - 2)
+    positions = np.flatnonzero(inside)
+    order = order[inside]
+    # shift left if appropriate
+    shifted = np.where(scores[order + 1] < scores[order - 1], order, order + 1)
+
+    blocked = np.zeros(N + 1, dtype=bool)
+    accepted, start = [], 0
+    while start < len(order):
+        free = np.flatnonzero(~blocked[order[start:] + 1])
+        if not len(free):
+            break
+        k = start + free[0]
+        accepted.append(k)
+        lb = shifted[k]
+        blocked[max(lb - fw + 1, 0):max(lb + fw, 0)] = True
+        start = k + 1
+    accepted = np.array(accepted, dtype=np.intp)
+    return shifted[accepted], positions[accepted]
+
+def boundary_candidates(scores, cutoff, N, fw=FW):
+    """Candidate boundaries in order of decreasing score.
+    args:
+        :scores (array) - summed scores
+        :cutoff (float) - confidence cutoff
+        :N (int) - sequence length
+    returns:
+        :lbounds, rbounds, lbound_scores (arrays) - left/right residue of each candidate and the left score
+    """
+    arg_scores = np.argsort(-scores)
+    # pull all residues above domain boundary cutoff
+    lbounds, _ = _accepted(scores, arg_scores[:_prefix_length(arg_scores, cutoff)], N, fw)
+    return lbounds, lbounds + 1, scores[lbounds]
+
+def valid_boundaries(lbounds, lbound_scores, cutoff, N, fw=FW):
+    """Which candidates are called: above the cutoff and more than fw residues from both termini."""
+    return (lbound_scores > cutoff) & (fw < lbounds) & (lbounds < N - fw - 1)
+
+def call_boundaries(scores, cutoff, N=None, fw=FW):
+    """The called boundaries as (lb, rb, score) in order of decreasing score."""
+    N = len(scores) if N is None else N
+    lbounds, rbounds, lbound_scores = boundary_candidates(scores, cutoff, N, fw)
+    valid = valid_boundaries(lbounds, lbound_scores, cutoff, N, fw)
+    return list(zip(lbounds[valid], rbounds[valid], lbound_scores[valid]))
+
+def boundary_sweep(scores, cutoffs, N=None, fw=FW):
+    """Called boundaries at several cutoffs from one sort and one suppression pass. The walk at a
+    cutoff is a prefix of the walk at any lower one, so the candidates are found once at the lowest
+    cutoff and each cutoff keeps those in its own prefix.
+    returns:
+        :(dict) - cutoff: (lbounds, rbounds, lbound_scores) of the called boundaries, in order of decreasing score
+    """
+    N = len(scores) if N is None else N
+    arg_scores = np.argsort(-scores)
+    lengths = {cutoff: _prefix_length(arg_scores, cutoff) for cutoff in cutoffs}
+    lbounds, positions = _accepted(scores, arg_scores[:max(lengths.values(), default=0)], N, fw)
+    lbound_scores = scores[lbounds]
+    calls = {}
+    for cutoff, length in lengths.items():
+        called = (positions < length) & valid_boundaries(lbounds, lbound_scores, cutoff, N, fw)
+        calls[cutoff] = (lbounds[called], lbounds[called] + 1, lbound_scores[called])
+    return calls
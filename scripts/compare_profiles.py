@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compares the BLAST profile of a target (target.ck2, from PSI-BLAST and
+mkchk2.py) with the one bin/feature -profile msa computes from the jackhmmer
+alignment (target.msa), to tell whether the BLAST search can be skipped.
+
+Per target the report gives the mean L1 distance and Jensen-Shannon
+divergence of the two profiles per residue and the share of residues whose
+most likely amino acid agrees. Both profiles are then turned into features and
+run through the network: the largest change of a summed boundary score and
+whether the boundary calls at --conf-cut are unchanged, each call allowed to
+move by up to --tolerance residues. The MSA profile is safe to use on the
+sessions given when the calls are unchanged on all of them.
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from inference import DenseModel, DenseEnsemble
+from features import PSEUDO, base_arrays, expand_features
+from boundaries import call_boundaries
+
+
+EXAMPLES = Path(__file__).resolve().parent.parent / 'examples'
+QIJ      = Path(__file__).resolve().parent.parent / 'data' / 'qij'
+
+def session_targets(session):
+    """Targets of a session directory that have both a .ck2 and an .msa."""
+    session = Path(session)
+    return [ck2.with_suffix('') for ck2 in sorted(session.glob('*.ck2')) if ck2.with_suffix('.msa').exists()]
+
+def profile_distances(ck2, msa):
+    """(mean L1, mean Jensen-Shannon divergence in bits, share of equal argmax) over the residues."""
+    p = ck2 / np.maximum(ck2.sum(axis=1, keepdims=True), 1e-12)
+    q = msa / np.maximum(msa.sum(axis=1, keepdims=True), 1e-12)
+    m = (p + q) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kl = lambda a: np.where(a > 0, a * np.log2(a / m), 0.0).sum(axis=1)
+        js = (kl(p) + kl(q)) / 2
+    return np.abs(p - q).sum(axis=1).mean(), js.mean(), (ck2.argmax(axis=1) == msa.argmax(axis=1)).mean()
+
+def same_calls(before, after, tolerance=0):
+    """Whether two lists of left bounds pair up one to one, each within tolerance residues."""
+    return len(before) == len(after) and all(abs(a - b) <= tolerance for a, b in zip(sorted(before), sorted(after)))
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("weights", type=Path, nargs='+', help="Keras weight file(s), averaged as in predict.")
+    parser.add_argument("--sessions", type=Path, nargs='+',
+                        default=sorted(path for path in EXAMPLES.iterdir() if path.is_dir()),
+                        help="Session directories to compare on. (default = the examples)")
+    parser.add_argument("--qij", type=Path, default=QIJ, help="Target frequencies of the pseudocounts. (default = data/qij)")
+    parser.add_argument("--pseudo", type=float, default=PSEUDO,
+                        help=f"Pseudocount weight, as bin/feature -pseudo. (default = {PSEUDO:g})")
+    parser.add_argument('-c', '--conf-cut', dest='cutoff', type=float, default=1.4,
+                        help="Confidence cutoff of the boundary calls. (default = 1.4)")
+    parser.add_argument("--tolerance", type=int, default=0,
+                        help="Residues a boundary call may move and still count as unchanged. (default = 0)")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = arguments()
+
+    targets = [target for session in args.sessions for target in session_targets(session)]
+    if not targets:
+        sys.exit("[compare] No target with both a .ck2 and an .msa in the sessions.")
+
+    model = DenseModel.load(args.weights[0]) if len(args.weights) == 1 else DenseEnsemble.load(args.weights)
+    safe = True
+    for target in targets:
+        ck2 = base_arrays(target)
+        msa = base_arrays(target, profile='msa', qij=args.qij, pseudo=args.pseudo)
+        l1, js, agree = profile_distances(ck2['profile'], msa['profile'])
+
+        scores = [model.predict(expand_features(base)).sum(axis=1, dtype=np.float64) for base in (ck2, msa)]
+        calls = [sorted(int(lb) for lb, _, _ in call_boundaries(score, args.cutoff)) for score in scores]
+        same = same_calls(*calls, tolerance=args.tolerance)
+        safe &= same
+        print(f"{target.name:12s} {ck2['Nres']:5d} residues  L1 {l1:.3f}  JS {js:.4f} bits  argmax {agree:6.1%}  "
+              f"max |d score| {np.abs(scores[1] - scores[0]).max():.3f}  "
+              f"calls {'unchanged' if same else 'CHANGED'} {calls[0]} -> {calls[1]}")
+
+    print(f"[compare] {len(targets)} target(s): the MSA profile "
+          + ("gives the same boundary calls; the BLAST search can be skipped on these." if safe else
+             "changes the boundary calls; keep the BLAST profile."))
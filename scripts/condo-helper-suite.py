@@ -6,17 +6,40 @@ Compile features into Python readable format, make predictions, and interpret re
 """
 
 import sys, os 
+import glob
+import json
+import time
+import queue
+import signal
+import socket
+import struct
 import warnings
 import logging
 import argparse
 import textwrap
 import itertools
+import functools
+import threading
+import collections
+import socketserver
+import multiprocessing
+import concurrent.futures
 from pathlib import Path
 
 import numpy as np
 
+from features import NFEATURE, expand_base, compress_features
+from boundaries import boundary_scores, boundary_candidates, valid_boundaries, boundary_sweep
+from inference import PRECISIONS
 
-DEFAULT_WEIGHT_FILE = os.environ.get("WEIGHT_FILE")
+
+DEFAULT_WEIGHT_FILE = os.environ.get("WEIGHT_FILE")  # several weight files are separated by os.pathsep
+DEFAULT_BACKEND     = os.environ.get("CONDO_BACKEND", "numpy")
+BACKENDS            = ["numpy", "keras"]
+DEFAULT_BATCH_SIZE  = 8192
+DEFAULT_SOCKET      = os.environ.get("CONDO_SOCKET", f"/tmp/condo-predict-{os.getuid()}.sock")
+DEFAULT_WORKERS     = os.cpu_count() or 1
+DEFAULT_THREADS     = 16
 
 def _window(seq, n=2):
     """Returns a sliding window (of width n) over data from the iterable
@@ -44,8 +67,49 @@ def _locate_by_extension(session, suffix):
 
     yield from glob
 
-def _create_model(weights):
-    """Ported from the original prediction.py script"""
+def _locate_features(session):
+    """
+    args:
+        :session (Path or str) - the ConDo session to check
+    yields:
+        :one feature file per target, the first found of session/*.feature.npy (`feature -binary` or gather),
+         session/*.base.npy (`feature -base` or `gather --compact`) and session/*.feature.npz (older gathers)
+    """
+    stems = set()
+    for suffix in ['.feature.npy', '.base.npy', '.feature.npz']:
+        for feature_file in _locate_by_extension(session, suffix):
+            stem = feature_file.with_suffix('').stem
+            if stem not in stems:
+                stems.add(stem)
+                yield feature_file
+
+def _load_features(feature_file):
+    """Loads the Nres x 1129 feature matrix from a .feature.npy, .base.npy or .feature.npz file.
+    Base rows are expanded to the full feature rows here, so they are never stored."""
+    if feature_file.name.endswith('.base.npy'):
+        return expand_base(np.load(feature_file, mmap_mode='r'))
+    features = np.load(feature_file, mmap_mode='r')
+    if isinstance(features, np.ndarray):
+        return features
+    return features['feature']
+
+def _create_model(weights, backend="keras", precision=None):
+    """Ported from the original prediction.py script.
+    args:
+        :weights (str) - Keras weight file, or a .npz written by quantize_weights.py
+        :backend (str) - 'keras' builds the TensorFlow model, 'numpy' runs the same forward
+                         pass on the weights read with h5py (see inference.py)
+        :precision (str) - weight precision of the numpy backend; None is float32,
+                           or the stored precision of a .npz
+    returns:
+        :a model with a `predict(features)` method
+    """
+    if backend == "numpy":
+        from inference import DenseModel
+        return DenseModel.load(weights, precision)
+    if precision not in (None, 'float32') or str(weights).endswith('.npz'):
+        raise ValueError("Reduced precision weights need the numpy backend.")
+
     with warnings.catch_warnings():
         warnings.simplefilter('ignore')
         os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'  # or any {'0', '1', '2'}
@@ -76,6 +140,211 @@ def _create_model(weights):
         model.load_weights(weights)
     return model
 
+class _ModelList(list):
+    """Models without a joint forward pass (keras), evaluated one after the other."""
+
+    def predict_members(self, features, batch_size=None):
+        return np.stack([model.predict(features, batch_size=batch_size) for model in self])
+
+    def predict(self, features, batch_size=None):
+        return self.predict_members(features, batch_size=batch_size).mean(axis=0)
+
+def _create_models(weights, backend="keras", precision=None):
+    """`_create_model` for a list of weight files: the model itself for one file, an
+    ensemble with `predict_members` for several (see DenseEnsemble in inference.py)."""
+    if len(weights) == 1:
+        return _create_model(str(weights[0]), backend, precision)
+    if backend == "numpy":
+        from inference import DenseEnsemble
+        return DenseEnsemble.load([str(weight) for weight in weights], precision)
+    return _ModelList(_create_model(str(weight), backend, precision) for weight in weights)
+
+def _predict_members(model, features, batch_size):
+    """(models, N, 4) predictions of a model or ensemble."""
+    if hasattr(model, 'predict_members'):
+        return model.predict_members(features, batch_size=batch_size)
+    return model.predict(features, batch_size=batch_size)[None]
+
+# ====================== prediction server ====================== #
+# A message is a 4 byte big-endian header length, a JSON header and `nbytes`
+# bytes of payload. Features and predictions travel as raw little-endian
+# float32 with their shape in the header.
+
+def _send_message(sock, header, payload=b''):
+    header = json.dumps(dict(header, nbytes=len(payload))).encode('utf8')
+    sock.sendall(struct.pack('>I', len(header)) + header)
+    sock.sendall(payload)
+
+def _recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    while view:
+        nread = sock.recv_into(view)
+        if nread == 0:
+            raise ConnectionError("Connection closed mid-message.")
+        view = view[nread:]
+    return bytes(buf)
+
+def _recv_message(sock):
+    (length,) = struct.unpack('>I', _recv_exact(sock, 4))
+    header = json.loads(_recv_exact(sock, length).decode('utf8'))
+    return header, _recv_exact(sock, header['nbytes'])
+
+class _RemoteModel:
+    """Client of a `serve` prediction server, with the `predict` of the in-process models.
+    If the server goes away, predictions fall back to an in-process model."""
+
+    def __init__(self, socket_path, weights, backend, precision=None):
+        self.socket_path = str(socket_path)
+        weights = [weights] if isinstance(weights, (str, Path)) else list(weights)
+        self.weights, self.backend, self.precision = weights, backend, precision
+        self.fallback = None
+
+    def _request(self, header, payload=b''):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socket_path)
+            _send_message(sock, header, payload)
+            header, payload = _recv_message(sock)
+        if not header.get('ok'):
+            raise RuntimeError(f"[predict] Prediction server error: {header.get('error')}")
+        return header, payload
+
+    @classmethod
+    def connect(cls, socket_path, weights, backend, precision=None):
+        """A client if a server on `socket_path` is up and serves the same `weights` in `precision`, else None.
+        No precision means float32 for weight.h5 files and the stored precision for .npz ones."""
+        if not socket_path or not Path(socket_path).exists():
+            return None
+        remote = cls(socket_path, weights, backend, precision)
+        try:
+            header, _ = remote._request(dict(op='ping'))
+        except (OSError, ValueError, RuntimeError):
+            return None
+        if header.get('weights') != [str(Path(weight).resolve()) for weight in remote.weights]:
+            return None
+        if precision is None and not any(str(weight).endswith('.npz') for weight in remote.weights):
+            precision = 'float32'
+        if precision is not None and header.get('precision') != precision:
+            return None
+        return remote
+
+    def predict_members(self, features, batch_size=None):
+        features = np.ascontiguousarray(features, dtype='<f4')
+        if self.fallback is None:
+            try:
+                header, payload = self._request(dict(op='predict', rows=features.shape[0], cols=features.shape[1]),
+                                                features.tobytes())
+                return np.frombuffer(payload, dtype='<f4').reshape(header['models'], header['rows'],
+                                                                   header['cols']).astype(np.float32)
+            except (OSError, ValueError, RuntimeError):
+                warnings.warn("[predict] Lost the prediction server, predicting in-process.", UserWarning, stacklevel=1)
+                self.fallback = _create_models(self.weights, self.backend, self.precision)
+        return _predict_members(self.fallback, features, batch_size or DEFAULT_BATCH_SIZE)
+
+    def predict(self, features, batch_size=None):
+        return self.predict_members(features, batch_size=batch_size).mean(axis=0)
+
+class _Batcher(threading.Thread):
+    """Runs the model for the server: requests that arrive within `max_wait` seconds of
+    each other are stacked into one model call of up to `batch_size` rows."""
+
+    def __init__(self, model, batch_size, max_wait):
+        super().__init__(daemon=True)
+        self.model, self.batch_size, self.max_wait = model, batch_size, max_wait
+        self.requests = queue.Queue()
+
+    def submit(self, features):
+        request = dict(features=features, done=threading.Event())
+        self.requests.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise RuntimeError(request['error'])
+        return request['pred']
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            rows = len(batch[0]['features'])
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.batch_size:
+                try:
+                    request = self.requests.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                batch.append(request)
+                rows += len(request['features'])
+            try:
+                pred = _predict_members(self.model, np.concatenate([request['features'] for request in batch]),
+                                        self.batch_size)
+                offsets = np.cumsum([len(request['features']) for request in batch])[:-1]
+                for request, request_pred in zip(batch, np.split(pred, offsets, axis=1)):
+                    request['pred'] = request_pred
+            except Exception as error:
+                for request in batch:
+                    request['error'] = f"{type(error).__name__}: {error}"
+            for request in batch:
+                request['done'].set()
+
+class _PredictionHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            header, payload = _recv_message(self.request)
+            if header.get('op') == 'ping':
+                _send_message(self.request, dict(ok=True, weights=self.server.weights, precision=self.server.precision))
+                return
+            features = np.frombuffer(payload, dtype='<f4').reshape(header['rows'], header['cols'])
+            pred = np.ascontiguousarray(self.server.batcher.submit(features), dtype='<f4')
+            _send_message(self.request, dict(ok=True, models=pred.shape[0], rows=pred.shape[1], cols=pred.shape[2]),
+                          pred.tobytes())
+        except Exception as error:
+            try:
+                _send_message(self.request, dict(ok=False, error=f"{type(error).__name__}: {error}"))
+            except OSError:
+                pass
+
+def _model(args):
+    """The prediction server on --socket if one is running with the same weights, otherwise an in-process model."""
+    remote = _RemoteModel.connect(getattr(args, 'socket', None), args.weights, args.backend, args.precision)
+    if remote is not None:
+        if args.verbose:
+            print(f"[predict] Using the prediction server on {args.socket}.")
+        return remote
+    return _create_models(args.weights, args.backend, args.precision)
+
+def serve(args):
+    """Serves predictions on a Unix socket with the model loaded once.
+    args:
+        :args - the command line arguments.
+    returns:
+        :(bool) - whether a server ran
+    """
+    socket_path = Path(args.socket)
+    if socket_path.exists():
+        if _RemoteModel.connect(socket_path, args.weights, args.backend, args.precision) is not None:
+            print(f"[serve] A server is already running on {socket_path}.")
+            return False
+        socket_path.unlink()
+
+    model = _create_models(args.weights, args.backend, args.precision)
+    batcher = _Batcher(model, args.batch_size, args.max_wait / 1000.0)
+    batcher.start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with socketserver.ThreadingUnixStreamServer(str(socket_path), _PredictionHandler) as server:
+        server.daemon_threads = True
+        server.batcher = batcher
+        server.weights = [str(Path(weight).resolve()) for weight in args.weights]
+        server.precision = getattr(model, 'precision', 'float32')
+        if args.verbose:
+            print(f"[serve] Serving {', '.join(server.weights)} ({server.precision}) on {socket_path}.")
+        try:
+            server.serve_forever()
+        finally:
+            try:
+                socket_path.unlink()
+            except FileNotFoundError:
+                pass
+    return True
+
 def _read_sequence(fastafile):
     with open(fastafile, 'r') as fasta:
         for is_header, group in itertools.groupby(fasta, lambda line: line.startswith(">")):
@@ -84,146 +353,393 @@ def _read_sequence(fastafile):
             else:
                 return "".join(line.strip() for line in group)
     
+def _read_feature_text(feature_file):
+    """Parses a .feature.txt straight into a float32 Nres x 1129 array, without the index column.
+    raises:
+        :ValueError - when the rows do not have the index and 1129 feature columns
+    """
+    with open(feature_file, 'r') as featuretxt:
+        ncols = len(featuretxt.readline().split())
+    if ncols != NFEATURE + 1:
+        raise ValueError(f"{feature_file} has {ncols} columns, expected {NFEATURE + 1}.")
+    # numpy's C text reader fills the array in place; ragged rows raise ValueError
+    return np.loadtxt(feature_file, dtype=np.float32, usecols=range(1, NFEATURE + 1), ndmin=2)
+
+def _gather_file(item, compact=False, dont_overwrite=False):
+    """Gathers one .feature.txt; runs in a worker process.
+    args:
+        :item (tuple) - (session, feature_file)
+    returns:
+        :(ran, message, warning) - whether a file was written, the progress line and a warning, if any
+    """
+    _, feature_file = item
+    outfile = feature_file.with_suffix('').with_suffix(".base.npy" if compact else ".feature.npy")
+    if outfile.exists() and dont_overwrite:
+        return False, None, None
+    if outfile.exists() and outfile.stat().st_mtime >= feature_file.stat().st_mtime:
+        return False, f"[gather] {outfile} is up to date. Skipping {feature_file}.", None
+    try:
+        features = _read_feature_text(feature_file)
+    except ValueError as error:
+        return False, None, f"[gather] Malformed feature file! {error} Skipping."
+    if compact:
+        np.save(outfile, compress_features(features))
+    else:
+        np.save(outfile, features)
+    return True, f"[gather] Saved the contents of {feature_file} to {outfile}.", None
+
 def gather(args):
     """Prepares neural network input into NumPy readable format.
+
+    The features are saved as an uncompressed .feature.npy, which predict
+    memory-maps, or with --compact as the base columns in .base.npy. The
+    sessions are listed by --threads threads and the files parsed by
+    --workers processes.
     args:
-        :session (Path) - ConDo session directory.
+        :session (Path) - ConDo session directories.
     returns:
-        :(bool) - whether there was any work to actually be done.
+        :(set) - the sessions in which there was any work to actually be done.
         :by side effect saves feature files
     """
-    ran = False
-    for feature_file in _locate_by_extension(args.session, '.feature.txt'):
-        outfile = feature_file.with_suffix('').with_suffix(".feature.npz")
-        if outfile.exists() and args.dont_overwrite: continue
-        with open(feature_file, 'r') as featuretxt:
-            features = list(map(lambda line: np.array(line.split()[1:], dtype=np.float32), featuretxt))
-            if args.verbose:
-                print(f"[gather] Saving the contents of {feature_file} to {outfile}.")
-            np.savez(outfile, feature=features)
-        ran = True
+    with _threads(args) as threads, _processes(args) as processes:
+        items = _session_files(threads, _sessions(args), '.feature.txt', args.threads)
+        gather_file = functools.partial(_gather_file, compact=args.compact, dont_overwrite=args.dont_overwrite)
+        return _report(_ordered(processes, gather_file, items, 2 * args.workers), args.verbose)
+
+# ====================== session fan-out ====================== #
+# Sessions are listed, and files read and written, by a pool of threads, since
+# on network filesystems the time goes into round-trips rather than CPU; text
+# parsing and result generation go to a pool of processes. Results come back
+# in submission order so progress is reported in order.
+
+class _InlineExecutor(concurrent.futures.Executor):
+    """Runs submitted calls at once in the calling thread, for --workers 1."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+        return future
+
+def _threads(args):
+    return concurrent.futures.ThreadPoolExecutor(max(args.threads, 1))
+
+def _processes(args):
+    if args.workers <= 1:
+        return _InlineExecutor()
+    # spawn rather than fork, as the thread pool is already running
+    return concurrent.futures.ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context('spawn'))
+
+def _ordered(executor, fn, items, window):
+    """Yields (item, fn(item)) for every item, computed by `executor` with at most `window` calls
+    in flight, in the order of `items`."""
+    pending = collections.deque()
+    for item in items:
+        pending.append((item, executor.submit(fn, item)))
+        if len(pending) >= window:
+            item, future = pending.popleft()
+            yield item, future.result()
+    while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
+
+def _list_session(session, suffix):
+    return [(session, path) for path in sorted(_locate_by_extension(session, suffix))]
+
+def _session_files(threads, sessions, suffix, window):
+    """(session, file) pairs of every session/*.suffix, the sessions listed concurrently."""
+    listing = functools.partial(_list_session, suffix=suffix)
+    return itertools.chain.from_iterable(files for _, files in _ordered(threads, listing, sessions, window))
+
+def _report(results, verbose):
+    """Reports the ((session, file), (ran, message, warning)) results of _ordered in order.
+    returns:
+        :(set) - the sessions in which a result ran
+    """
+    ran = set()
+    for (session, _), (result_ran, message, warning) in results:
+        if warning:
+            warnings.warn(warning, UserWarning, stacklevel=1)
+        if message and verbose:
+            print(message)
+        if result_ran:
+            ran.add(session)
     return ran
 
+def _sessions(args):
+    """Session directories of a command: the positional sessions (glob patterns are expanded),
+    the lines of --session-list and the subdirectories of --parent."""
+    sessions = []
+    for session in args.session:
+        if glob.has_magic(str(session)) and not session.exists():
+            sessions += sorted(Path(path) for path in glob.glob(str(session)) if Path(path).is_dir())
+        else:
+            sessions.append(Path(session))
+    if getattr(args, 'session_list', None):
+        with open(args.session_list, 'r') as listing:
+            sessions += [Path(line.strip()) for line in listing if line.strip()]
+    if getattr(args, 'parent', None):
+        sessions += sorted(path for path in Path(args.parent).iterdir() if path.is_dir())
+    return sessions
+
+def _predict_batch(model, batch, batch_size, weights=None):
+    """Runs the model once over the stacked rows of a batch of targets.
+    args:
+        :model - a model with `predict(features, batch_size)`, or an ensemble with `predict_members`
+        :batch (list) - (feature_file, predfile, features, screen) tuples; with a cascade `screen` is
+                        (selected, estimate), the rows that go through the model and the screen's summed
+                        scores, which stand in for the rest. Otherwise it is None.
+        :weights (list) - the weight files of an ensemble, saved with its predictions
+    yields:
+        :(predfile, arrays) - each target's prediction file and its contents
+    """
+    rows = [features if screen is None else features[screen[0]] for _, _, features, screen in batch]
+    members = _predict_members(model, np.concatenate(rows), batch_size)
+    offsets = np.cumsum([len(target_rows) for target_rows in rows])[:-1]
+    for (_, predfile, _, screen), target_members in zip(batch, np.split(members, offsets, axis=1)):
+        extra = dict()
+        if screen is not None:
+            selected, estimate = screen
+            screened = np.repeat((estimate / 4).astype(np.float32)[None, :, None], 4, axis=2)
+            screened = np.repeat(screened, len(target_members), axis=0)
+            screened[:, selected] = target_members
+            target_members, extra['full_network'] = screened, selected
+        if len(target_members) == 1:
+            yield predfile, dict(predictions=target_members[0], **extra)
+        else:
+            # predictions holds the ensemble mean, so generate-result thresholds on it
+            yield predfile, dict(predictions=target_members.mean(axis=0), members=target_members,
+                                 weight_files=np.array([str(weight) for weight in weights or []]), **extra)
+
+def _load_target(item, dont_overwrite=False):
+    """Loads one target's features for predict; runs in an I/O thread.
+    returns:
+        :(session, feature_file, predfile, features) - features is None when the target is skipped
+    """
+    session, feature_file = item
+    predfile = feature_file.with_suffix('').with_suffix(".prediction.npz")
+    if predfile.exists() and dont_overwrite:
+        return session, feature_file, predfile, None
+    try:
+        features = _load_features(feature_file)
+    except KeyError:
+        warnings.warn("[predict] Malformed feature file! Skipping.", UserWarning, stacklevel=1)
+        return session, feature_file, predfile, None
+    return session, feature_file, predfile, np.asarray(features)
+
+def _save_prediction(predfile, arrays):
+    np.savez(predfile, **arrays)
 
 def predict(args):
     """Makes prediction(s).
+
+    The feature rows of all targets in all sessions are stacked into batches of
+    at least --batch-size rows, so the model runs once per batch rather than
+    once per target. Sessions are listed, features read and predictions
+    written by --threads threads while the model runs.
+
+    With --screen, the screening model (see distill_screen.py) scores every
+    residue first and only those that may beat the (lowest) --conf-cut, and
+    their neighbours, go through the full network. The others keep the screen's
+    estimate, which is below the cutoff; `full_network` in the .prediction.npz
+    marks the rows that went through the full network. A residue the screen
+    misses is not a boundary candidate, so the calls match the full network
+    only as far as the held-out recall distill_screen.py reports.
     args:
         :args - the command line arguments.
     returns:
-        :(bool) - whether the routine ran
+        :(set) - the sessions in which the routine ran
         :by side effect makes predictions and writes them to an npz feature file.
     """
     
-    model = _create_model(str(args.weights))
-    ran   = False
-    for feature_file in _locate_by_extension(args.session, '.feature.npz'):
-        predfile = feature_file.with_suffix('').with_suffix(".prediction.npz")
-        if predfile.exists() and args.dont_overwrite: continue
-        try:
-            pred = model.predict(np.load(feature_file)['feature']) 
-            np.savez(predfile, predictions=pred)
+    model = _model(args)
+    batch_size = getattr(args, 'batch_size', DEFAULT_BATCH_SIZE)
+    screen = None
+    if getattr(args, 'screen', None):
+        from inference import ScreenModel
+        screen = ScreenModel.load(args.screen)
+    ran   = set()
+    saved = collections.deque()
+
+    def flush(batch, wait=False):
+        for predfile, arrays in _predict_batch(model, batch, batch_size, args.weights) if batch else ():
+            saved.append((threads.submit(_save_prediction, predfile, arrays), predfile))
+        # report the saved predictions in order
+        while saved and (wait or saved[0][0].done()):
+            future, predfile = saved.popleft()
+            future.result()
             if args.verbose:
-                print(f"[predict] Saving predictions from {feature_file} to {predfile}.")
-        except KeyError:
-            warnings.warn("[predict] Malformed feature file! Skipping.", UserWarning, stacklevel=1)
-            continue 
-        ran = True
+                print(f"[predict] Saved predictions to {predfile}.")
+
+    with _threads(args) as threads:
+        listing = ((session, feature_file) for session in _sessions(args)
+                   for feature_file in _locate_features(session))
+        load = functools.partial(_load_target, dont_overwrite=args.dont_overwrite)
+        batch, rows = [], 0
+        for _, (session, feature_file, predfile, features) in _ordered(threads, load, listing, 2 * args.threads):
+            if features is None: continue
+            if screen is None:
+                batch.append((feature_file, predfile, features, None))
+                rows += len(features)
+            else:
+                estimate = screen.predict(features)
+                selected = screen.select(features, min(args.cutoff), scores=estimate)
+                batch.append((feature_file, predfile, features, (selected, estimate)))
+                rows += selected.sum()
+                if args.verbose:
+                    print(f"[predict] {feature_file}: {selected.sum()} of {len(features)} residues "
+                          f"pass the screen at {min(args.cutoff)}.")
+            if rows >= batch_size:
+                flush(batch)
+                batch, rows = [], 0
+            ran.add(session)
+        flush(batch, wait=True)
     return ran
 
 
+def _cutoffs(text):
+    """Cutoffs of --conf-cut: a number, a comma separated list, or an inclusive start:stop:step range."""
+    cutoffs = []
+    for item in text.split(','):
+        if ':' in item:
+            start, stop, step = map(float, item.split(':'))
+            # argparse turns a ValueError into a usage error; an empty or endless range is one
+            if step == 0 or (stop - start) / step < 0:
+                raise ValueError(f"the range {item} does not step from {start:g} to {stop:g}")
+            count = int(round((stop - start) / step)) + 1
+            cutoffs += [round(start + i * step, 10) for i in range(count)]
+        else:
+            cutoffs.append(float(item))
+    return cutoffs
+
+def _result_target(item, cutoffs, dont_overwrite=False):
+    """Interprets one target's predictions; runs in a worker process.
+    args:
+        :item (tuple) - (session, predfile)
+    returns:
+        :(ran, message, warning) - with one cutoff the message is the display; with several it is the
+         target's rows of the session's sweep table
+    """
+    session, predfile = item
+    resultfile  = predfile.with_suffix('').with_suffix(".ConDo.tsv")
+    domainfile  = predfile.with_suffix('').with_suffix(".domains.tsv")
+    displayfile = predfile.with_suffix('').with_suffix(".ConDo.txt")
+
+    if len(cutoffs) == 1 and resultfile.exists() and dont_overwrite:
+        return False, None, None
+
+    try:
+        with np.load(predfile) as prediction:  # this should definitely exist, it is the output of a glob.
+            pred_boundary = prediction['predictions']  # the ensemble mean for several weight files
+            nmodels = len(prediction['members']) if 'members' in prediction else 1
+            full_network = prediction['full_network'] if 'full_network' in prediction else None
+        fasta = (predfile.parent / predfile.stem).with_suffix('.fasta')
+        sequence = _read_sequence(fasta)
+        N = len(sequence)
+    except KeyError:
+        return False, None, "[generate-result] Malformed prediction file! Skipping."
+    except FileNotFoundError:
+        return False, None, f"[generate-result] Cannot find {predfile.with_suffix('.fasta')}. Skipping."
+
+    scores = boundary_scores(pred_boundary)
+
+    if len(cutoffs) > 1:
+        target = predfile.with_suffix('').stem
+        sweep = []
+        for cutoff, (lbounds, rbounds, _) in boundary_sweep(scores, cutoffs, N).items():
+            domains = zip([0, *rbounds], [*lbounds, N])
+            sweep.append(f"{target}\t{cutoff:g}\t{len(lbounds) + 1}\t"
+                         f"{','.join(f'{start}-{end}' for start, end in domains)}\n")
+        return True, "".join(sweep), None
+
+    # determine boundaries
+    lbounds, rbounds, lbound_scores = boundary_candidates(scores, cutoffs[0], N)
+    valid = valid_boundaries(lbounds, lbound_scores, cutoffs[0], N)
+    multidomain = bool(valid.any())
+    domains = list(zip([0, *rbounds[valid]], [*lbounds[valid], N]))
+    # a residue is flagged when its 1-based position equals a called left bound or its score,
+    # as the flags have always been set
+    position = np.arange(1, N + 1)
+    on_boundary = np.isin(position, lbounds[valid]) | np.isin(position, lbound_scores[valid])
+
+    # ====================== display ====================== #
+    display = ["================== ConDo Results ==================",
+               f"Session: {session}",
+               f"Sequence:\n{textwrap.fill(sequence, 60)}",
+               f"Length: {N}"]
+    if nmodels > 1:
+        display.append(f"Scores: mean of {nmodels} models")
+    if full_network is not None:
+        display.append(f"Screened: {full_network.sum()} of {N} residues through the full network")
+    display.append("==================   Domains  =====================")
+    display += [f"{i}) {domain}" for i, domain in enumerate(domains, 1)]
+    display.append(f"\tSample is multidomain: {multidomain}")
+    display = "\n".join(display)
+    print_files(display, files=[displayfile])
+
+    with open(domainfile, 'w') as domainhandle:
+        domainhandle.write("domain_number\tstart\tend\n" +
+                           "".join(f"{i}\t{start}\t{end}\n" for i, (start, end) in enumerate(domains, 1)))
+
+    with open(resultfile, 'w') as results:
+        rows = zip(map(str, position), sequence, map(str, scores), on_boundary.astype(int).astype(str))
+        results.write("position\tamino\tscore\ton_domain_boundary\n" +
+                      "".join(f"{row}\n" for row in map("\t".join, rows)))
+    return True, display, None
+
 def generate_result(args):
     """Interpret results.
 
+    The targets of all sessions are interpreted by --workers processes.
+    With several cutoffs, the domain partitions at all of them are computed
+    from one sort of the scores (see boundary_sweep) and written, for every
+    target of a session, to one session/ConDo.sweep.tsv keyed by cutoff
+    instead of the per-target files.
     args:
         :args - the commandline arguments
     returns:
-        :(bool) - whether there was any work to actually be done.
+        :(set) - the sessions in which there was any work to actually be done.
         :by side effect writes a TSV file
     """
 
-    ran = False
-    fw = 40
-    for predfile in _locate_by_extension(args.session, '.prediction.npz'):
-        resultfile  = predfile.with_suffix('').with_suffix(".ConDo.tsv")
-        domainfile  = predfile.with_suffix('').with_suffix(".domains.tsv")
-        displayfile = predfile.with_suffix('').with_suffix(".ConDo.txt")
-
-        if resultfile.exists() and args.dont_overwrite: continue
-
-        try:
-            pred_boundary = np.load(predfile)['predictions']  # this should definitely exist, it is the output of a glob.
-            fasta = (predfile.parent / predfile.stem).with_suffix('.fasta')
-            sequence = _read_sequence(fasta)
-            N = len(sequence)
-        except KeyError:
-            warnings.warn("[generate-result] Malformed prediction file! Skipping.", UserWarning, stacklevel=1)
-            continue
-        except FileNotFoundError:
-            warnings.warn(f"[generate-result] Cannot find {predfile.with_suffix('.fasta')}. Skipping.", UserWarning, stacklevel=1)
-            continue
-        
-        # each element of pred_boundary is a 4 tuple, the sum of which yields the score
-        scores = np.array(list(map(sum, pred_boundary)))
-        #scores     = np.array(scores)
-        arg_scores = np.argsort(-scores)
-
-        # determine boundaries
-        above_thresh = lambda x: x > args.cutoff
-        valid_bnd = lambda bndidx, score: above_thresh(score) and fw < bndidx < N - fw -1
-
-        lbounds, rbounds, lbound_scores = [], [], []
-        # pull all residues above domain boundary cutoff 
-        for i, score in itertools.takewhile(lambda tup: above_thresh(tup[0]), map(lambda i: (i, scores[i]),
-                                                                         arg_scores)):
-            if i < 1 or i > N - 2: continue
-            # inside of a predefined domain
-            if not any(abs(bound - (i + 1)) < fw for bound in lbounds):
-                # shift left if appropriate
-                lb = i if scores[i + 1] < scores[i - 1] else i + 1
-                rb = lb + 1
-                lbounds.append(lb)
-                rbounds.append(rb)
-
-                lbound_scores.append(scores[lb])
-        
-        # ====================== display ====================== #
-        multidomain = False
-        bounds = []
-        
-        old = 0
-        domains = []
-        for lb, rb, sc in zip(lbounds, rbounds, lbound_scores):
-            valid = valid_bnd(lb, sc)
-            multidomain |= valid
-            if valid: 
-                bounds = itertools.chain([lb, sc], bounds)
-                domains.append((old, lb))
-                old = rb
-    
-        domains.append((old, N))
-        displays = [displayfile, sys.stdout] if args.verbose else [displayfile]
-
-        print_files("================== ConDo Results ==================", files=displays)
-        print_files(f"Session: {args.session}", files=displays)
-        print_files(f"Sequence:\n{textwrap.fill(sequence, 60)}", files=displays)
-        print_files(f"Length: {N}", files=displays)
-        print_files("==================   Domains  =====================", files=displays)
-
-        with open(domainfile, 'w') as domainhandle:
-            print("domain_number", "start", "end", file=domainhandle, sep='\t')
-            for i, domain in enumerate(domains,1):
-                print_files(f"{i}) {domain}", files=displays)
-                print(i, *domain, sep='\t', file=domainhandle)
-
-        print_files(f"\tSample is multidomain: {multidomain}", files=displays)
-        bounds = list(bounds) 
-        with open(resultfile, 'w') as results:
-            print("position", "amino", "score", "on_domain_boundary", file=results, sep='\t')
-            for idx, (amino, score) in enumerate(zip(sequence, scores), 1):
-                print(idx, amino, score, int(idx in bounds), file=results, sep='\t')
-        ran = True
+    cutoffs = args.cutoff
+    sessions = _sessions(args)
+    if len(cutoffs) > 1 and args.dont_overwrite:
+        sessions = [session for session in sessions if not (session / "ConDo.sweep.tsv").exists()]
+
+    ran = set()
+    with _threads(args) as threads, _processes(args) as processes:
+        items = _session_files(threads, sessions, '.prediction.npz', args.threads)
+        result_target = functools.partial(_result_target, cutoffs=cutoffs, dont_overwrite=args.dont_overwrite)
+        results = _ordered(processes, result_target, items, 2 * args.workers)
+        if len(cutoffs) == 1:
+            return _report(results, args.verbose)
+
+        # one sweep table per session, written once its last target is in
+        sweep = collections.defaultdict(list)
+        for (session, _), (target_ran, rows, warning) in results:
+            if warning:
+                warnings.warn(warning, UserWarning, stacklevel=1)
+            if target_ran:
+                sweep[session].append(rows)
+                ran.add(session)
+        written = []
+        for session, rows in sweep.items():
+            sweepfile = session / "ConDo.sweep.tsv"
+            text = "target\tcutoff\tdomains\tpartition\n" + "".join(rows)
+            written.append((threads.submit(_write_text, sweepfile, text), sweepfile))
+        for future, sweepfile in written:
+            future.result()
+            if args.verbose:
+                print(f"[generate-result] Domain partitions at {len(cutoffs)} cutoffs written to {sweepfile}.")
     return ran
 
+def _write_text(path, text):
+    with open(path, 'w') as handle:
+        handle.write(text)
+
 def print_files(*args, files=None, modes='a', **kwargs):
     kwargs['file'] = None
     assert isinstance(modes, (str, list))
@@ -236,24 +752,27 @@ def print_files(*args, files=None, modes='a', **kwargs):
     for filename, mode in zip(files or [], modes):
     
         if isinstance(filename, (str, Path)):
-            f = open(filename, mode)
+            with open(filename, mode) as f:
+                print(*args, file=f, **kwargs)
         else:
-            f = filename
-        print(*args, file=f, **kwargs) 
+            print(*args, file=filename, **kwargs)
 
 
 
 routines = [gather, predict, generate_result]
 
 def curry(args):
-    """Curries the script, excecuting the next step in the pipeline.
+    """Curries the script, excecuting the next step in the pipeline of every session.
     """ 
 
-    # Just iterate through the reversed set of routines until one 'runs'.
+    # Just iterate through the reversed set of routines until one 'runs' in each session.
+    remaining = _sessions(args)
     for routine in reversed(routines):
-        if routine(args): sys.exit(0)
+        done = routine(argparse.Namespace(**dict(vars(args), session=remaining, session_list=None, parent=None)))
+        remaining = [session for session in remaining if session not in done]
+        if not remaining: sys.exit(0)
     if args.verbose:
-        print("[curry] Nothing to be done!")
+        print(f"[curry] Nothing to be done{' in ' + ', '.join(map(str, remaining)) if len(remaining) > 1 else ''}!")
 
 def run(args):
     """Runs the script entirely, executing every step."""
@@ -265,7 +784,8 @@ subcommands = {gather: "Gather features into Python readable format.",
                predict: "Make predictions.",
                generate_result: "Interpret results.", 
                curry: "Perform the next step in the gather, predict, result pipeline.",
-               run: "Run the entire pipeline."}
+               run: "Run the entire pipeline.",
+               serve: "Serve predictions to predict, curry and run on a Unix socket."}
 
 
 def arguments():
@@ -279,24 +799,67 @@ def arguments():
         subparser.set_defaults(func=subcommand)
         subparsers[name] = subparser
 
-        subparser.add_argument("session", type=Path, help="ConDo session directory.")
+        if name == 'serve':
+            subparser.add_argument("--max-wait", dest="max_wait", type=float, default=20.0,
+                                   help="Milliseconds to wait for more requests to batch together. (default = 20)")
+        else:
+            subparser.add_argument("session", type=Path, nargs='*',
+                                   help="ConDo session directories; quoted glob patterns are expanded.")
+            subparser.add_argument("--session-list", dest="session_list", type=Path,
+                                   help="File with one more session directory per line.")
+            subparser.add_argument("--parent", dest="parent", type=Path,
+                                   help="Directory whose subdirectories are all sessions.")
+            subparser.add_argument("-j", "--workers", dest="workers", type=int, default=DEFAULT_WORKERS,
+                                   help=f"Processes for parsing and result generation. (default = {DEFAULT_WORKERS})")
+            subparser.add_argument("--threads", dest="threads", type=int, default=DEFAULT_THREADS,
+                                   help=f"Threads for session listing and file reads and writes. "
+                                        f"(default = {DEFAULT_THREADS})")
 
     
-    for subkey in ['predict', 'curry', 'run']:
-        subparsers[subkey].add_argument("-w", "--weight-file", type=Path, dest='weights',
-                                        help=f"Predictor weights. (default = {DEFAULT_WEIGHT_FILE or 'No default found!'})",
-                                        default=DEFAULT_WEIGHT_FILE, required=DEFAULT_WEIGHT_FILE is None)
+    for subkey in ['predict', 'curry', 'run', 'serve']:
+        subparsers[subkey].add_argument("--socket", dest='socket', default=DEFAULT_SOCKET,
+                                        help=f"Prediction server socket; predict falls back to in-process prediction "
+                                             f"when no server runs there, '' never connects. (default = {DEFAULT_SOCKET})")
+        subparsers[subkey].add_argument("-w", "--weight-file", dest='weights', action='append',
+                                        help=f"Predictor weights; several files (-w a.h5 -w b.h5, or a.h5{os.pathsep}b.h5) "
+                                             f"are evaluated together as an ensemble and averaged. "
+                                             f"(default = {DEFAULT_WEIGHT_FILE or 'No default found!'})",
+                                        default=None, required=DEFAULT_WEIGHT_FILE is None)
+        subparsers[subkey].add_argument("--backend", dest='backend', choices=BACKENDS, default=DEFAULT_BACKEND,
+                                        help=f"Inference backend: numpy (no TensorFlow) or keras. (default = {DEFAULT_BACKEND})")
+        subparsers[subkey].add_argument("--batch-size", dest='batch_size', type=int, default=DEFAULT_BATCH_SIZE,
+                                        help=f"Feature rows per model call, across targets. (default = {DEFAULT_BATCH_SIZE})")
+        subparsers[subkey].add_argument("--precision", dest='precision', choices=PRECISIONS, default=None,
+                                        help="Weight precision of the numpy backend; see quantize_weights.py for the "
+                                             "deviation it costs. (default = float32, or that of a .npz weight file)")
+
+    for subkey in ['gather', 'curry', 'run']:
+        subparsers[subkey].add_argument("--compact", dest="compact", default=False, action='store_true',
+                                        help="Save only the per-residue base columns (.base.npy); "
+                                             "predict rebuilds the full feature rows. (default = False)")
+
+    for subkey in ['predict', 'generate-result', 'curry', 'run']:
+        subparsers[subkey].add_argument('-c', '--conf-cut', dest='cutoff', type=_cutoffs, default="1.4",
+                                        help="Confidence cutoff; several (1.0,1.4 or a range 1.0:2.0:0.1) give one "
+                                             "domain table per session keyed by cutoff. (default = 1.4)")
 
-    for subkey in ['generate-result', 'curry', 'run']:
-        subparsers[subkey].add_argument('-c', '--conf-cut', dest='cutoff', type=float, default=1.4,
-                                        help=f"Confidence cutoff. (default = 1.4)")
+    for subkey in ['predict', 'curry', 'run']:
+        subparsers[subkey].add_argument("--screen", dest='screen', type=Path, default=None,
+                                        help="Screening model from distill_screen.py: only residues it puts above "
+                                             "--conf-cut - margin go through the full network. (default = off)")
 
     parser.add_argument("-v", "--verbose", dest="verbose",
                         help="Verbose output.", action='store_true', default=False)
     parser.add_argument("--no-overwrite", dest="dont_overwrite",
                         default=False, action='store_true',
                         help="Don't overwrite files. (default = False)")
-    return parser.parse_args()
+    args = parser.parse_args()
+    if hasattr(args, 'session') and not (args.session or args.session_list or args.parent):
+        parser.error("no session directories given")
+    if hasattr(args, 'weights'):
+        args.weights = [Path(weight) for value in (args.weights or [DEFAULT_WEIGHT_FILE])
+                        for weight in value.split(os.pathsep) if weight]
+    return args
 
 if __name__ == '__main__':
     args = arguments()
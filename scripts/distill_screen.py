@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Distills the screening model of the prediction cascade from ConDo weights.
+
+Fits a ridge regression of the full network's summed boundary score on the
+249 per-residue base columns of the features (the centre of each window).
+`condo-helper-suite predict --screen screen.npz` then runs the full network
+only on residues the screen puts above `--conf-cut - margin` and on their
+neighbours.
+
+The margin is calibrated on held-out targets: a screen is fitted without each
+target in turn, and the margin is the --recall quantile of its shortfalls
+(full network score - estimate) on the held-out residues the full network puts
+above --conf-cut, plus --slack. A margin from the shortfalls on the fitted
+residues themselves says nothing about unseen targets.
+
+The report gives, per target, the share of residues that still go through the
+full network, the recall of the residues the full network scores above
+--conf-cut, and whether the boundary calls are unchanged. Each target is
+scored by a screen fitted and calibrated without it (leave-one-out), which is
+the honest estimate for unseen targets, and then by the screen fitted on all
+of them. The screen is not written (unless --force) when that held-out
+recall is below 1, when no held-out residue scores above --conf-cut (the
+recall and margin are then untested), or when it screens out almost no
+residues, since the cascade would then change calls, be unchecked or save
+nothing.
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from inference import DenseModel, DenseEnsemble, ScreenModel
+from features import BASE_COLUMNS, load_session_features
+from boundaries import call_boundaries
+
+
+EXAMPLES = Path(__file__).resolve().parent.parent / 'examples'
+
+def fit_screen(features, scores, columns=BASE_COLUMNS, ridge=1.0):
+    """Ridge fit of `scores` on the `columns` of the stacked `features` rows, with margin 0."""
+    x = features[:, columns].astype(np.float64)
+    mean, std = x.mean(axis=0), x.std(axis=0)
+    std[std == 0] = 1.0
+    z = (x - mean) / std
+    coef = np.linalg.solve(z.T @ z + ridge * np.eye(z.shape[1]), z.T @ (scores - scores.mean()))
+    coef /= std
+    return ScreenModel(columns, coef, scores.mean() - mean @ coef, 0.0)
+
+def shortfalls(screen, features, scores, cutoff):
+    """score - estimate of the rows the full network puts above cutoff. The screen keeps such a
+    row whenever its shortfall is at most the margin."""
+    above = scores > cutoff
+    return scores[above] - screen.predict(features[above])
+
+def calibrate_margin(features, scores, names, cutoff, recall=1.0, ridge=1.0, slack=0.05):
+    """Margin keeping `recall` of the held-out rows above cutoff, each target held out of the fit in
+    turn, plus slack. With a single target the shortfalls are in-sample.
+    returns:
+        :margin, held_out, positives (float, bool, int) - whether the shortfalls were held out and how
+         many rows above cutoff they came from; with none the margin is only the slack, not calibrated
+    """
+    held_out = len(names) > 1
+    short = []
+    for name in names:
+        others = [other for other in names if other != name] if held_out else names
+        screen = fit_screen(np.concatenate([features[other] for other in others]),
+                            np.concatenate([scores[other] for other in others]), ridge=ridge)
+        short.append(shortfalls(screen, features[name], scores[name], cutoff))
+    short = np.concatenate(short)
+    quantile = float(np.quantile(short, recall, method='higher')) if len(short) else 0.0
+    return max(quantile, 0.0) + slack, held_out, len(short)
+
+def distill(features, scores, names, cutoff, recall=1.0, ridge=1.0, slack=0.05):
+    """Screen fitted on the `names` targets with its margin calibrated on them.
+    returns:
+        :screen, positives - and the number of held-out rows above cutoff the margin was calibrated on
+    """
+    screen = fit_screen(np.concatenate([features[name] for name in names]),
+                        np.concatenate([scores[name] for name in names]), ridge=ridge)
+    screen.margin, _, positives = calibrate_margin(features, scores, names, cutoff, recall=recall, ridge=ridge, slack=slack)
+    return screen, positives
+
+def evaluate(screen, features, scores, cutoff):
+    """(share of rows through the full network, recall of rows above cutoff, calls unchanged);
+    the recall is nan when no row is above cutoff."""
+    estimate = screen.predict(features)
+    selected = screen.select(features, cutoff, scores=estimate)
+    above = scores > cutoff
+    recall = (selected & above).sum() / above.sum() if above.any() else np.nan
+    cascade = np.where(selected, scores, estimate)
+    same = call_boundaries(cascade, cutoff) == call_boundaries(scores, cutoff)
+    return selected.mean(), recall, same
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("weights", type=Path, nargs='+', help="Keras weight file(s), averaged as in predict.")
+    parser.add_argument("--sessions", type=Path, nargs='+',
+                        default=sorted(path for path in EXAMPLES.iterdir() if path.is_dir()),
+                        help="Session directories to fit and report on. (default = the examples)")
+    parser.add_argument('-c', '--conf-cut', dest='cutoff', type=float, default=1.4,
+                        help="Confidence cutoff of the report. (default = 1.4)")
+    parser.add_argument("--ridge", type=float, default=1.0, help="Ridge penalty. (default = 1.0)")
+    parser.add_argument("--recall", type=float, default=1.0,
+                        help="Share of the held-out residues above --conf-cut the margin must keep. (default = 1.0)")
+    parser.add_argument("--slack", type=float, default=0.05,
+                        help="Added to the calibrated shortfall to make the margin. (default = 0.05)")
+    parser.add_argument("--min-screened", dest='min_screened', type=float, default=0.05,
+                        help="Share of residues the screen must keep from the full network. (default = 0.05)")
+    parser.add_argument("--force", action='store_true', default=False,
+                        help="Write the screen even when it fails the held-out checks. (default = False)")
+    parser.add_argument("-o", "--out", type=Path, default=None,
+                        help="Screening model file. (default = screen.npz next to the first weight file)")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = arguments()
+    out = args.out or args.weights[0].parent / 'screen.npz'
+
+    features = {}
+    for session in args.sessions:
+        features.update(load_session_features(session))
+    if not features:
+        sys.exit("[distill] No features found in the sessions.")
+
+    model = DenseModel.load(args.weights[0]) if len(args.weights) == 1 else DenseEnsemble.load(args.weights)
+    scores = {name: model.predict(x).sum(axis=1, dtype=np.float64) for name, x in features.items()}
+    names = list(features)
+
+    options = dict(recall=args.recall, ridge=args.ridge, slack=args.slack)
+
+    def report(label, screen, name):
+        share, recall, same = evaluate(screen, features[name], scores[name], args.cutoff)
+        print(f"{label:13s} {name:12s} full net on {share:6.1%} of {len(scores[name])} residues, "
+              f"recall {'  n/a' if np.isnan(recall) else f'{recall:.3f}'}, calls {'unchanged' if same else 'CHANGED'} (margin {screen.margin:.3f})")
+        return share, recall, same
+
+    problems = []
+    if len(names) > 1:
+        held_out = []
+        for name in names:
+            screen, _ = distill(features, scores, [other for other in names if other != name], args.cutoff, **options)
+            held_out.append(report("leave-one-out", screen, name))
+        recalls = [recall for _, recall, _ in held_out if not np.isnan(recall)]
+        if not recalls:
+            problems.append(f"no held-out residue scores above {args.cutoff}: the recall is untested")
+        elif min(recalls) < 1.0 or not all(same for *_, same in held_out):
+            problems.append("held-out recall is below 1 or held-out calls change")
+    else:
+        problems.append("one target: the margin and recall could not be checked on a held-out target")
+
+    screen, positives = distill(features, scores, names, args.cutoff, **options)
+    if not positives:
+        problems.append(f"no residue scores above {args.cutoff}: the margin is the slack, not calibrated")
+    fitted = [report("fitted", screen, name) for name in names]
+    screened_out = 1.0 - sum(share * len(scores[name]) for (share, _, _), name in zip(fitted, names)) \
+        / sum(len(scores[name]) for name in names)
+    if screened_out < args.min_screened:
+        problems.append(f"only {screened_out:.1%} of the residues skip the full network")
+
+    for problem in problems:
+        print(f"[distill] WARNING: {problem}.", file=sys.stderr)
+    if problems and not args.force:
+        sys.exit(f"[distill] Not writing {out}: the cascade is unchecked, would change calls or would save nothing "
+                 f"(--force to write).")
+    screen.save_npz(out)
+    print(f"[distill] margin {screen.margin:.3f}, {len(screen.columns)} columns -> {out}")
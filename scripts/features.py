@@ -0,0 +1,599 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+NumPy port of bin/feature (src/feature.c).
+
+`compute_features(target)` reads the same inputs as `bin/feature target`
+(target.fasta, .msa, .ck2, .ss2, .a22, .a3 and .ccmpred or .ccmpred.bin) and
+returns the Nres x 1129 float32 feature matrix in the column order of
+target.feature.txt (without the index column). Values are rounded to 4
+decimals like the text output, and agree with bin/feature to within one unit
+in the last printed digit (1e-4); most differ by nothing at all.
+
+The work is split in two steps: `base_arrays` computes the per-residue
+quantities (profile, ss2, sa2, community profile, PAS windows, gap signals,
+depth scalars) and `expand_features` / `expand_features2` lay them out as
+the windowed feature rows of .feature.txt / .feature2.txt.
+"""
+
+import re
+import sys
+import itertools
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+
+NFEATURE   = 1129
+WIN_PAS    = 50    # PASaveN/C half window, exist flags
+WIN_PAS2   = 100   # PASaveN2/C2 interpolation points
+WIN_CCM    = 50    # community half window
+WIN_CCM2   = 100   # community interpolation points
+WIN_PROF   = 10
+WIN_SS     = 20
+WIN_SA     = 20
+CCM_BAND   = 12
+CCM_HEADER = 64
+PSEUDO     = 10.0  # pseudocount weight of -profile msa
+SEQCODE1   = "-ARNDCQEGHILKMFPSTWYVX"  # bin/feature's residue indices
+SEQCODE_CK2 = "ACDEFGHIKLMNPQRSTVWY"   # column order of .ck2
+NTYPE      = 21
+_seqindex  = np.full(256, NTYPE, dtype=np.uint8)
+_seqindex[[ord(code) for code in SEQCODE1[:NTYPE]]] = np.arange(NTYPE)
+
+_atoi = re.compile(rb'\s*([+-]?\d+)')
+
+def _int(token):
+    """C atoi: leading integer of `token`, 0 if there is none."""
+    match = _atoi.match(token)
+    return int(match.group(1)) if match else 0
+
+def _data_lines(filename):
+    """Lines of a psipred/sann output file that bin/feature reads: longer than 10 characters and not comments."""
+    with open(filename, 'r') as handle:
+        return [line.split() for line in handle if len(line) > 10 and not line.startswith('#')]
+
+def read_sequence(target):
+    with open(f"{target}.fasta", 'r') as fasta:
+        return ''.join(line.strip() for line in fasta if not line.startswith('>'))
+
+def read_ss2(target, Nres):
+    """(Nres, 3) psipred probabilities from target.ss2."""
+    ss2 = np.zeros((Nres, 3))
+    rows = [list(map(float, fields[3:6])) for fields in _data_lines(f"{target}.ss2")][:Nres]
+    ss2[:len(rows)] = rows
+    return ss2
+
+def read_sa2(target, Nres):
+    """(Nres, 4) solvent accessibility from target.a22 and target.a3: rsa, the two a22 columns and con/20, capped at 1."""
+    sa2 = np.zeros((Nres, 4))
+    a22 = np.array([list(map(float, fields[3:6])) for fields in _data_lines(f"{target}.a22")][:Nres]).reshape(-1, 3)
+    a3  = np.array([float(fields[6]) for fields in _data_lines(f"{target}.a3")][:Nres])
+    sa2[:len(a22), 1:3] = a22[:, :2]
+    sa2[:len(a22), 3]   = np.minimum(a22[:, 2] / 20.0, 1.0)
+    sa2[:len(a3), 0]    = np.minimum(a3, 1.0)
+    return sa2
+
+def read_profile(target, Nres):
+    """(Nres, 20) profile from target.ck2 (first two lines are the header)."""
+    profile = np.zeros((Nres, 20))
+    with open(f"{target}.ck2", 'r') as ck2:
+        rows = [list(map(float, line.split())) for line in list(ck2)[2:]][:Nres]
+    for k, row in enumerate(rows):
+        profile[k, :len(row)] = row[:20]
+    return profile
+
+def read_qij(filename):
+    """q(b|a) for seqcode1 indices a, b in 1..20 (row and column 0 unused) from the lower
+    triangle of the joint target frequencies in qij, as bin/feature -qij reads it."""
+    with open(filename, 'r') as handle:
+        values = np.array(handle.read().split()[:210], dtype=np.float64)
+    qij = np.zeros((NTYPE, NTYPE))
+    a, b = np.tril_indices(20)
+    qij[a + 1, b + 1] = values
+    qij[b + 1, a + 1] = values
+    # cumsum adds each row left to right, as bin/feature does
+    qij[1:, 1:] /= np.cumsum(qij[1:, 1:], axis=1)[:, -1:]
+    return qij
+
+def read_msa_rows(target, Nres):
+    """(Nmsa, Nres) seqcode1 indices of the .msa rows, NTYPE past the end of a short row (read_msa)."""
+    rows = []
+    with open(f"{target}.msa", 'rb') as msa:
+        for is_header, group in itertools.groupby(msa, key=lambda line: line.startswith(b'>')):
+            if is_header:
+                rows += [b''] * (sum(1 for _ in group) - 1)
+                rows.append(b'')
+            elif rows:
+                rows[-1] = b''.join(line.rstrip(b'\r\n') for line in group)
+    padded = b''.join(row[:Nres].ljust(Nres, b'X') for row in rows)
+    return _seqindex[np.frombuffer(padded, dtype=np.uint8)].reshape(len(rows), Nres)
+
+def msa_profile(target, Nres, qij, pseudo=PSEUDO, chunk=4096):
+    """(Nres, 20) profile of bin/feature -profile msa: Henikoff-weighted frequencies of the .msa
+    columns mixed with qij pseudocounts, in .ck2 column order and rounded as %6.4f.
+
+    The sums are taken in the order bin/feature takes them, so the two agree exactly.
+    """
+    rows = read_msa_rows(target, Nres)
+    column = np.arange(Nres)
+    count = np.zeros((Nres, NTYPE), dtype=np.int64)
+    for start in range(0, len(rows), chunk):
+        block = rows[start:start + chunk]
+        residue = (block > 0) & (block < NTYPE)
+        np.add.at(count, (np.broadcast_to(column, block.shape)[residue], block[residue]), 1)
+    ntype = (count[:, 1:] > 0).sum(axis=1)
+
+    wcount = np.zeros((Nres, NTYPE))
+    for start in range(0, len(rows), chunk):
+        block = rows[start:start + chunk]
+        residue = (block > 0) & (block < NTYPE)
+        with np.errstate(divide='ignore'):
+            inverse = np.where(residue, 1.0 / (ntype * count[column, np.minimum(block, NTYPE - 1)]), 0.0)
+        L = residue.sum(axis=1)
+        weight = np.divide(np.cumsum(inverse, axis=1)[:, -1], L, out=np.zeros(len(block)), where=L > 0)
+        np.add.at(wcount, (np.broadcast_to(column, block.shape)[residue], block[residue]),
+                  np.broadcast_to(weight[:, None], block.shape)[residue])
+
+    alpha = ntype[ntype > 0].sum() / (ntype > 0).sum() - 1.0 if (ntype > 0).any() else 0.0
+    total = np.cumsum(wcount[:, 1:], axis=1)[:, -1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f = wcount[:, 1:] / total[:, None]
+    g = np.cumsum(f[:, :, None] * qij[None, 1:, 1:], axis=1)[:, -1, :]
+    p = (alpha * f + pseudo * g) / (alpha + pseudo) if alpha + pseudo > 0 else f
+    query = _seqindex[np.frombuffer(read_sequence(target).encode()[:Nres], dtype=np.uint8)].astype(np.intp)
+    query[(query == 0) | (query >= NTYPE)] = 1
+    p = np.where((total > 0)[:, None], p, qij[query, 1:])
+
+    p = np.array(' '.join(map('{:6.4f}'.format, p.ravel())).split(), dtype=np.float64).reshape(Nres, 20)
+    profile = np.zeros((Nres, 20))
+    profile[:, [SEQCODE_CK2.index(code) for code in SEQCODE1[1:NTYPE]]] = p
+    return profile
+
+def read_msa_segments(target, Nres):
+    """Coverage of every .msa row from its /ini-fin,ini-fin header.
+
+    returns:
+        :segptr (int array, Nmsa+1) - row k owns segments segptr[k]:segptr[k+1]
+        :seg (int array, Nseg x 2) - merged 0-based [ini, fin] segments, clipped to the query
+        :pasinfo (bool array, Nmsa) - whether the row is a partial hit (used for PAS)
+    """
+    segptr, seg, pasinfo = [0], [], []
+    with open(f"{target}.msa", 'rb') as msa:
+        for line in msa:
+            if not line.startswith(b'>'):
+                continue
+            tokens = [token for token in re.split(rb'[/,]', line.rstrip(b'\r\n')) if token]
+            ini = fin = 0
+            row = []
+            for token in tokens[1:]:
+                ini = _int(token)
+                fin = _int(token.split(b'-', 1)[1]) if b'-' in token else 0
+                lo, hi = max(ini - 1, 0), min(fin - 1, Nres - 1)
+                if lo <= hi:
+                    row.append([lo, hi])
+            row.sort(key=lambda s: s[0])
+            merged = []
+            for lo, hi in row:
+                if merged and lo <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], hi)
+                else:
+                    merged.append([lo, hi])
+            seg.extend(merged)
+            segptr.append(len(seg))
+            pasinfo.append(ini > 20 or fin <= Nres - 20)
+    return (np.array(segptr, dtype=np.int64),
+            np.array(seg, dtype=np.int64).reshape(-1, 2),
+            np.array(pasinfo, dtype=bool))
+
+def read_ccmpred(target, Nres):
+    """Band-zeroed CCMpred couplings and their mean/stddev over j >= i+12.
+
+    Uses target.ccmpred.bin (written by bin/feature) when it was written for this Nres
+    from this target.ccmpred: the size and nanosecond mtime in its header are the text
+    file's (or there is no text file).
+    returns:
+        :ccmpred (float32 array, Nres x Nres), ave (float), stddev (float)
+    """
+    binfile, textfile = Path(f"{target}.ccmpred.bin"), Path(f"{target}.ccmpred")
+    if binfile.exists():
+        header = np.fromfile(binfile, dtype=np.uint8, count=CCM_HEADER)
+        nres, band = header[8:16].view(np.int32)
+        ave, stddev = header[16:32].view(np.float64)
+        size, sec, nsec = (int(value) for value in header[32:56].view(np.int64))
+        if textfile.exists():
+            text = textfile.stat()
+            fresh = (size, sec, nsec) == (text.st_size, *divmod(text.st_mtime_ns, 10 ** 9))
+        else:
+            fresh = True
+        if (fresh and header[:8].tobytes() == b'CONDOCCM' and nres == Nres
+                and binfile.stat().st_size == CCM_HEADER + 4 * Nres * Nres):
+            ccmpred = np.memmap(binfile, dtype=np.float32, mode='r', offset=CCM_HEADER, shape=(Nres, Nres))
+            return ccmpred, float(ave), float(stddev)
+
+    values = np.fromfile(textfile, dtype=np.float64, sep=' ') if textfile.exists() else np.zeros(0)
+    ccm = np.zeros(Nres * Nres)
+    ccm[:min(values.size, ccm.size)] = values[:ccm.size]
+    ccm = ccm.reshape(Nres, Nres)
+
+    edges = ccm[np.triu_indices(Nres, CCM_BAND)]
+    ave = edges.mean()
+    stddev = np.sqrt((edges ** 2).mean() - ave ** 2)
+
+    i = np.arange(Nres)
+    ccm[np.abs(i[:, None] - i[None, :]) < CCM_BAND] = 0.0
+    return ccm.astype(np.float32), ave, stddev
+
+def n_signal(segptr, seg, Nres, Nmsa):
+    """Gap signals around every residue (add_n_signal + get_n_signal).
+
+    returns:
+        :Nsite (Nres x 3), msig5 (Nres x 3), psig5 (Nres x 3)
+    """
+    Nsig = np.zeros((Nres, 3), dtype=np.int64)
+    ini, fin = seg[:, 0], seg[:, 1]
+    left  = ini[(ini >= 1) & (ini <= Nres - 2)]
+    right = fin[(fin >= 1) & (fin <= Nres - 2) & (fin != ini)]
+    Nsig[:, 1] = np.bincount(left, minlength=Nres)
+    Nsig[:, 2] = np.bincount(right, minlength=Nres)
+    Nsig[:, 0] = Nsig[:, 1] + Nsig[:, 2]
+
+    # sums and occupied sites over the +-5 window, clipped to the query
+    padded = np.zeros((Nres + 10, 3), dtype=np.int64)
+    padded[5:-5] = Nsig
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 11, axis=0)
+    Nsig5 = windows.sum(axis=2)
+    Nsite = (windows > 0).sum(axis=2)
+
+    i = np.arange(Nres)
+    nedge = np.maximum(5 - i, 0)
+    cedge = np.maximum(i - (Nres - 6), 0)
+    Nsite[:, 1] += nedge
+    Nsite[:, 2] += cedge
+    Nsite[:, 0] = Nsite[:, 1] + Nsite[:, 2]
+
+    ggap = max(20 * Nres // 100, 60)
+    maxsig5 = np.maximum(Nsig5[ggap:Nres - ggap].max(axis=0, initial=1), 1)
+    Nsig5 = np.minimum(Nsig5, maxsig5)
+
+    scale = np.array([2.0, 1.0, 1.0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        psig5 = Nsig5 / (float(Nmsa) * scale)
+        msig5 = Nsig5 / (maxsig5 * scale)
+    return Nsite, msig5, psig5
+
+def pas_count(segptr, seg, pasinfo, Nres):
+    """fc[i, j]: the number of partial-hit rows covering both i and j (add_PAS_count + sum_PAS_count)."""
+    nseg = np.diff(segptr)
+    row  = np.repeat(np.arange(len(nseg)), nseg)
+
+    # every segment of a partial-hit row pairs with each segment of that row,
+    # and every pair adds a rectangle to a 2-D difference array
+    first = np.flatnonzero(pasinfo[row])
+    count = nseg[row[first]]
+    p = np.repeat(first, count)
+    q = np.repeat(segptr[row[first]], count) + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+
+    lo_p, hi_p = seg[p, 0], seg[p, 1] + 1
+    lo_q, hi_q = seg[q, 0], seg[q, 1] + 1
+    fc = np.zeros((Nres + 1) * (Nres + 1), dtype=np.int64)
+    np.add.at(fc, lo_p * (Nres + 1) + lo_q, 1)
+    np.add.at(fc, lo_p * (Nres + 1) + hi_q, -1)
+    np.add.at(fc, hi_p * (Nres + 1) + lo_q, -1)
+    np.add.at(fc, hi_p * (Nres + 1) + hi_q, 1)
+    return fc.reshape(Nres + 1, Nres + 1).cumsum(axis=0).cumsum(axis=1)[:Nres, :Nres]
+
+def _interpolation_index(Nwin, Nres, offset):
+    """Sample points of interpolation()/interpolation_community(): j1, j2 and the weight (x-x1)/step2."""
+    step, step2 = 1.0 / Nwin, 1.0 / Nres
+    x  = (np.arange(Nwin) + (1.0 if offset == 1.0 else 0.5)) * step
+    j1 = (x * Nres).astype(np.int64) - 1
+    j2 = j1 + 1
+    x1 = (j1 + offset) * step2
+    return j1, np.minimum(j2, Nres - 1), x - x1, step2
+
+def _interpolate(values, Nwin, offset):
+    """Linear resampling of the last axis of `values` to Nwin points, as in src/feature.c."""
+    Nres = values.shape[-1]
+    j1, j2, dx, step2 = _interpolation_index(Nwin, Nres, offset)
+    v1 = values[..., np.maximum(j1, 0)]
+    v2 = values[..., j2]
+    return np.where(j1 < 0, v2, dx * (v2 - v1) / step2 + v1)
+
+def pas_windows(fc, Npasinfo, Nres):
+    """PASaveN/C (Nres x 101), PASaveN2/C2 (Nres x 100) and PASmaxN/C (Nres) from the co-coverage counts."""
+    i = np.arange(Nres)
+    if Npasinfo == 0:
+        return (np.zeros((Nres, 2 * WIN_PAS + 1)), np.zeros((Nres, 2 * WIN_PAS + 1)),
+                np.zeros((Nres, WIN_PAS2)), np.zeros((Nres, WIN_PAS2)), np.zeros(Nres), np.zeros(Nres))
+
+    # sum_PAS: row ii = i+k (clipped, which repeats the edge values) split at column i
+    rowsum = fc.cumsum(axis=1)
+    total = rowsum[:, -1]
+    ii = np.clip(i[:, None] + np.arange(-WIN_PAS, WIN_PAS + 1)[None, :], 0, Nres - 1)
+    before = rowsum[ii, i[:, None]]
+    PASaveN = before / Npasinfo / (i[:, None] + 1)
+    PASaveC = (total[ii] - before + fc[ii, i[:, None]]) / Npasinfo / (Nres - i[:, None])
+
+    # sum_PAS2: column means over the rows up to i and (with row 0 kept) after i
+    colsum = fc.cumsum(axis=0)
+    PASaveN5 = colsum / Npasinfo / (i[:, None] + 1)
+    PASaveC5 = (colsum[-1][None, :] - colsum + fc[0][None, :]) / Npasinfo / (Nres - i[:, None])
+    PASmaxN = np.maximum(PASaveN5.max(axis=1), 0.0)
+    PASmaxC = np.maximum(PASaveC5.max(axis=1), 0.0)
+    PASaveN2 = _interpolate(PASaveN5, WIN_PAS2, 1.0)
+    PASaveC2 = _interpolate(PASaveC5, WIN_PAS2, 1.0)
+    return PASaveN, PASaveC, PASaveN2, PASaveC2, PASmaxN, PASmaxC
+
+def ccm_community(ccmpred, cutoffs):
+    """Community profile of the contact graph above each cutoff (cal_ccm_community).
+
+    args:
+        :ccmpred (Nres x Nres) - band-zeroed couplings
+        :cutoffs (sequence of float)
+    returns:
+        :(len(cutoffs) x Nres) array
+    """
+    ccmpred = np.asarray(ccmpred, dtype=np.float64)
+    lower = np.tril(ccmpred, -1)
+    upper = np.triu(ccmpred, 1)
+    community = []
+    for cut in cutoffs:
+        dd1 = np.where(lower > cut, lower, 0.0).sum(axis=1)
+        dd2 = np.where(upper > cut, upper, 0.0).sum(axis=1)
+        M = dd2.sum()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ddd1 = np.cumsum(dd1)
+            ddd2 = M - np.cumsum(dd2)
+            dm1  = np.cumsum(dd1 + dd2)
+            dm2  = 2 * M - dm1
+            community.append(ddd1 / M + ddd2 / M - ((dm1 / (2 * M)) ** 2 + (dm2 / (2 * M)) ** 2))
+    return np.array(community).reshape(len(cutoffs), ccmpred.shape[0])
+
+def _depth(n):
+    if n < 10:
+        return 0.0
+    return np.log10(n) / 5.0 if n < 100000 else 1.0
+
+def base_arrays(target, ccm_sigma=2.0, profile='ck2', qij=None, pseudo=PSEUDO):
+    """Per-residue quantities the feature rows are built from.
+
+    args:
+        :target (str or Path) - the path prefix passed to bin/feature
+        :ccm_sigma (float) - community cutoff ave + ccm_sigma * stddev
+        :profile (str) - 'ck2' reads target.ck2, 'msa' computes the profile from target.msa with
+                         the pseudocounts of the `qij` file (bin/feature -profile msa -qij -pseudo)
+    returns:
+        :(dict) - Nres, profile, ss2, sa2, community, comm_max, comm_min, PASaveN, PASaveC,
+                  PASaveN2, PASaveC2, PASmaxN, PASmaxC, Nsite, msig5, psig5, dmsa, dpas, rpas
+    """
+    Nres = len(read_sequence(target))
+    segptr, seg, pasinfo = read_msa_segments(target, Nres)
+    Nmsa, Npasinfo = len(pasinfo), int(pasinfo.sum())
+
+    base = dict(Nres=Nres)
+    if profile == 'msa':
+        base['profile'] = msa_profile(target, Nres, read_qij(qij), pseudo)
+    else:
+        base['profile'] = read_profile(target, Nres)
+    base['ss2'] = read_ss2(target, Nres)
+    base['sa2'] = read_sa2(target, Nres)
+
+    base['Nsite'], base['msig5'], base['psig5'] = n_signal(segptr, seg, Nres, Nmsa)
+
+    fc = pas_count(segptr, seg, pasinfo, Nres) if Npasinfo > 0 else None
+    (base['PASaveN'], base['PASaveC'], base['PASaveN2'], base['PASaveC2'],
+     base['PASmaxN'], base['PASmaxC']) = pas_windows(fc, Npasinfo, Nres)
+
+    if Nmsa > 5:
+        ccmpred, ave, stddev = read_ccmpred(target, Nres)
+        community = ccm_community(ccmpred, [ave + ccm_sigma * stddev])[0]
+    else:
+        community = np.zeros(Nres)
+    base['community'] = community
+    base['comm_max'] = max(community.max(initial=-10.0), -10.0)
+    base['comm_min'] = min(community.min(initial=10.0), 10.0)
+
+    base['dmsa'] = _depth(Nmsa)
+    base['dpas'] = _depth(Npasinfo)
+    base['rpas'] = Npasinfo / Nmsa if Npasinfo > 0 else 0.0
+    return base
+
+def _scale_community(community, comm_max, comm_min):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(community > 0, community / comm_max,
+                        np.where(community < 0, -community / comm_min, 0.0))
+
+def _windows(values, half, upper=None):
+    """Rows values[i-half .. i+upper] for every i, zero outside the query, flattened per residue."""
+    upper = half if upper is None else upper
+    values = values.reshape(len(values), -1)
+    padded = np.zeros((len(values) + half + upper, values.shape[1]))
+    padded[half:half + len(values)] = values
+    windows = np.lib.stride_tricks.sliding_window_view(padded, half + upper + 1, axis=0)
+    return windows.transpose(0, 2, 1).reshape(len(values), -1)
+
+def _exist(Nres, half):
+    offsets = np.concatenate([np.arange(-half, 0), np.arange(1, half + 1)])
+    k = np.arange(Nres)[:, None] + offsets[None, :]
+    return ((k >= 0) & (k < Nres)).astype(np.float64)
+
+def _scalars(base):
+    Nres = base['Nres']
+    i = np.arange(Nres)
+    scalars = np.empty((Nres, 15))
+    scalars[:, 0] = base['dmsa']
+    scalars[:, 1] = base['dpas']
+    scalars[:, 2] = base['rpas']
+    scalars[:, 3] = np.minimum(i / 1000.0, 1.0)
+    scalars[:, 4] = np.minimum((Nres - i - 1) / 1000.0, 1.0)
+    scalars[:, 5] = min(Nres / 1000.0, 1.0)
+    scalars[:, 6:9] = base['Nsite'] / np.array([22.0, 11.0, 11.0])
+    scalars[:, 9:12] = base['msig5']
+    scalars[:, 12:15] = base['psig5']
+    return scalars
+
+def _position(Nres):
+    return ((np.arange(Nres) + 1) / Nres)[:, None]
+
+def _layout(blocks):
+    layout, start = {}, 0
+    for name, width in blocks:
+        layout[name] = slice(start, start + width)
+        start += width
+    return layout
+
+# column blocks of a feature row (target.feature.txt without the index column)
+FEATURE = _layout([('exist', 2 * WIN_PAS), ('community', 2 * WIN_CCM), ('comm_max_min', 2),
+                   ('PASaveN', 2 * WIN_PAS + 1), ('PASaveC', 2 * WIN_PAS + 1), ('PASmax', 2), ('position', 1),
+                   ('profile', (2 * WIN_PROF + 1) * 20), ('ss2', (2 * WIN_SS + 1) * 3), ('sa2', (2 * WIN_SA + 1) * 4),
+                   ('scalars', 15)])
+
+# column blocks of a base row (target.base.npy): the per-residue values every
+# feature row is built from. The windows over neighbouring residues, the exist
+# flags and the position are rebuilt from these by expand_base.
+BASE = _layout([('community', 1), ('comm_max_min', 2), ('PASaveN', 2 * WIN_PAS + 1), ('PASaveC', 2 * WIN_PAS + 1),
+                ('PASmax', 2), ('profile', 20), ('ss2', 3), ('sa2', 4), ('scalars', 15)])
+NBASE = BASE['scalars'].stop
+
+# feature columns holding the base values: the centre of every window and the per-residue blocks
+BASE_COLUMNS = np.concatenate([
+    [FEATURE['community'].start + WIN_CCM],
+    np.arange(FEATURE['comm_max_min'].start, FEATURE['PASmax'].stop),
+    FEATURE['profile'].start + WIN_PROF * 20 + np.arange(20),
+    FEATURE['ss2'].start + WIN_SS * 3 + np.arange(3),
+    FEATURE['sa2'].start + WIN_SA * 4 + np.arange(4),
+    np.arange(FEATURE['scalars'].start, FEATURE['scalars'].stop)])
+
+def base_matrix(base, decimals=4):
+    """The Nres x 249 float32 base rows (the layout of target.base.npy) of `base_arrays` output."""
+    Nres = base['Nres']
+    columns = [_scale_community(base['community'], base['comm_max'], base['comm_min'])[:, None],
+               np.tile([base['comm_max'], base['comm_min']], (Nres, 1)),
+               base['PASaveN'], base['PASaveC'],
+               base['PASmaxN'][:, None], base['PASmaxC'][:, None],
+               base['profile'], base['ss2'], base['sa2'],
+               _scalars(base)]
+    compact = np.hstack(columns)
+    if decimals is not None:
+        compact = np.round(compact, decimals)
+    return compact.astype(np.float32)
+
+def compress_features(features):
+    """The base rows of a full Nres x 1129 feature matrix."""
+    return np.ascontiguousarray(np.asarray(features)[:, BASE_COLUMNS], dtype=np.float32)
+
+def _put_windows(out, block, values, half, upper=None):
+    """Writes the zero-padded windows values[i-half .. i+upper] into out[:, block] through a strided view."""
+    upper = half if upper is None else upper
+    Nres, width = values.shape
+    padded = np.zeros((Nres + half + upper, width), dtype=out.dtype)
+    padded[half:half + Nres] = values
+    windows = np.lib.stride_tricks.sliding_window_view(padded, half + upper + 1, axis=0)
+    out[:, block].reshape(Nres, half + upper + 1, width)[...] = windows.transpose(0, 2, 1)
+
+def expand_base(compact, decimals=4, out=None):
+    """The Nres x 1129 float32 feature rows from Nres x 249 base rows (target.base.npy).
+
+    args:
+        :compact (array) - base rows, e.g. np.load(target.base.npy, mmap_mode='r')
+        :decimals (int or None) - rounding of the position column, as in the text output
+        :out (array, optional) - float32 Nres x 1129 array to fill
+    returns:
+        :(array) - the feature rows; equal to target.feature.npy for the same run
+    """
+    compact = np.asarray(compact, dtype=np.float32)
+    Nres = len(compact)
+    if out is None:
+        out = np.empty((Nres, NFEATURE), dtype=np.float32)
+
+    out[:, FEATURE['exist']] = _exist(Nres, WIN_PAS)
+    _put_windows(out, FEATURE['community'], compact[:, BASE['community']], WIN_CCM, WIN_CCM - 1)
+    out[:, FEATURE['comm_max_min'].start:FEATURE['PASmax'].stop] = compact[:, BASE['comm_max_min'].start:BASE['PASmax'].stop]
+    position = _position(Nres)
+    out[:, FEATURE['position']] = np.round(position, decimals) if decimals is not None else position
+    _put_windows(out, FEATURE['profile'], compact[:, BASE['profile']], WIN_PROF)
+    _put_windows(out, FEATURE['ss2'], compact[:, BASE['ss2']], WIN_SS)
+    _put_windows(out, FEATURE['sa2'], compact[:, BASE['sa2']], WIN_SA)
+    out[:, FEATURE['scalars']] = compact[:, BASE['scalars']]
+    return out
+
+def expand_features(base, decimals=4):
+    """The Nres x 1129 rows of target.feature.txt (without the index column) as float32."""
+    return expand_base(base_matrix(base, decimals=decimals), decimals=decimals)
+
+def expand_features2(base, decimals=4):
+    """The rows of target.feature2.txt (without the index column) as float32."""
+    Nres = base['Nres']
+    ccm_comm = _interpolate(base['community'], WIN_CCM2, 1.5)
+    columns = [_exist(Nres, WIN_SS),
+               np.tile(_scale_community(ccm_comm, base['comm_max'], base['comm_min']), (Nres, 1)),
+               base['PASaveN2'], base['PASaveC2'],
+               _position(Nres),
+               _windows(base['profile'], WIN_PROF),
+               _windows(base['ss2'], WIN_SS),
+               _windows(base['sa2'], WIN_SA),
+               _scalars(base)]
+    features = np.hstack(columns)
+    if decimals is not None:
+        features = np.round(features, decimals)
+    return features.astype(np.float32)
+
+def compute_features(target, ccm_sigma=2.0, decimals=4, **profile):
+    """The Nres x 1129 float32 feature matrix of `bin/feature target`, computed in-process."""
+    return expand_features(base_arrays(target, ccm_sigma=ccm_sigma, **profile), decimals=decimals)
+
+def load_session_features(session):
+    """Feature matrices of a session directory, by name: the gathered data_feature.dat.npz
+    if there is one, otherwise every .feature.npy or .base.npy written by bin/feature."""
+    session = Path(session)
+    if (session / 'data_feature.dat.npz').exists():
+        with np.load(session / 'data_feature.dat.npz') as npz:
+            return {session.name: npz['feature']}
+    features = {}
+    for feature_file in sorted(session.glob('*.feature.npy')):
+        features[feature_file.name[:-len('.feature.npy')]] = np.load(feature_file)
+    for base_file in sorted(session.glob('*.base.npy')):
+        features.setdefault(base_file.name[:-len('.base.npy')], expand_base(np.load(base_file)))
+    return features
+
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs='+', help="Path prefixes, as passed to bin/feature.")
+    parser.add_argument("--ccm-sigma", dest="ccm_sigma", type=float, default=2.0,
+                        help="Community cutoff in standard deviations above the mean coupling. (default = 2)")
+    parser.add_argument("--profile", choices=['ck2', 'msa'], default='ck2',
+                        help="Read the profile from target.ck2 or compute it from target.msa. (default = ck2)")
+    parser.add_argument("--qij", default=str(Path(__file__).resolve().parent.parent / 'data' / 'qij'),
+                        help="Target frequencies for the pseudocounts of --profile msa. (default = data/qij)")
+    parser.add_argument("--pseudo", type=float, default=PSEUDO,
+                        help=f"Pseudocount weight of --profile msa. (default = {PSEUDO:g})")
+    parser.add_argument("--base", action='store_true', default=False,
+                        help="Write the base rows to target.base.npy instead of target.feature.npy.")
+    parser.add_argument("--compare", action='store_true', default=False,
+                        help="Compare with target.feature.npy or target.feature.txt from bin/feature instead of writing.")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = arguments()
+    status = 0
+    profile = dict(profile=args.profile, qij=args.qij, pseudo=args.pseudo)
+    for target in args.targets:
+        if args.base and not args.compare:
+            np.save(f"{target}.base.npy", base_matrix(base_arrays(target, ccm_sigma=args.ccm_sigma, **profile)))
+            continue
+        features = compute_features(target, ccm_sigma=args.ccm_sigma, **profile)
+        if not args.compare:
+            np.save(f"{target}.feature.npy", features)
+            continue
+        if Path(f"{target}.feature.npy").exists():
+            reference = np.load(f"{target}.feature.npy")
+        else:
+            reference = np.loadtxt(f"{target}.feature.txt", dtype=np.float32)[:, 1:]
+        diff = np.abs(features - reference) if reference.shape == features.shape else np.array([np.inf])
+        print(f"{target}: max abs diff {diff.max():.2e}, {(diff > 0).sum()} cells differ")
+        status |= int(diff.max() > 1.01e-4)
+    sys.exit(status)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+TensorFlow-free inference for the ConDo MLP.
+
+`DenseModel.from_h5(weight_file)` reads the Keras weight file written by
+`model.save_weights` (or `model.save`) into float32 NumPy arrays and runs the
+forward pass of the network built by `_create_model` in condo-helper-suite:
+Dense 1129->1500, three Dense 1500->1500, all ReLU, and Dense 1500->4 with a
+sigmoid. Dropout is the identity at inference time.
+
+The kernels can be kept in reduced precision (`PRECISIONS`): float16,
+bfloat16 (stored as the upper 16 bits of the float32) or int8 with one
+float32 scale per output channel. That shrinks the weight files and the
+weights held between calls 2-4x; `predict` expands them to float32 once per
+call and reuses them for every batch, so inference itself runs at float32
+speed and memory rather than faster. `save_npz`
+writes a model in its precision and `DenseModel.load` reads it back, so the
+weights need not be quantized again at every start.
+
+`DenseEnsemble` evaluates several weight sets of the same network in one
+pass: the first layers are concatenated into one wide matmul over the
+features, the later ones are stacked into batched matmuls.
+
+`ScreenModel` is the cheap first stage of the prediction cascade: a linear
+estimate of the summed boundary score from a subset of the columns,
+distilled from the full network by distill_screen.py. Residues it puts
+below `cutoff - margin`, and that are not next to one above, are never
+boundary candidates and need not go through the full network.
+"""
+
+import numpy as np
+
+
+ACTIVATIONS = ['relu', 'relu', 'relu', 'relu', 'sigmoid']
+LAYER_SHAPES = [(1129, 1500), (1500, 1500), (1500, 1500), (1500, 1500), (1500, 4)]
+PRECISIONS = ['float32', 'float16', 'bfloat16', 'int8']
+
+def _decode(names):
+    return [name.decode('utf8') if isinstance(name, bytes) else str(name) for name in names]
+
+def read_keras_weights(weight_file):
+    """Dense layer weights of a Keras HDF5 weight file.
+
+    args:
+        :weight_file (str or Path) - weight.h5 from `save_weights` or `save`
+    returns:
+        :(list) - (kernel, bias) float32 pairs in layer order; kernel is (inputs, units)
+    """
+    import h5py
+
+    layers = []
+    with h5py.File(weight_file, 'r') as h5:
+        root = h5['model_weights'] if 'model_weights' in h5 else h5
+        for layer_name in _decode(root.attrs['layer_names']):
+            group = root[layer_name]
+            weight_names = _decode(group.attrs['weight_names'])
+            if not weight_names:
+                continue
+            weights = {name.split('/')[-1].split(':')[0]: np.asarray(group[name], dtype=np.float32)
+                       for name in weight_names}
+            layers.append((weights['kernel'], weights['bias']))
+    return layers
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+def _sigmoid(x):
+    # 1 / (1 + exp(-x)), in place, as Keras computes it in float32
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+_activation = {'relu': _relu, 'sigmoid': _sigmoid}
+
+def quantize(kernel, precision):
+    """Stores a float32 kernel in `precision`.
+    returns:
+        :(stored, scale) - the stored kernel and the per-output-channel scale (None unless int8)
+    """
+    kernel = np.asarray(kernel, dtype=np.float32)
+    if precision == 'float32':
+        return kernel, None
+    if precision == 'float16':
+        return kernel.astype(np.float16), None
+    if precision == 'bfloat16':
+        # round to nearest even on the 16 dropped mantissa bits
+        bits = kernel.view(np.uint32)
+        bits = bits + np.uint32(0x7fff) + ((bits >> np.uint32(16)) & np.uint32(1))
+        return (bits >> np.uint32(16)).astype(np.uint16), None
+    if precision == 'int8':
+        scale = np.abs(kernel).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        return np.clip(np.rint(kernel / scale), -127, 127).astype(np.int8), scale.astype(np.float32)
+    raise ValueError(f"Unknown precision {precision}, expected one of {PRECISIONS}.")
+
+def dequantize(stored, precision):
+    """The float32 kernel of a stored one; int8 kernels still need their scale applied to the outputs."""
+    if precision == 'bfloat16':
+        return (stored.astype(np.uint32) << np.uint32(16)).view(np.float32)
+    return stored.astype(np.float32, copy=False)
+
+def _expanded(layers, precision):
+    """(kernel, scale, bias) of every layer with the kernel expanded to float32, for one predict call."""
+    return [(dequantize(kernel, precision), scale, bias) for kernel, scale, bias in layers]
+
+class DenseModel:
+    """Stack of dense layers with a `predict` like the Keras model's."""
+
+    def __init__(self, layers, activations=ACTIVATIONS, precision='float32'):
+        if len(layers) != len(activations):
+            raise ValueError(f"{len(layers)} dense layers for {len(activations)} activations.")
+        for (kernel, bias), (previous, _) in zip(layers[1:], layers):
+            if kernel.shape[0] != previous.shape[1]:
+                raise ValueError(f"Layer input {kernel.shape[0]} does not match the previous output {previous.shape[1]}.")
+        self.precision = precision
+        self.activation_names = list(activations)
+        self.layers = [quantize(kernel, precision) + (np.asarray(bias, dtype=np.float32),) for kernel, bias in layers]
+        self.activations = [_activation[name] for name in activations]
+
+    @classmethod
+    def from_h5(cls, weight_file, precision='float32'):
+        layers = read_keras_weights(weight_file)
+        shapes = [kernel.shape for kernel, _ in layers]
+        if shapes != LAYER_SHAPES:
+            raise ValueError(f"{weight_file} has dense layers {shapes}, expected {LAYER_SHAPES}.")
+        return cls(layers, precision=precision)
+
+    @classmethod
+    def load(cls, weight_file, precision=None):
+        """A model from a Keras weight.h5 (quantized to `precision`, float32 by default)
+        or from a file written by `save_npz` (in its stored precision)."""
+        if str(weight_file).endswith('.npz'):
+            model = cls.__new__(cls)
+            with np.load(weight_file) as npz:
+                model.precision = str(npz['precision'])
+                model.activation_names = [str(name) for name in npz['activations']]
+                model.layers = [(npz[f'kernel_{i}'], npz[f'scale_{i}'] if f'scale_{i}' in npz else None, npz[f'bias_{i}'])
+                                for i in range(len(model.activation_names))]
+            model.activations = [_activation[name] for name in model.activation_names]
+            if precision not in (None, model.precision):
+                raise ValueError(f"{weight_file} holds {model.precision} weights, not {precision}.")
+            return model
+        return cls.from_h5(weight_file, precision=precision or 'float32')
+
+    def save_npz(self, path):
+        arrays = dict(precision=self.precision, activations=np.array(self.activation_names))
+        for i, (kernel, scale, bias) in enumerate(self.layers):
+            arrays[f'kernel_{i}'], arrays[f'bias_{i}'] = kernel, bias
+            if scale is not None:
+                arrays[f'scale_{i}'] = scale
+        np.savez(path, **arrays)
+
+    @property
+    def input_dim(self):
+        return self.layers[0][0].shape[0]
+
+    @property
+    def nbytes(self):
+        """Bytes held by the stored weights."""
+        return sum(array.nbytes for layer in self.layers for array in layer if array is not None)
+
+    def predict(self, x, batch_size=4096):
+        """Forward pass.
+        args:
+            :x (array) - (N, 1129) features
+            :batch_size (int) - rows per matmul, bounds the activation memory
+        returns:
+            :(array) - (N, 4) float32 sigmoid outputs
+        """
+        x = np.asarray(x, dtype=np.float32)
+        out = np.empty((len(x), self.layers[-1][0].shape[1]), dtype=np.float32)
+        layers = _expanded(self.layers, self.precision)
+        for start in range(0, len(x), batch_size):
+            h = x[start:start + batch_size]
+            for (kernel, scale, bias), activation in zip(layers, self.activations):
+                h = h @ kernel
+                if scale is not None:
+                    h *= scale
+                h += bias
+                h = activation(h)
+            out[start:start + batch_size] = h
+        return out
+
+class DenseEnsemble:
+    """Several `DenseModel`s of the same network, evaluated together."""
+
+    def __init__(self, models):
+        first = models[0]
+        for model in models[1:]:
+            if model.precision != first.precision or model.activation_names != first.activation_names:
+                raise ValueError("Ensemble members must share their precision and activations.")
+            if [layer[0].shape for layer in model.layers] != [layer[0].shape for layer in first.layers]:
+                raise ValueError("Ensemble members must share their layer shapes.")
+        self.precision, self.nmodels = first.precision, len(models)
+        self.activations = first.activations
+
+        def scales(layers, axis):
+            return None if layers[0][1] is None else np.concatenate([layer[1] for layer in layers], axis=axis)
+        # first layer: (inputs, models * units), the features are multiplied once
+        layers = [model.layers[0] for model in models]
+        self.layers = [(np.concatenate([layer[0] for layer in layers], axis=1), scales(layers, 0),
+                        np.concatenate([layer[2] for layer in layers]))]
+        # later layers: (models, inputs, units), one batched matmul
+        for i in range(1, len(first.layers)):
+            layers = [model.layers[i] for model in models]
+            scale = None if layers[0][1] is None else np.stack([layer[1] for layer in layers])[:, None, :]
+            self.layers.append((np.stack([layer[0] for layer in layers]), scale,
+                                np.stack([layer[2] for layer in layers])[:, None, :]))
+
+    @classmethod
+    def load(cls, weight_files, precision=None):
+        return cls([DenseModel.load(weight_file, precision) for weight_file in weight_files])
+
+    @property
+    def input_dim(self):
+        return self.layers[0][0].shape[0]
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for layer in self.layers for array in layer if array is not None)
+
+    def predict_members(self, x, batch_size=4096):
+        """Forward pass of every member.
+        returns:
+            :(array) - (models, N, 4) float32 sigmoid outputs
+        """
+        x = np.asarray(x, dtype=np.float32)
+        out = np.empty((self.nmodels, len(x), self.layers[-1][0].shape[-1]), dtype=np.float32)
+        layers = _expanded(self.layers, self.precision)
+        for start in range(0, len(x), batch_size):
+            h = x[start:start + batch_size]
+            for i, ((kernel, scale, bias), activation) in enumerate(zip(layers, self.activations)):
+                h = h @ kernel
+                if scale is not None:
+                    h *= scale
+                h += bias
+                h = activation(h)
+                if i == 0:
+                    h = np.ascontiguousarray(h.reshape(len(h), self.nmodels, -1).transpose(1, 0, 2))
+            out[:, start:start + batch_size] = h
+        return out
+
+    def predict(self, x, batch_size=4096):
+        """The ensemble mean, (N, 4)."""
+        return self.predict_members(x, batch_size=batch_size).mean(axis=0)
+
+class ScreenModel:
+    """Linear estimate of the summed score from some feature columns, with the margin by which
+    it may fall short of the full network's score."""
+
+    def __init__(self, columns, coef, intercept, margin):
+        self.columns = np.asarray(columns, dtype=np.intp)
+        self.coef = np.asarray(coef, dtype=np.float32)
+        self.intercept, self.margin = float(intercept), float(margin)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            return cls(npz['columns'], npz['coef'], npz['intercept'], npz['margin'])
+
+    def save_npz(self, path):
+        np.savez(path, columns=self.columns, coef=self.coef, intercept=self.intercept, margin=self.margin)
+
+    def predict(self, x):
+        """(N,) estimated summed scores."""
+        return np.asarray(x, dtype=np.float32)[:, self.columns] @ self.coef + np.float32(self.intercept)
+
+    def select(self, x, cutoff, scores=None):
+        """Rows of one target that need the full network at `cutoff`: those that may score above it,
+        and their neighbours, which decide on which side of a candidate the boundary goes."""
+        keep = (self.predict(x) if scores is None else scores) > cutoff - self.margin
+        near = keep.copy()
+        near[1:] |= keep[:-1]
+        near[:-1] |= keep[1:]
+        return near
@@ -7,14 +7,14 @@
 
 import argparse
 import os, sys, string
-from math import log
+import functools
+import multiprocessing
 from pathlib import Path
 
 import numpy as np
-import array
 
-SANN_HOME = Path(os.environ.get("SANN"))
-QIJ       = str(SANN_HOME / 'bin' / 'qij')
+SANN_HOME = os.environ.get("SANN")
+QIJ       = str(Path(SANN_HOME) / 'bin' / 'qij') if SANN_HOME else None
 
 mapping=[0,4,3,6,13,7,8,9,11,10,12,2,14,5,1,15,16,19,17,18]
 aaNum = {'A': 0,'C': 1,'D': 2,'E': 3,'F': 4,
@@ -23,79 +23,104 @@ aaNum = {'A': 0,'C': 1,'D': 2,'E': 3,'F': 4,
          'S':15,'T':16,'V':17,'W':18,'Y':19,'X':0}
 blos_aa= [0,14,11,2,1,13,3,5,6,7,9,8,10,4,12,15,16,18,19,17]
 
+# aaNum as a lookup table over the bytes of the sequence; -1 for letters it does not know
+aa_table = np.full(256, -1, dtype=np.intp)
+aa_table[[ord(amino) for amino in aaNum]] = list(aaNum.values())
+
 def arguments():
     parser = argparse.ArgumentParser(description="mkchk - called from sann.sh")
-    parser.add_argument("checkfile", help=".chk file from BLAST", type=Path)
-    parser.add_argument("--qij", help="path to qij", type=str, default=QIJ)
+    parser.add_argument("checkfile", help=".chk file(s) from BLAST", type=Path, nargs='+')
+    parser.add_argument("--qij", help="path to qij", type=str, default=QIJ, required=QIJ is None)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes converting the .chk files when there are several")
     return parser.parse_args()
 
 
 def read_qij(file):
-    file = open(file)
+    """The row-normalized 20 x 20 qij matrix of a lower triangular text file.
+
+    The matrix is cached next to the file as file.npy, and read from there
+    while it is newer than the file. The cache is written under a temporary
+    name and renamed into place, as concurrent runs share it; a cache that
+    cannot be read for any reason is parsed again.
+    """
+    cache = Path(f"{file}.npy")
+    try:
+        if cache.stat().st_mtime >= Path(file).stat().st_mtime:
+            qij = np.load(cache)
+            if qij.shape == (20, 20):
+                return qij
+    except Exception:
+        pass
+
     qij = np.zeros((20,20), dtype=np.float64)
-    i=0
-    for line in file.readlines():
-        val = list(map(float, line.split()))
-        for j in range(len(val)):
-            qij[blos_aa[i],blos_aa[j]] = val[j]
-            qij[blos_aa[j],blos_aa[i]] = val[j]
-        i+=1
-    for i in range(20):
-        sum = 0.0
-        for j in range(20):
-            sum += qij[i,j]
-        for j in range(20):
-            qij[i,j] = qij[i,j]/sum
+    blos = np.array(blos_aa)
+    with open(file) as handle:
+        for i, line in enumerate(handle):
+            val = np.array(line.split(), dtype=np.float64)
+            qij[blos[i], blos[:len(val)]] = val
+            qij[blos[:len(val)], blos[i]] = val
+    # cumsum adds left to right, as the sums were always taken
+    qij /= np.cumsum(qij, axis=1)[:, -1:]
+
+    partial = cache.with_name(f"{cache.name}.{os.getpid()}")
+    try:
+        with open(partial, 'wb') as handle:
+            np.save(handle, qij)
+        os.replace(partial, cache)
+    except OSError:
+        # e.g. a read-only SANN installation; parse again next time
+        try:
+            partial.unlink()
+        except OSError:
+            pass
     return qij
 
-def read_chk(chkfile):
-    with open(chkfile, mode='rb') as checkfile:
-        n = array.array('i')
-        n.fromfile(checkfile, 1)
-        naa = n[0]
+def read_chk(chkfile, qij):
+    """Reads a BLAST .chk: the residue count (int), the sequence and one 20-double row per residue.
+    returns:
+        :naa, seq, out, col, quality - the PSSM in ConDo's column order (qij rows where BLAST left the
+         row empty), whether each row is BLAST's, and its Shannon entropy
+    """
+    raw = np.fromfile(chkfile, dtype=np.uint8)
+    naa = int(raw[:4].view(np.intc)[0])
+    chk = np.frombuffer(raw, count=1, dtype=np.dtype([('naa', np.intc), ('seq', np.uint8, naa),
+                                                      ('pssm', np.float64, (naa, 20))]))[0]
+    seq = chk['seq'].tobytes().decode('utf-8')
+
+    amino = aa_table[chk['seq']]
+    if (amino < 0).any():
+        raise KeyError(seq[np.flatnonzero(amino < 0)[0]])
+
+    data = chk['pssm']
+    col = (data.sum(axis=1) != 0).astype(int)
+    out = np.where(col[:, None] == 1, data[:, mapping], qij[amino])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        quality = -np.where(out > 0, out * np.log(out), 0.0).sum(axis=1)
+    return naa, seq, out, col, quality
 
-        strarr = array.array('b')
-        strarr.fromfile(checkfile,naa)
-        seq = strarr.tostring()
-        seq = seq.decode('utf-8')
+def write_ck2(chkfile, qij):
+    """Converts target.chk to target.ck2 next to it."""
+    chkfile = chkfile.with_suffix(".chk")
+    naa, seq, out, col, quality = read_chk(chkfile, qij)
+
+    with open(chkfile.parent / f"{chkfile.stem}.ck2" , 'w') as ck2file:
+        print(naa, file=ck2file)
+        print(seq, file=ck2file)
+        np.savetxt(ck2file, out, fmt='%6.4f ', delimiter='')
+    return naa, seq
 
-        print(f"Sequence: {seq} ({naa} residues)")
-        aa_types = 20
-        
-        out     = np.zeros((naa, aa_types), dtype=np.float64)
-        col     = np.zeros((naa), dtype=int)
-        quality = np.zeros((naa), dtype=np.float64)
-
-        for i, amino in enumerate(seq):
-            v = array.array('d')
-            v.fromfile(checkfile, aa_types)
-            data = np.array(v, dtype=np.float64)
-            if not sum(data):
-                col[i] = 0
-                for j in range(aa_types):
-                    out[i, j] =  qij[aaNum[amino], j]
-            else:
-                col[i] = 1
-                for j in range(aa_types):
-                    out[i, j] = data[mapping[j]]
-            
-            for k in range(aa_types):
-                quality[i] = quality[i] - out[i,k]*log(out[i,k])
-    return naa, seq, out, col, quality
-    
 if __name__ == '__main__':
     args = arguments()
 
-    chkfile = args.checkfile.with_suffix(".chk")
-
     qij = read_qij(args.qij)
 
-    naa, seq, out, col, quality = read_chk(chkfile)
-
-    with open(chkfile.parent / f"{chkfile.stem}.ck2" , 'w') as ck2file:
-        print(naa, file=ck2file)
-        print(seq, file=ck2file)
-        for i in range(naa):
-            for j in range(20):
-                print('%6.4f' % out[i,j], file=ck2file, end=' ')
-            print(file=ck2file)
+    convert = functools.partial(write_ck2, qij=qij)
+    if len(args.checkfile) == 1 or args.workers <= 1:
+        converted = map(convert, args.checkfile)
+    else:
+        # one interpreter and one qij for the whole batch; imap keeps the order of the files
+        pool = multiprocessing.Pool(min(args.workers, len(args.checkfile)))
+        converted = pool.imap(convert, args.checkfile)
+    for naa, seq in converted:
+        print(f"Sequence: {seq} ({naa} residues)")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Quantizes a ConDo weight.h5 and reports what each precision costs.
+
+For every precision in --precision, writes weight.<precision>.npz (load it with
+`condo-helper-suite predict -w weight.<precision>.npz`) and compares its
+predictions with the float32 ones on the given sessions: the largest change
+of the summed boundary score, and the boundaries called at --conf-cut that
+appear or disappear.
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from inference import DenseModel, PRECISIONS
+from features import load_session_features
+from boundaries import boundary_scores, call_boundaries
+
+
+EXAMPLES = Path(__file__).resolve().parent.parent / 'examples'
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("weights", type=Path, help="Keras weight file.")
+    parser.add_argument("--precision", nargs='+', choices=PRECISIONS[1:], default=PRECISIONS[1:],
+                        help="Precisions to write and compare. (default = all)")
+    parser.add_argument("--sessions", type=Path, nargs='+',
+                        default=sorted(path for path in EXAMPLES.iterdir() if path.is_dir()),
+                        help="Session directories to compare on. (default = the examples)")
+    parser.add_argument('-c', '--conf-cut', dest='cutoff', type=float, default=1.4,
+                        help="Confidence cutoff. (default = 1.4)")
+    parser.add_argument("--out-dir", type=Path, default=None,
+                        help="Where to write weight.<precision>.npz. (default = next to the weight file)")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = arguments()
+    out_dir = args.out_dir or args.weights.parent
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    features = {}
+    for session in args.sessions:
+        features.update(load_session_features(session))
+    if not features:
+        sys.exit("[quantize] No features found in the sessions.")
+
+    reference = DenseModel.from_h5(args.weights)
+    ref_scores = {name: boundary_scores(reference.predict(x)) for name, x in features.items()}
+    ref_calls = {name: call_boundaries(scores, args.cutoff) for name, scores in ref_scores.items()}
+    print(f"float32   {reference.nbytes / 2**20:7.1f} MiB  "
+          f"{sum(len(calls) for calls in ref_calls.values())} boundaries at {args.cutoff} "
+          f"in {len(features)} targets")
+
+    for precision in args.precision:
+        model = DenseModel.from_h5(args.weights, precision)
+        out = out_dir / f"{args.weights.stem}.{precision}.npz"
+        model.save_npz(out)
+
+        max_delta, changed = 0.0, []
+        for name, x in features.items():
+            scores = boundary_scores(model.predict(x))
+            max_delta = max(max_delta, float(np.abs(scores - ref_scores[name]).max()))
+            before = {lb for lb, _, _ in ref_calls[name]}
+            after = {lb for lb, _, _ in call_boundaries(scores, args.cutoff)}
+            changed += [f"{name}:{'-' if lb in before else '+'}{lb}" for lb in sorted(before ^ after)]
+        print(f"{precision:9s} {model.nbytes / 2**20:7.1f} MiB  max |d score| {max_delta:.2e}  "
+              f"changed calls {len(changed)}{': ' + ' '.join(changed) if changed else ''}  -> {out}")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Caps the depth of a target's alignment by sequence identity to the query.
+
+Reads target.msa (as written by aln.py) and target.fasta. For every aligned
+row it counts the gaps, the matches to the query and the aligned (non-gap)
+columns, and its identity, matches / aligned. When there are at least
+--max-rows rows, only those with an identity above that of the
+(--max-rows + 1)-th best are kept, as bin/archive/si.py did. Writes the kept
+rows to target.aln (the CCMpred input) and their statistics to target.sim,
+and with --msa rewrites target.msa with them too, so bin/feature sees the
+same depth.
+
+The alignment is read twice, --chunk rows at a time as uint8 matrices, and the
+counts are array operations over a chunk. The first pass keeps only the
+identity of each row, whose cut is found with a partial sort; the second
+writes the rows above it. Memory is thus a chunk plus 8 bytes per row.
+"""
+
+import os
+import sys
+import argparse
+import itertools
+
+import numpy as np
+
+
+GAP = ord('-')
+
+def read_query(fastafile):
+    """The query sequence of a single sequence fasta file, as bytes."""
+    with open(fastafile, 'rb') as fp:
+        _ = next(fp)
+        return b''.join(line.strip() for line in fp)
+
+def read_msa(msafile, N, chunk=65536, verbose=True):
+    """Aligned rows of an .msa file, `chunk` rows at a time. Rows of another length are
+    skipped, and counted on stderr if `verbose`.
+    yields:
+        :(titles, rows) - the header lines (with '>') and a (rows, N) uint8 matrix of the sequences
+    """
+    titles, sequences, skipped = [], [], 0
+    with open(msafile, 'rb') as handle:
+        for is_header, group in itertools.groupby(handle, key=lambda line: line.startswith(b'>')):
+            if is_header:
+                *_, title = group
+                continue
+            sequence = b''.join(line.strip() for line in group)
+            if len(sequence) != N:
+                skipped += 1
+                continue
+            titles.append(title.rstrip(b'\r\n'))
+            sequences.append(sequence)
+            if len(sequences) == chunk:
+                yield titles, np.frombuffer(b''.join(sequences), dtype=np.uint8).reshape(-1, N)
+                titles, sequences = [], []
+    if sequences:
+        yield titles, np.frombuffer(b''.join(sequences), dtype=np.uint8).reshape(-1, N)
+    if skipped and verbose:
+        print(f"[si]: Skipped {skipped} rows whose length is not {N}.", file=sys.stderr)
+
+def identity(query, rows):
+    """Gap, match and aligned counts of the rows and their identity to the query.
+    returns:
+        :si, gaps, matches, aligned (arrays) - si is 0 for rows that are all gaps
+    """
+    gap = rows == GAP
+    gaps = gap.sum(axis=1)
+    matches = ((rows == query) & ~gap).sum(axis=1)
+    aligned = rows.shape[1] - gaps
+    si = np.divide(matches, aligned, out=np.zeros(len(rows)), where=aligned > 0)
+    return si, gaps, matches, aligned
+
+def identity_cut(si, max_rows):
+    """Identity of the (max_rows + 1)-th best row; rows must score above it to be kept.
+    0.0 when there are no more than max_rows rows."""
+    if max_rows < 0 or len(si) <= max_rows:
+        return 0.0
+    # k-th largest by a partial sort rather than a full one
+    return float(-np.partition(-si, max_rows)[max_rows])
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("target", help="Target path without extension (target.msa, target.fasta).")
+    parser.add_argument("-n", "--max-rows", dest="max_rows", type=int, default=10000,
+                        help="Alignment depth above which rows are cut by identity. (default = 10000)")
+    parser.add_argument("--min-coverage", dest="min_coverage", type=float, default=0.0,
+                        help="Also drop rows aligned to less than this fraction of the query. (default = 0)")
+    parser.add_argument("--msa", action='store_true', default=False,
+                        help="Rewrite target.msa with the kept rows as well. (default = False)")
+    parser.add_argument("--chunk", type=int, default=65536,
+                        help="Rows encoded at a time; bounds the memory. (default = 65536)")
+    return parser.parse_args()
+
+def main():
+    args = arguments()
+    target = args.target
+    query = read_query(target + '.fasta')
+    N = len(query)
+    query = np.frombuffer(query, dtype=np.uint8)
+
+    # the depth is capped among the rows that cover enough of the query
+    nrows, covered_si = 0, []
+    for _, rows in read_msa(target + '.msa', N, args.chunk):
+        chunk_si, _, _, aligned = identity(query, rows)
+        nrows += len(rows)
+        covered_si.append(chunk_si[aligned >= args.min_coverage * N])
+    si_cut = identity_cut(np.concatenate(covered_si or [np.zeros(0)]), args.max_rows)
+    del covered_si
+
+    count = 0
+    newline = np.full((1, 1), ord('\n'), dtype=np.uint8)
+    with open(target + '.aln', 'wb') as aln, open(target + '.sim', 'w') as sim, \
+         open(target + '.msa.tmp' if args.msa else os.devnull, 'wb') as msa:
+        for titles, rows in read_msa(target + '.msa', N, args.chunk, verbose=False):
+            chunk_si, gaps, matches, aligned = identity(query, rows)
+            kept = np.flatnonzero((chunk_si > si_cut) & (aligned >= args.min_coverage * N))
+            count += len(kept)
+            lines = np.hstack([rows[kept], np.repeat(newline, len(kept), axis=0)])
+            aln.write(lines.tobytes())
+            sim.write("".join(f"{titles[i].decode()} {chunk_si[i]} {gaps[i]} {matches[i]} {aligned[i]}\n"
+                              for i in kept))
+            if args.msa:
+                msa.write(b"".join(titles[i] + b'\n' + line.tobytes() for i, line in zip(kept, lines)))
+    if args.msa:
+        os.replace(target + '.msa.tmp', target + '.msa')
+
+    print(count, nrows, si_cut)
+
+if __name__ == '__main__':
+    main()
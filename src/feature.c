@@ -13,13 +13,19 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <stdint.h>
 #include <math.h>
 #include <time.h>
 #include <omp.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 
 int maxline=2000 ;
 char seqcode1[]="-ARNDCQEGHILKMFPSTWYVX" ;
 int Ntype=21;
+unsigned char seqindex[256];
 
 char *cstring(int n1)
 {
@@ -42,6 +48,20 @@ double *darray1(int n1)
 	return arr;
 }
 
+unsigned char **ucarray2(int n1, int n2)
+{
+	int i;
+	unsigned char **arr;
+
+	arr=(unsigned char **) malloc(n1 *sizeof(unsigned char*));
+	arr[0]=(unsigned char *) malloc((size_t) n1*n2*sizeof(unsigned char));
+	for(i=1;i<n1;i++)
+    {
+        arr[i]=arr[i-1]+n2;
+    }
+	return arr;
+}
+
 int **iarray2(int n1, int n2)
 {
 	int i;
@@ -69,6 +89,37 @@ double **darray2(int n1, int n2)
 	return arr;
 }
 
+// resize an array from ucarray2/iarray2 to n1 rows, keeping its contents
+unsigned char **grow_ucarray2(unsigned char **arr, int n1, int n2)
+{
+	int i;
+	unsigned char *data;
+
+	data=(unsigned char *) realloc(arr[0], (size_t) n1*n2*sizeof(unsigned char));
+	arr=(unsigned char **) realloc(arr, n1*sizeof(unsigned char*));
+	arr[0]=data;
+	for(i=1;i<n1;i++)
+    {
+        arr[i]=arr[i-1]+n2;
+    }
+	return arr;
+}
+
+int **grow_iarray2(int **arr, int n1, int n2)
+{
+	int i;
+	int *data;
+
+	data=(int *) realloc(arr[0], (size_t) n1*n2*sizeof(int));
+	arr=(int **) realloc(arr, n1*sizeof(int*));
+	arr[0]=data;
+	for(i=1;i<n1;i++)
+    {
+        arr[i]=arr[i-1]+n2;
+    }
+	return arr;
+}
+
 int ****iarray4(int n1, int n2, int n3, int n4)
 {
     int i,j,k ;
@@ -123,6 +174,12 @@ void free_darray1(double *arr)
     free(arr);
 }
 
+void free_ucarray2(unsigned char **arr)
+{
+    free(arr[0]);
+    free(arr);
+}
+
 void free_iarray2(int **arr)
 {
     free(arr[0]);
@@ -153,36 +210,66 @@ void print_time(time_t time_0)
     running_time = time_now - time_0   ;   
     printf("h : %ld m : %ld s : %ld \n" , running_time/3600, (running_time/60)%60, running_time%60);}
 
+// residue letter -> index into seqcode1, anything unknown -> Ntype (X)
+void init_seqindex()
+{
+    int j;
+
+    for(j=0;j<256;j++)
+    {
+        seqindex[j]=Ntype;
+    }
+    for(j=0;j<Ntype;j++)
+    {
+        seqindex[(unsigned char) seqcode1[j]]=j;
+    }
+}
+
+// strip the trailing newline from a line read with getline
+int chomp(char *line, int len)
+{
+    while((len>0)&&((line[len-1]=='\n')||(line[len-1]=='\r')))
+    {
+        len-=1;
+    }
+    line[len]='\0';
+    return len;
+}
+
 char *read_seq(char *target, int *Nres )
 {
     FILE *fp;
     char filename[1000];
-    char line[maxline];
-    char line2[maxline];
+    char *line=NULL;
+    size_t nline=0;
     char *seq;
-    int i,j,Nres_temp;
+    int Nres_temp, Nmax;
     int Nchar;
-    char *eof;
-    strcpy(line,"");
-    strcpy(line2,"");
 
     sprintf(filename,"%s.fasta",target);
     fp=fopen(filename, "r");
-    while(fgets(line,maxline,fp)!=NULL)
+
+    Nres_temp=0;
+    Nmax=maxline;
+    seq=cstring(Nmax+1);
+    while((Nchar=getline(&line,&nline,fp))!=-1)
     {
         if(line[0]!='>')
         {
-            Nchar=strlen(line)-1;
-            strncat(line2,line,Nchar);
+            Nchar=chomp(line,Nchar);
+            if(Nres_temp+Nchar>Nmax)
+            {
+                Nmax=2*(Nres_temp+Nchar);
+                seq=(char *) realloc(seq,Nmax+1);
+            }
+            memcpy(seq+Nres_temp,line,Nchar);
+            Nres_temp+=Nchar;
         }
     }
     fclose(fp) ;
+    free(line);
 
-    Nres_temp=strlen(line2) ;
     *Nres=Nres_temp;
-
-    seq=cstring(Nres_temp+1);
-    strncpy(seq,line2,Nres_temp);
     seq[Nres_temp]='\0';
 
     return seq ;
@@ -191,20 +278,13 @@ char *read_seq(char *target, int *Nres )
 
 int *mod_seq(char *seq, int Nres)
 {
-    int i,j;
+    int i;
     int *seqn;
 
     seqn=iarray1(Nres);
     for(i=0;i<Nres;i++)
     {
-        for(j=0;j<=Ntype;j++)
-        {
-            if(seq[i]==seqcode1[j] || j==Ntype)
-            {
-                seqn[i]=j;
-                break ;
-            }
-        }
+        seqn[i]=seqindex[(unsigned char) seq[i]];
     }
 
     return seqn ;
@@ -355,235 +435,643 @@ void find_inifin(char line[], int *ini, int *fin)
 
 }
 
-int find_Nmsa(char *target) {
-    FILE *fp;
-    char filename[1000];
-    char line[maxline];
-    int k;
+// sorts the segments of one msa row by ini and merges overlapping or
+// touching segments, so that each merged segment is one covered run.
+int merge_inifin(int **seg, int Nseg)
+{
+    int p,q;
+    int ini, fin;
 
-    sprintf(filename,"%s.msa",target);
-    fp=fopen(filename, "r");
-    k=0;
-    while(fgets(line,maxline,fp)!=NULL) {
-        if(line[0]=='>') {
-            k+=1;
+    for(p=1;p<Nseg;p++) {
+        ini=seg[p][0];
+        fin=seg[p][1];
+        for(q=p-1;q>=0 && seg[q][0]>ini;q--) {
+            seg[q+1][0]=seg[q][0];
+            seg[q+1][1]=seg[q][1];
         }
+        seg[q+1][0]=ini;
+        seg[q+1][1]=fin;
     }
 
-    fclose(fp);
+    q=0;
+    for(p=1;p<Nseg;p++) {
+        if(seg[p][0]<=seg[q][1]+1) {
+            if(seg[p][1]>seg[q][1]) {
+                seg[q][1]=seg[p][1];
+            }
+        } else {
+            q+=1;
+            seg[q][0]=seg[p][0];
+            seg[q][1]=seg[p][1];
+        }
+    }
 
-    return k;
+    if(Nseg==0) {
+        return 0;
+    }
+    return q+1;
 }
 
-void read_msa(char *target, int **msa, int **msa2, int *pasinfo, int Nres, int Nmsa)
+// upper bound on the number of /ini-fin segments in a header line
+int count_inifin(char *line)
 {
-    FILE *fp;
-    char filename[1000];
-    char line[maxline];
-    int i,j,k, l;
+    int n;
+
+    n=0;
+    for(;*line;line++) {
+        if((*line=='/')||(*line==',')) {
+            n+=1;
+        }
+    }
+    return n;
+}
+
+// parses the /ini-fin,ini-fin segments of an msa header into seg, 0-based,
+// clipped to the query and merged; returns their number. seg needs room
+// for count_inifin(line) segments. Safe to call from several threads.
+int parse_msa_header(char *line, int **seg, int Nres, int *pas)
+{
+    int Nseg;
     int ini, fin;
-    char *ptr;
+    char *ptr, *save;
     char delim[]="/,";
-    char inifin[10];
-    
+
+    Nseg=0;
+    ini=0;
+    fin=0;
+    ptr=strtok_r(line,delim,&save);
+    while((ptr=strtok_r(NULL,delim,&save))) {
+        find_inifin(ptr,&ini,&fin); 
+
+        seg[Nseg][0]=ini-1;
+        seg[Nseg][1]=fin-1;
+        if(seg[Nseg][0]<0) {
+            seg[Nseg][0]=0;
+        }
+        if(seg[Nseg][1]>Nres-1) {
+            seg[Nseg][1]=Nres-1;
+        }
+        if(seg[Nseg][0]<=seg[Nseg][1]) {
+            Nseg+=1;
+        }
+    }
+
+    if((ini>20)||(fin<=Nres-20)) {
+        *pas=1;
+    } else {
+        *pas=0;
+    }
+
+    return merge_inifin(seg,Nseg);
+}
+
+// reads the .msa in one pass. Residues are kept as seqcode1 indices in
+// msa[Nmsa][Nres] (one byte each) and the coverage of every row as its
+// merged header segments seg[segptr[k]..segptr[k+1]-1] = {ini, fin}, 0-based.
+// The arrays grow as headers are read, so Nmsa is known only at the end.
+unsigned char **read_msa(char *target, int Nres, int *Nmsa, int **segptr, int ***seg, int **pasinfo)
+{
+    FILE *fp;
+    char filename[1000];
+    char *line=NULL;
+    size_t nline=0;
+    int i,k, l;
+    int len;
+    int Nseg, Nmax, Nsegmax;
+    unsigned char **msa;
+    int **sg;
+
+    Nmax=1024;
+    Nsegmax=1024;
+    msa=ucarray2(Nmax,Nres+1);
+    sg=iarray2(Nsegmax,2);
+    *segptr=iarray1(Nmax+1);
+    *pasinfo=iarray1(Nmax+1);
+
     sprintf(filename,"%s.msa",target);
     fp=fopen(filename, "r");
     k=-1;
+    l=0;
+    Nseg=0;
 
-    while(fgets(line,maxline,fp)!=NULL) {
+    while((len=getline(&line,&nline,fp))!=-1) {
+        len=chomp(line,len);
         if(line[0]=='>') {
             k+=1;
-            for(i=0;i<Nres;i++) {
-                msa2[k][i]=0;
+            l=0;
+            if(k+1>=Nmax) {
+                Nmax*=2;
+                msa=grow_ucarray2(msa,Nmax,Nres+1);
+                *segptr=(int *) realloc(*segptr,(Nmax+1)*sizeof(int));
+                *pasinfo=(int *) realloc(*pasinfo,(Nmax+1)*sizeof(int));
             }
-
-            ptr=strtok(line,delim);
-            while(ptr=strtok(NULL,delim)) {
-                strcpy(inifin,ptr);
-
-                find_inifin(inifin,&ini,&fin); 
-                for(i=ini-1;i<=fin-1;i++) {
-                    msa2[k][i]=1;
-                }
+            while(Nseg+count_inifin(line)>=Nsegmax) {
+                Nsegmax*=2;
+                sg=grow_iarray2(sg,Nsegmax,2);
             }
+            memset(msa[k],Ntype,Nres);
 
-            if((ini>20)||(fin<=Nres-20)) {
-                pasinfo[k]=1;
-
-            } else {
-                pasinfo[k]=0;
-            }
+            (*segptr)[k]=Nseg;
+            Nseg+=parse_msa_header(line,sg+Nseg,Nres,&(*pasinfo)[k]);
             continue;
         }
-        for(i=0;i<Nres;i++) {
-            for(j=0;j<=Ntype;j++) {
-                if(line[i]==seqcode1[j] || j==Ntype) {
-                    msa[k][i]=j;
-                    break ;
-                }
-            }
+        if(k<0) {
+            continue;
+        }
+        for(i=0;(i<len)&&(l<Nres);i++,l++) {
+            msa[k][l]=seqindex[(unsigned char) line[i]];
         }
-
     }
     fclose(fp);
-} 
+    free(line);
 
+    (*segptr)[k+1]=Nseg;
+    *seg=sg;
+    *Nmsa=k+1;
 
-double **gen_profile(int **msa, int Nres, int Nmsa)
-{
-    int i,j,k;
+    return msa;
+} 
 
-    double **profile;
-    int **frequency;
-    int type;
 
+// -profile msa: a PSI-BLAST style profile from the .msa, in place of the
+// .ck2 of a separate PSI-BLAST search. Rows carry Henikoff position-based
+// weights: the mean over a row's residues of 1/(r*s), r the number of
+// residue types in the column and s the number of rows with that residue.
+// The weighted column frequencies f are mixed with the pseudocounts
+// g(a)=sum_b f(b)q(a|b) of the qij target frequencies as
+// (alpha*f+beta*g)/(alpha+beta), alpha the mean r over the columns minus 1.
+// Columns without residues take q(.|query residue), as mkchk2.py does for
+// empty .chk rows. The rows are read twice, for the column counts and for
+// the weighted counts, so -stream can make both passes chunk by chunk.
 
-    profile=darray2(Nres,Ntype);
-    frequency=iarray2(Nres,Ntype);
+char seqcode_ck2[]="ACDEFGHIKLMNPQRSTVWY";
 
-    #pragma omp parallel for private(i,j)
-    for(i=0;i<Nres;i++) {
-        for(j=0;j<Ntype;j++) {
-            frequency[i][j]=0;
-        }
-    }
+// qij as q[a][b]=q(b|a), a and b seqcode1 indices 1..20: the lower triangle
+// of the joint target frequencies in seqcode1 order, rows normalized.
+double **read_qij(char *filename)
+{
+    FILE *fp;
+    double **qij;
+    double sum;
+    int a,b;
 
-    #pragma omp parallel for private(i,k,type)
-    for(i=0;i<Nres;i++) { 
-        for(k=0;k<Nmsa;k++) {
-            type=msa[k][i];
-            if(type<Ntype) {
-                frequency[i][type]+=1;
+    fp=fopen(filename, "r");
+    if(fp==NULL)
+    {
+        printf("[feature] cannot read qij %s\n",filename);
+        abort();
+    }
+    qij=darray2(Ntype,Ntype);
+    for(a=1;a<Ntype;a++)
+    {
+        for(b=1;b<=a;b++)
+        {
+            if(fscanf(fp,"%lf",&qij[a][b])!=1)
+            {
+                printf("[feature] %s is not a 20x20 lower triangle\n",filename);
+                abort();
             }
+            qij[b][a]=qij[a][b];
         }
     }
+    fclose(fp);
 
-    #pragma omp parallel for private(i,j)
-    for(i=0;i<Nres;i++) {
-        for(j=0;j<Ntype;j++) {
-            profile[i][j]=(double) frequency[i][j] /(double) Nmsa;
+    for(a=1;a<Ntype;a++)
+    {
+        sum=0.0;
+        for(b=1;b<Ntype;b++)
+        {
+            sum+=qij[a][b];
+        }
+        for(b=1;b<Ntype;b++)
+        {
+            qij[a][b]=qij[a][b]/sum;
         }
     }
-
-    free_iarray2(frequency);
-    return profile;
+    return qij;
 }
 
-double **read_profile(char *target, int Nres)
+// reads the next rows of an open .msa into rows[0..Nchunk-1] as seqcode1
+// indices, like read_msa; returns their number. A header read past the end
+// of a full chunk is carried to the next call by *started.
+int read_msa_chunk(FILE *fp, char **line, size_t *nline, unsigned char **rows, int Nres, int Nchunk, int *started)
 {
-
-    FILE *fp;
-    char filename[1000];
-    char line[maxline];
-    char *ptr;
-
-    double **profile;
-    int i,j,k, m;
-    char delim[]=" ";
-    int Nres2;
-    char seq2[maxline];
-
-    profile=darray2(Nres,Ntype);
-   
-    sprintf(filename,"%s.ck2",target);
-    fp=fopen(filename, "r");
-
-    fgets(line,maxline,fp);
-    Nres2=atoi(line);
-    fgets(line,maxline,fp);
-    strncat(seq2,line,Nres2);
+    int i,k,l;
+    int len;
 
     k=-1;
-
-    while(fgets(line,maxline,fp)!=NULL) {
-        k+=1;
-        profile[k][0]=0.0;
-        m=0;
-
-        ptr=strtok(line,delim);
-        m+=1;
-        profile[k][m]=atof(ptr);
-//        printf("%s ",ptr);
-        while(ptr=strtok(NULL,delim)) {
-            m+=1;
-            profile[k][m]=atof(ptr);
-//            printf("%s ",ptr);
+    l=0;
+    if(*started)
+    {
+        k=0;
+        memset(rows[0],Ntype,Nres);
+        *started=0;
+    }
+    while((len=getline(line,nline,fp))!=-1)
+    {
+        len=chomp(*line,len);
+        if((*line)[0]=='>')
+        {
+            if(k+1==Nchunk)
+            {
+                *started=1;
+                break;
+            }
+            k+=1;
+            l=0;
+            memset(rows[k],Ntype,Nres);
+            continue;
+        }
+        if(k<0)
+        {
+            continue;
+        }
+        for(i=0;(i<len)&&(l<Nres);i++,l++)
+        {
+            rows[k][l]=seqindex[(unsigned char) (*line)[i]];
         }
-//        printf("\n");
     }
-//    for(i=0;i<Nres;i++)
-//    {
-//        for(m=0;m<Ntype;m++)
-//        {
-//            printf("%6.4f ", profile[i][m]);
-//        }
-//        printf("\n");
-//    }
-    return profile;
+    return k+1;
 }
 
-
-
-void get_n_signal(int **msa2, double **msig5, double **psig5, int **Nsite, int Nres, int Nmsa)
+// first pass: residue counts count[i][a] of rows[0..n-1], column by column
+void add_profile_count(unsigned char **rows, int n, int Nres, int **count)
 {
+    int i,k, type;
 
-    int i,j,k,l;
-    int ini, fin;
-    int **Nsig, **Nsig5;
-    int maxsig5[3];
-    double sum[3], sum2[3];
-    double ave[3],ave2[3],sigma[3];
-    int ggap;
-
-    Nsig=iarray2(Nres,3);
-    Nsig5=iarray2(Nres,3);
-
-    #pragma omp parallel for private(i,j)
-    for(i=0;i<Nres;i++) {
-        for(j=0;j<=2;j++) {
-            Nsig[i][j]=0;
-            Nsig5[i][j]=0;
-            Nsite[i][j]=0;
-            msig5[i][j]=0.0;
-            psig5[i][j]=0.0;
+    #pragma omp parallel for private(i,k,type)
+    for(i=0;i<Nres;i++)
+    {
+        for(k=0;k<n;k++)
+        {
+            type=rows[k][i];
+            if((type>0)&&(type<Ntype))
+            {
+                count[i][type]+=1;
+            }
         }
     }
+}
 
-//Nsig[i][0]: left_gap &right_gap
-//Nsig[i][1]: left_gap 
-//Nsig[i][2]: right_gap
+// second pass: the Henikoff weights of rows[0..n-1] from the complete counts
+// and ntype[i], the number of residue types in column i, added to wcount
+void add_profile_weight(unsigned char **rows, int n, int Nres, int **count, int *ntype, double **wcount, double *weight)
+{
+    int i,k, type, L;
+    double w;
 
-    #pragma omp parallel for private(i,k)
-    for(i=1;i<Nres-1;i++) {
-        for(k=0;k<Nmsa;k++) {
-            if((msa2[k][i-1]==0)&&(msa2[k][i]==1)) {
-                Nsig[i][0]+=1;
-                Nsig[i][1]+=1;
-            }
-            else if((msa2[k][i]==1)&&(msa2[k][i+1]==0)) {
-                Nsig[i][0]+=1;
-                Nsig[i][2]+=1;
+    #pragma omp parallel for private(i,k,type,w,L)
+    for(k=0;k<n;k++)
+    {
+        w=0.0;
+        L=0;
+        for(i=0;i<Nres;i++)
+        {
+            type=rows[k][i];
+            if((type>0)&&(type<Ntype))
+            {
+                w+=1.0/(double) (ntype[i]*count[i][type]);
+                L+=1;
             }
         }
+        weight[k]=(L>0) ? w/(double) L : 0.0;
     }
 
-    #pragma omp parallel for private(i,j,ini,fin,l)
-    for(i=0;i<Nres;i++) {
-        ini=-5;
-        fin=5;
-        if(i<5) {
-            ini=-i;
-            Nsite[i][0]+=(5-i);
-            Nsite[i][1]+=(5-i);
+    #pragma omp parallel for private(i,k,type)
+    for(i=0;i<Nres;i++)
+    {
+        for(k=0;k<n;k++)
+        {
+            type=rows[k][i];
+            if((type>0)&&(type<Ntype))
+            {
+                wcount[i][type]+=weight[k];
+            }
         }
+    }
+}
 
-        if(i>Nres-6) {
-            fin=Nres-i-1;
-            Nsite[i][0]+=(i-(Nres-6));
-            Nsite[i][2]+=(i-(Nres-6));
+int *count_types(int **count, int Nres)
+{
+    int i,a;
+    int *ntype;
 
+    ntype=iarray1(Nres);
+    for(i=0;i<Nres;i++)
+    {
+        ntype[i]=0;
+        for(a=1;a<Ntype;a++)
+        {
+            if(count[i][a]>0)
+            {
+                ntype[i]+=1;
+            }
         }
-//            printf("i:%d ini:%d fin:%d \n",i,ini,fin);
+    }
+    return ntype;
+}
+
+// the profile from the weighted counts, in the layout of read_profile:
+// profile[i][0]=0 and profile[i][1..20] in .ck2 (seqcode_ck2) order,
+// rounded to the %6.4f of a .ck2
+double **finish_profile(double **wcount, int *ntype, int *seqn, int Nres, double **qij, double beta)
+{
+    double **profile;
+    double f[32], g[32];
+    double alpha, total;
+    int col[32];
+    int i,a,b, Ncol, query;
+    char value[32];
+
+    for(a=1;a<Ntype;a++)
+    {
+        col[a]=1+(int) (strchr(seqcode_ck2,seqcode1[a])-seqcode_ck2);
+    }
+
+    alpha=0.0;
+    Ncol=0;
+    for(i=0;i<Nres;i++)
+    {
+        if(ntype[i]>0)
+        {
+            alpha+=ntype[i];
+            Ncol+=1;
+        }
+    }
+    alpha=(Ncol>0) ? alpha/(double) Ncol-1.0 : 0.0;
+
+    profile=darray2(Nres,Ntype);
+    #pragma omp parallel for private(i,a,b,f,g,total,query,value)
+    for(i=0;i<Nres;i++)
+    {
+        total=0.0;
+        for(a=1;a<Ntype;a++)
+        {
+            total+=wcount[i][a];
+        }
+        profile[i][0]=0.0;
+        for(a=1;a<Ntype;a++)
+        {
+            if(total>0.0)
+            {
+                f[a]=wcount[i][a]/total;
+            }
+        }
+        for(a=1;a<Ntype;a++)
+        {
+            if(total<=0.0)
+            {
+                query=((seqn[i]>0)&&(seqn[i]<Ntype)) ? seqn[i] : 1;
+                g[a]=qij[query][a];
+                continue;
+            }
+            g[a]=0.0;
+            for(b=1;b<Ntype;b++)
+            {
+                g[a]+=f[b]*qij[b][a];
+            }
+            if(alpha+beta>0.0)
+            {
+                g[a]=(alpha*f[a]+beta*g[a])/(alpha+beta);
+            }
+            else
+            {
+                g[a]=f[a];
+            }
+        }
+        for(a=1;a<Ntype;a++)
+        {
+            sprintf(value,"%6.4f",g[a]);
+            profile[i][col[a]]=atof(value);
+        }
+    }
+    return profile;
+}
+
+// -profile msa over the msa read by read_msa
+double **gen_profile(unsigned char **msa, int Nres, int Nmsa, int *seqn, double **qij, double beta)
+{
+    int **count;
+    int *ntype;
+    double **wcount;
+    double *weight;
+    double **profile;
+
+    count=iarray2(Nres,Ntype);
+    wcount=darray2(Nres,Ntype);
+    memset(count[0],0,(size_t) Nres*Ntype*sizeof(int));
+    memset(wcount[0],0,(size_t) Nres*Ntype*sizeof(double));
+    weight=darray1(Nmsa+1);
+
+    add_profile_count(msa,Nmsa,Nres,count);
+    ntype=count_types(count,Nres);
+    add_profile_weight(msa,Nmsa,Nres,count,ntype,wcount,weight);
+    profile=finish_profile(wcount,ntype,seqn,Nres,qij,beta);
+
+    free_iarray2(count);
+    free_darray2(wcount);
+    free_iarray1(ntype);
+    free_darray1(weight);
+    return profile;
+}
+
+// -profile msa with -stream: both passes read the .msa Nchunk rows at a time
+double **stream_profile(char *target, int Nres, int Nchunk, int *seqn, double **qij, double beta)
+{
+    FILE *fp;
+    char filename[1000];
+    char *line=NULL;
+    size_t nline=0;
+    unsigned char **rows;
+    int **count;
+    int *ntype;
+    double **wcount;
+    double *weight;
+    double **profile;
+    int n, pass, started;
+
+    count=iarray2(Nres,Ntype);
+    wcount=darray2(Nres,Ntype);
+    memset(count[0],0,(size_t) Nres*Ntype*sizeof(int));
+    memset(wcount[0],0,(size_t) Nres*Ntype*sizeof(double));
+    rows=ucarray2(Nchunk,Nres+1);
+    weight=darray1(Nchunk);
+    ntype=NULL;
+
+    sprintf(filename,"%s.msa",target);
+    for(pass=0;pass<2;pass++)
+    {
+        fp=fopen(filename, "r");
+        started=0;
+        while((n=read_msa_chunk(fp,&line,&nline,rows,Nres,Nchunk,&started))>0)
+        {
+            if(pass==0)
+            {
+                add_profile_count(rows,n,Nres,count);
+            }
+            else
+            {
+                add_profile_weight(rows,n,Nres,count,ntype,wcount,weight);
+            }
+        }
+        fclose(fp);
+        if(pass==0)
+        {
+            ntype=count_types(count,Nres);
+        }
+    }
+    free(line);
+    profile=finish_profile(wcount,ntype,seqn,Nres,qij,beta);
+
+    free_ucarray2(rows);
+    free_iarray2(count);
+    free_darray2(wcount);
+    free_iarray1(ntype);
+    free_darray1(weight);
+    return profile;
+}
+
+// writes a profile in the .ck2 format of mkchk2.py
+void write_profile(double **profile, char *seq, int Nres, char *filename)
+{
+    FILE *fp;
+    int i,m;
+
+    fp=fopen(filename, "w");
+    fprintf(fp,"%d\n%s\n",Nres,seq);
+    for(i=0;i<Nres;i++)
+    {
+        for(m=1;m<Ntype;m++)
+        {
+            fprintf(fp,"%6.4f ",profile[i][m]);
+        }
+        fprintf(fp,"\n");
+    }
+    fclose(fp);
+}
+
+double **read_profile(char *target, int Nres)
+{
+
+    FILE *fp;
+    char filename[1000];
+    char *line=NULL;
+    size_t nline=0;
+    char *ptr;
+
+    double **profile;
+    int i,j,k, m;
+    char delim[]=" \r\n";
+
+    profile=darray2(Nres,Ntype);
+   
+    sprintf(filename,"%s.ck2",target);
+    fp=fopen(filename, "r");
+
+    getline(&line,&nline,fp);
+    getline(&line,&nline,fp);
+
+    k=-1;
+
+    while((k+1<Nres)&&(getline(&line,&nline,fp)!=-1)) {
+        k+=1;
+        profile[k][0]=0.0;
+        m=0;
+
+        ptr=strtok(line,delim);
+        m+=1;
+        profile[k][m]=atof(ptr);
+//        printf("%s ",ptr);
+        while((m+1<Ntype)&&(ptr=strtok(NULL,delim))) {
+            m+=1;
+            profile[k][m]=atof(ptr);
+//            printf("%s ",ptr);
+        }
+//        printf("\n");
+    }
+    fclose(fp);
+    free(line);
+//    for(i=0;i<Nres;i++)
+//    {
+//        for(m=0;m<Ntype;m++)
+//        {
+//            printf("%6.4f ", profile[i][m]);
+//        }
+//        printf("\n");
+//    }
+    return profile;
+}
+
+
+
+//Nsig[i][0]: left_gap &right_gap
+//Nsig[i][1]: left_gap 
+//Nsig[i][2]: right_gap
+// a gap/residue edge at i is the start or the end of a merged header
+// segment, so the counts come from the segment endpoints (the difference
+// array of each row's coverage) rather than from a scan of the msa.
+// A one-residue segment only counts as a left edge, as before.
+void add_n_signal(int **Nsig, int *segptr, int **seg, int Nres, int Nmsa)
+{
+    int k, p;
+    int ini, fin;
+
+    for(k=0;k<Nmsa;k++) {
+        for(p=segptr[k];p<segptr[k+1];p++) {
+            ini=seg[p][0];
+            fin=seg[p][1];
+            if((ini>=1)&&(ini<=Nres-2)) {
+                Nsig[ini][0]+=1;
+                Nsig[ini][1]+=1;
+            }
+            if((fin>=1)&&(fin<=Nres-2)&&(fin!=ini)) {
+                Nsig[fin][0]+=1;
+                Nsig[fin][2]+=1;
+            }
+        }
+    }
+}
+
+void get_n_signal(int **Nsig, double **msig5, double **psig5, int **Nsite, int Nres, int Nmsa)
+{
+
+    int i,j,l;
+    int ini, fin;
+    int **Nsig5;
+    int maxsig5[3];
+    double sum[3], sum2[3];
+    double ave[3],ave2[3],sigma[3];
+    int ggap;
+
+    Nsig5=iarray2(Nres,3);
+
+    #pragma omp parallel for private(i,j)
+    for(i=0;i<Nres;i++) {
+        for(j=0;j<=2;j++) {
+            Nsig5[i][j]=0;
+            Nsite[i][j]=0;
+            msig5[i][j]=0.0;
+            psig5[i][j]=0.0;
+        }
+    }
+
+    #pragma omp parallel for private(i,j,ini,fin,l)
+    for(i=0;i<Nres;i++) {
+        ini=-5;
+        fin=5;
+        if(i<5) {
+            ini=-i;
+            Nsite[i][0]+=(5-i);
+            Nsite[i][1]+=(5-i);
+        }
+
+        if(i>Nres-6) {
+            fin=Nres-i-1;
+            Nsite[i][0]+=(i-(Nres-6));
+            Nsite[i][2]+=(i-(Nres-6));
+
+        }
+//            printf("i:%d ini:%d fin:%d \n",i,ini,fin);
 
 
         for(l=ini;l<=fin;l++) {
@@ -603,9 +1091,6 @@ void get_n_signal(int **msa2, double **msig5, double **psig5, int **Nsite, int N
 //        printf("%d %d %d %d\n",i,Nsite[i][0],Nsite[i][1],Nsite[i][2]);
     }
 
-    free_iarray2(Nsig);
-
-
     ggap=20*Nres/100;
     if(ggap<60) {
         ggap=60;
@@ -647,75 +1132,73 @@ void get_n_signal(int **msa2, double **msig5, double **psig5, int **Nsite, int N
     return ;
 }
 
-void make_PAS(double **PAS, double **PAS2, double** PAS3, int **msa2, int *pasinfo, int Nres, int Nmsa,int Npasinfo)
+// co-coverage counts from the header segments: every msa row adds the
+// rectangles [ini_p,fin_p]x[ini_q,fin_q] of its segment pairs to the 2-D
+// difference array fc ((Nres+1)x(Nres+1), zeroed by the caller), and
+// sum_PAS_count turns it into fc[i][j], the number of rows covering both
+// i and j. O(Nmsa + Nres^2) instead of O(Nmsa Nres^2).
+void add_PAS_count(int **fc, int *segptr, int **seg, int *pasinfo, int Nres, int Nmsa)
 {
-    int ****fc ;
-    int **fs ;
-
-    int i,j,k, m,n;
-
-    fc=iarray4(Nres,Ntype+1,Nres,Ntype+1);
-    fs=iarray2(Nres,Ntype+1) ;
+    int k, p,q;
 
-    #pragma omp parallel for private(i,j,m,n)
-    for(i=0;i<Nres;i++)
+    for(k=0;k<Nmsa;k++)
     {
-        for(j=0;j<Nres;j++)
+        if(pasinfo[k]==0)
         {
-            PAS[i][j]=0.0;
-            PAS2[i][j]=0.0;
-            PAS3[i][j]=0.0;
+            continue ;
         }
-        for(m=0;m<Ntype;m++)
+        for(p=segptr[k];p<segptr[k+1];p++)
         {
-            fs[i][m]=0;
-            for(j=0;j<Nres;j++)
+            for(q=segptr[k];q<segptr[k+1];q++)
             {
-                for(n=0;n<Ntype;n++)
-                {
-                    fc[i][m][j][n]=0;
-                }
+                fc[seg[p][0]][seg[q][0]]+=1;
+                fc[seg[p][0]][seg[q][1]+1]-=1;
+                fc[seg[p][1]+1][seg[q][0]]-=1;
+                fc[seg[p][1]+1][seg[q][1]+1]+=1;
             }
         }
     }
+}
 
+void sum_PAS_count(int **fc, int Nres)
+{
+    int i,j;
 
-    for(k=0;k<Nmsa;k++)
+    #pragma omp parallel for private(i,j)
+    for(i=0;i<Nres;i++)
     {
-        if(pasinfo[k]==0)
+        for(j=1;j<Nres;j++)
         {
-            continue ;
+            fc[i][j]+=fc[i][j-1];
         }
-        #pragma omp parallel for private(i,j,m,n)
-        for(i=0;i<Nres;i++)
+    }
+
+    #pragma omp parallel for private(i,j)
+    for(j=0;j<Nres;j++)
+    {
+        for(i=1;i<Nres;i++)
         {
-            m=msa2[k][i] ;
-            fs[i][m]+=1 ;
-            for(j=i;j<Nres;j++)
-            {
-                n=msa2[k][j];
-                fc[i][m][j][n]+=1;
-            }
+            fc[i][j]+=fc[i-1][j];
         }
     }
+}
+
+void make_PAS(double **PAS, double **PAS2, double** PAS3, int **fc, int Nres, int Npasinfo)
+{
+    int i,j;
+    int both, none;
 
-    #pragma omp parallel for private(i,m,j,n)
+    #pragma omp parallel for private(i,j,both,none)
     for(i=0;i<Nres;i++)
     {
         for(j=i;j<Nres;j++)
         {
-            m=0;
-            n=0;
-            PAS[i][j] += (double) fc[i][m][j][n]/(double) Npasinfo;
-            PAS2[i][j] += (double) fc[i][m][j][n]/(double) Npasinfo;
-//            PAS[i][j] += (double) fc[i][m][j][n]/(double) Nmsa;
-//            PAS2[i][j] += (double) fc[i][m][j][n]/(double) Nmsa;
-            m=1;
-            n=1;
-            PAS[i][j] += (double) fc[i][m][j][n]/(double) Npasinfo;
-            PAS3[i][j] += (double) fc[i][m][j][n]/(double) Npasinfo;
-//            PAS[i][j] += (double) fc[i][m][j][n]/(double) Nmsa;
-//            PAS3[i][j] += (double) fc[i][m][j][n]/(double) Nmsa;    
+            both=fc[i][j];
+            none=Npasinfo-fc[i][i]-fc[j][j]+both;
+            PAS[i][j] = (double) none/(double) Npasinfo;
+            PAS2[i][j] = (double) none/(double) Npasinfo;
+            PAS[i][j] += (double) both/(double) Npasinfo;
+            PAS3[i][j] = (double) both/(double) Npasinfo;
         }
     }
 
@@ -729,8 +1212,124 @@ void make_PAS(double **PAS, double **PAS2, double** PAS3, int **msa2, int *pasin
             PAS3[j][i]=PAS3[i][j];    
         }
     }
-    free_iarray4(fc);
-    free_iarray2(fs);
+}
+
+
+// -stream: folds the .msa into the PAS and gap-signal counts chunk by chunk
+// instead of holding it in memory. Only the headers of Nchunk rows are kept
+// at a time; each chunk is parsed in parallel into per-row segments and
+// per-thread partial Nsig counts, and the segments are then folded serially
+// into the one shared difference array fc. Memory is bounded by Nres, not by
+// Nmsa or the thread count: the (Nres+1)x(Nres+1) fc of main, plus Nres x 3
+// Nsig per thread. Nsig and fc are zeroed by the caller.
+void stream_msa(char *target, int Nres, int Nchunk, int **Nsig, int **fc, int *Nmsa, int *Npasinfo)
+{
+    FILE *fp;
+    char filename[1000];
+    char *line=NULL;
+    size_t nline=0;
+    char **hdr;
+    int *nhdr, *nseg, *pas;
+    int i,j,k, n,t;
+    int len, Nthread, Npas;
+    int segptr[2];
+    int ***sg;
+    int ***Nsigp;
+
+    Nthread=omp_get_max_threads();
+    Nsigp=(int ***) malloc(Nthread*sizeof(int **));
+    Nsigp[0]=Nsig;
+    for(t=1;t<Nthread;t++)
+    {
+        Nsigp[t]=iarray2(Nres,3);
+        memset(Nsigp[t][0],0,Nres*3*sizeof(int));
+    }
+
+    hdr=(char **) malloc(Nchunk*sizeof(char *));
+    sg=(int ***) malloc(Nchunk*sizeof(int **));
+    nhdr=iarray1(Nchunk);
+    nseg=iarray1(Nchunk);
+    pas=iarray1(Nchunk);
+    for(n=0;n<Nchunk;n++)
+    {
+        hdr[n]=NULL;
+        nhdr[n]=0;
+    }
+
+    sprintf(filename,"%s.msa",target);
+    fp=fopen(filename, "r");
+    *Nmsa=0;
+    *Npasinfo=0;
+    n=0;
+    do
+    {
+        len=getline(&line,&nline,fp);
+        if((len!=-1)&&(line[0]=='>'))
+        {
+            len=chomp(line,len);
+            if(len+1>nhdr[n])
+            {
+                nhdr[n]=len+1;
+                hdr[n]=(char *) realloc(hdr[n],nhdr[n]);
+            }
+            memcpy(hdr[n],line,len+1);
+            n+=1;
+        }
+        if((n==Nchunk)||((len==-1)&&(n>0)))
+        {
+            #pragma omp parallel private(k,t,segptr)
+            {
+                t=omp_get_thread_num();
+                #pragma omp for schedule(static)
+                for(k=0;k<n;k++)
+                {
+                    sg[k]=iarray2(count_inifin(hdr[k])+1,2);
+                    segptr[0]=0;
+                    segptr[1]=parse_msa_header(hdr[k],sg[k],Nres,&pas[k]);
+                    nseg[k]=segptr[1];
+                    add_n_signal(Nsigp[t],segptr,sg[k],Nres,1);
+                }
+            }
+            // the rectangles of all rows go to the one fc, in row order
+            Npas=0;
+            for(k=0;k<n;k++)
+            {
+                segptr[0]=0;
+                segptr[1]=nseg[k];
+                add_PAS_count(fc,segptr,sg[k],&pas[k],Nres,1);
+                Npas+=pas[k];
+                free_iarray2(sg[k]);
+            }
+            *Nmsa+=n;
+            *Npasinfo+=Npas;
+            n=0;
+        }
+    } while(len!=-1);
+    fclose(fp);
+    free(line);
+
+    for(t=1;t<Nthread;t++)
+    {
+        #pragma omp parallel for private(i,j)
+        for(i=0;i<Nres;i++)
+        {
+            for(j=0;j<=2;j++)
+            {
+                Nsig[i][j]+=Nsigp[t][i][j];
+            }
+        }
+        free_iarray2(Nsigp[t]);
+    }
+    free(Nsigp);
+    for(n=0;n<Nchunk;n++)
+    {
+        free(hdr[n]);
+    }
+    free(hdr);
+    free(sg);
+    free_iarray1(nhdr);
+    free_iarray1(nseg);
+    free_iarray1(pas);
 }
 
 
@@ -909,161 +1508,596 @@ void sum_PAS2(double **PASaveN2, double **PASaveC2, double *PASmaxN, double *PAS
 
 }
 
-void write_PAS(double **PAS, char *out_PAS, int Nres) {
-    FILE *fp_PAS;
-    int i,j;
-
-    fp_PAS=fopen(out_PAS,"w");
+// covrow[j]=Npasinfo*PAS3[i][j] for the next row i of a sweep over the query:
+// row i of the co-coverage counts fc if they are given, otherwise from the
+// segments of the rows entering or leaving the sweep at i, whose coverage is
+// kept in the difference array diff.
+void sweep_covrow(int *covrow, int *diff, int **fc, int *evptr, int *evrow, int *segptr, int **seg, int i, int Nres)
+{
+    int j,k, e,q, d ;
 
-    for(i=0;i<Nres;i++) {
-        for(j=0;j<Nres;j++) {
-            fprintf(fp_PAS,"%4d %4d %8.6f\n", i+1,j+1,PAS[i][j]);
-        }
-    }
-
-    fclose(fp_PAS) ;
+    if(fc!=NULL)
+    {
+        for(j=0;j<Nres;j++)
+        {
+            covrow[j]=fc[i][j];
+        }
+        return ;
+    }
+    for(e=evptr[i];e<evptr[i+1];e++)
+    {
+        k=abs(evrow[e])-1;
+        d=(evrow[e]>0) ? 1 : -1;
+        for(q=segptr[k];q<segptr[k+1];q++)
+        {
+            diff[seg[q][0]]+=d;
+            diff[seg[q][1]+1]-=d;
+        }
+    }
+    covrow[0]=diff[0];
+    for(j=1;j<Nres;j++)
+    {
+        covrow[j]=covrow[j-1]+diff[j];
+    }
 }
 
-double **read_ccmpred(char *target, int Nres)
+// PASaveN/C, PASaveN2/C2 and PASmaxN/C straight from the header segments,
+// without the Nres x Nres PAS3 matrix. The rows of PAS3 are swept one at a
+// time as covrow/Npasinfo and added up in the very order sum_PAS and sum_PAS2
+// take them, so the features are the same to the last bit: row r is the ii=r
+// term of the windows of i=r-win..r+win, and a first sweep gives the column
+// sums sum_PAS2 starts its C-terminal averages from.
+// If the co-coverage counts fc from sum_PAS_count are given, their rows are
+// used as covrow instead and the segments are not needed.
+void stream_PAS(double **PASaveN, double **PASaveC, double **PASaveN2, double **PASaveC2, double *PASmaxN, double *PASmaxC, int **fc, int *segptr, int **seg, int *pasinfo, int Nres, int Nmsa, int Npasinfo, int win, int Nwin)
 {
+    int i,j,k, r, p ;
+    int ini, fin;
 
-    FILE *fp;
-    char filename[1000];
-    char line[maxline];
+    int *evptr, *evrow ;
+    int *diff, *covrow;
+    double *pre;
+    double *PASsumN, *PASsumC;
+    double *PASaveN5, *PASaveC5;
+    double PASsum, maxN, maxC;
 
-    double **ccmpred;
-    int i,j,k, m;
+    evptr= iarray1(Nres+2);
+    evrow= NULL;
+    diff= iarray1(Nres+1);
+    covrow= iarray1(Nres);
+    pre= darray1(Nres);
+    PASsumN= darray1(Nres);
+    PASsumC= darray1(Nres);
+    PASaveN5= darray1(Nres);
+    PASaveC5= darray1(Nres);
 
-    ccmpred=darray2(Nres,Nres);
-   
-    sprintf(filename,"%s.ccmpred",target);
-    fp=fopen(filename, "r");
+    for(i=0;i<=Nres;i++)
+    {
+        evptr[i]=0;
+    }
+    evptr[Nres+1]=0;
 
-    for(i=0;i<Nres;i++)
+    if(fc==NULL)
     {
+//  row k enters the sweep at the start of each of its segments and leaves
+//  one past its end
+        for(k=0;k<Nmsa;k++)
+        {
+            if(pasinfo[k]==0)
+            {
+                continue ;
+            }
+            for(p=segptr[k];p<segptr[k+1];p++)
+            {
+                evptr[seg[p][0]+1]+=1;
+                evptr[seg[p][1]+2]+=1;
+            }
+        }
+        for(i=1;i<=Nres+1;i++)
+        {
+            evptr[i]+=evptr[i-1];
+        }
+
+        evrow= iarray1(evptr[Nres+1]+1);
+        for(k=0;k<Nmsa;k++)
+        {
+            if(pasinfo[k]==0)
+            {
+                continue ;
+            }
+            for(p=segptr[k];p<segptr[k+1];p++)
+            {
+                evrow[evptr[seg[p][0]]++]=k+1;
+                evrow[evptr[seg[p][1]+1]++]=-(k+1);
+            }
+        }
+        for(i=Nres+1;i>0;i--)
+        {
+            evptr[i]=evptr[i-1];
+        }
+        evptr[0]=0;
+    }
+
+//  sum_PAS2 starts from the column sums of PAS3, taken row by row
+    for(j=0;j<=Nres;j++)
+    {
+        diff[j]=0;
+    }
+    for(j=0;j<Nres;j++)
+    {
+        PASsumN[j]=0.0;
+        PASsumC[j]=0.0;
+    }
+    for(r=0;r<Nres;r++)
+    {
+        sweep_covrow(covrow,diff,fc,evptr,evrow,segptr,seg,r,Nres);
+        #pragma omp parallel for private(j)
         for(j=0;j<Nres;j++)
         {
-            fscanf(fp,"%lf",&ccmpred[i][j]);
-//            fscanf(fp,"%lf\t",&ccmpred[i][j]);
+            PASsumC[j]+=(double) covrow[j]/(double) Npasinfo;
         }
-//        fscanf(fp,"\n");
     }
-    fclose(fp);
 
-    for(i=0;i<Nres;i++)
+    for(j=0;j<=Nres;j++)
     {
-        for(j=i;j<i+12;j++)
+        diff[j]=0;
+    }
+    for(r=0;r<Nres;r++)
+    {
+        sweep_covrow(covrow,diff,fc,evptr,evrow,segptr,seg,r,Nres);
+
+//  sum_PAS: the prefix of row r up to i and its suffix from i
+        PASsum=0.0;
+        for(j=0;j<Nres;j++)
         {
-            if(j<Nres)
+            PASsum+=(double) covrow[j]/(double) Npasinfo;
+            pre[j]=PASsum;
+        }
+        ini=(r-win<0) ? 0 : r-win;
+        fin=(r+win>Nres-1) ? Nres-1 : r+win;
+        #pragma omp parallel for private(i,j,PASsum)
+        for(i=ini;i<=fin;i++)
+        {
+            PASsum=0.0;
+            for(j=i;j<Nres;j++)
             {
-                ccmpred[i][j]=0.0;
-                ccmpred[j][i]=0.0;
+                PASsum+=(double) covrow[j]/(double) Npasinfo;
             }
+            PASaveC[i][r-i+win]=PASsum/((double) (Nres-i));
+            PASaveN[i][r-i+win]=pre[i]/((double) (i+1));
+        }
+
+//  sum_PAS2; like there, row 0 is never taken out of the C-terminal sum
+        #pragma omp parallel for private(j)
+        for(j=0;j<Nres;j++)
+        {
+            PASsumN[j]+=(double) covrow[j]/(double) Npasinfo;
+            if(r>0)
+            {
+                PASsumC[j]-=(double) covrow[j]/(double) Npasinfo;
+            }
+            PASaveN5[j]=PASsumN[j]/((double) (r+1));
+            PASaveC5[j]=PASsumC[j]/((double) (Nres-r));
+        }
+        maxN=0;
+        maxC=0;
+        for(j=0;j<Nres;j++)
+        {
+            if(maxN<PASaveN5[j])
+            {
+                maxN=PASaveN5[j];
+            }
+            if(maxC<PASaveC5[j])
+            {
+                maxC=PASaveC5[j];
+            }
+        }
+        PASmaxN[r]=maxN;
+        PASmaxC[r]=maxC;
+
+        interpolation(PASaveN2[r],PASaveC2[r],PASaveN5,PASaveC5,Nwin,Nres);
+    }
+
+//  the windows running past either end repeat their last value, as in sum_PAS
+    for(i=0;i<Nres;i++)
+    {
+        ini=-win;
+        fin=+win;
+        if(i+ini<0)
+        {
+            ini=-i;
+        }
+        if(i+fin>Nres-1)
+        {
+            fin=Nres-1-i;
+        }
+        for(k=-win;k<ini;k++)
+        {
+            PASaveN[i][k+win]=PASaveN[i][ini+win];
+            PASaveC[i][k+win]=PASaveC[i][ini+win];
+        }
+        for(k=fin+1;k<=win;k++)
+        {
+            PASaveN[i][k+win]=PASaveN[i][fin+win];
+            PASaveC[i][k+win]=PASaveC[i][fin+win];
         }
     }
 
+    free_iarray1(evptr);
+    if(evrow!=NULL)
+    {
+        free_iarray1(evrow);
+    }
+    free_iarray1(diff);
+    free_iarray1(covrow);
+    free_darray1(pre);
+    free_darray1(PASsumN);
+    free_darray1(PASsumC);
+    free_darray1(PASaveN5);
+    free_darray1(PASaveC5);
+}
+
+void write_PAS(double **PAS, char *out_PAS, int Nres) {
+    FILE *fp_PAS;
+    int i,j;
 
-    return ccmpred;
+    fp_PAS=fopen(out_PAS,"w");
+
+    for(i=0;i<Nres;i++) {
+        for(j=0;j<Nres;j++) {
+            fprintf(fp_PAS,"%4d %4d %8.6f\n", i+1,j+1,PAS[i][j]);
+        }
+    }
+
+    fclose(fp_PAS) ;
 }
 
-double cal_ccm_cut(double **ccmpred, int Nres)
+// parses the .ccmpred text matrix into float32 (CCMpred writes float32
+// values, so this is lossless), zeroes |i-j|<12 and computes the mean and
+// standard deviation of the couplings j>=i+12 on the way.
+float *parse_ccmpred(char *target, int Nres, double *ave, double *stddev)
 {
 
-    int i, j ;
-    double sum, sum2, Nedge, ave,ave2, dd, stddev;
-    double ccm_cut;
+    FILE *fp;
+    char filename[1000];
+
+    float *ccmpred;
+    double ccm;
+    int i,j;
+    double sum, sum2, Nedge, ave2, dd;
+
+    ccmpred=(float *) malloc((size_t) Nres*Nres*sizeof(float));
+   
+    sprintf(filename,"%s.ccmpred",target);
+    fp=fopen(filename, "r");
 
     sum=0;
     sum2=0;
     Nedge=0;
     for(i=0;i<Nres;i++)
     {
-        for(j=i+12;j<Nres;j++)
+        for(j=0;j<Nres;j++)
         {
-            Nedge+=1 ;
-            sum+=ccmpred[i][j] ;
-            sum2+=pow(ccmpred[i][j],2) ;
-        } 
+            if((fp==NULL)||(fscanf(fp,"%lf",&ccm)!=1))
+            {
+                ccm=0.0;
+            }
+            if(j>=i+12)
+            {
+                Nedge+=1 ;
+                sum+=ccm ;
+                sum2+=pow(ccm,2) ;
+            }
+            if(abs(i-j)<12)
+            {
+                ccm=0.0;
+            }
+            ccmpred[(size_t) i*Nres+j]=(float) ccm;
+        }
+    }
+    if(fp!=NULL)
+    {
+        fclose(fp);
     }
 
-    ave=sum/Nedge;
+    *ave=sum/Nedge;
     ave2=sum2/Nedge;
-    dd=ave2-pow(ave,2);
-    stddev=sqrt(dd);
+    dd=ave2-pow(*ave,2);
+    *stddev=sqrt(dd);
+//    printf("Nedge: %f ave: %f stddev: %f\n",Nedge,*ave,*stddev);
+
+    return ccmpred;
+}
+
+// %s.ccmpred.bin: a 64 byte header (char[8] "CONDOCCM", int32 Nres,
+// int32 band=12, double ave, double stddev, then the int64 size, mtime
+// seconds and mtime nanoseconds of the .ccmpred it was parsed from, zero
+// padding) followed by the band-zeroed Nres x Nres float32 matrix,
+// row-major, native byte order. Written to a temporary name and renamed, so
+// concurrent runs never see a partial file. st_text is the stat of the text
+// file taken before it was parsed, NULL if there is none.
+int write_ccmpred_bin(char *target, float *ccmpred, int Nres, double ave, double stddev, struct stat *st_text)
+{
+    FILE *fp;
+    char filename[1000], tmpname[1100];
+    char header[64];
+    int band=12;
+    int64_t source[3];
+    size_t Ncell;
+
+    sprintf(filename,"%s.ccmpred.bin",target);
+    sprintf(tmpname,"%s.%d",filename,(int) getpid());
+
+    memset(header,0,64);
+    memcpy(header,"CONDOCCM",8);
+    memcpy(header+8,&Nres,sizeof(int));
+    memcpy(header+12,&band,sizeof(int));
+    memcpy(header+16,&ave,sizeof(double));
+    memcpy(header+24,&stddev,sizeof(double));
+    if(st_text!=NULL)
+    {
+        source[0]=(int64_t) st_text->st_size;
+        source[1]=(int64_t) st_text->st_mtim.tv_sec;
+        source[2]=(int64_t) st_text->st_mtim.tv_nsec;
+        memcpy(header+32,source,sizeof(source));
+    }
+
+    fp=fopen(tmpname,"wb");
+    if(fp==NULL)
+    {
+        return 1;
+    }
+    Ncell=(size_t) Nres*Nres;
+    if((fwrite(header,1,64,fp)!=64)||(fwrite(ccmpred,sizeof(float),Ncell,fp)!=Ncell))
+    {
+        fclose(fp);
+        remove(tmpname);
+        return 1;
+    }
+    if(fclose(fp)!=0)
+    {
+        remove(tmpname);
+        return 1;
+    }
+    if(rename(tmpname,filename)!=0)
+    {
+        remove(tmpname);
+        return 1;
+    }
+    return 0;
+}
+
+// memory-maps %s.ccmpred.bin; NULL if it is missing, was written for a
+// different Nres, or the .ccmpred text file (if there is one) is not the one
+// it was parsed from: its size or its nanosecond mtime differ. A whole-second
+// mtime comparison missed a .ccmpred rewritten in the same second.
+float **map_ccmpred_bin(char *target, int Nres, double *ave, double *stddev)
+{
+    char filename[1000], textname[1000];
+    struct stat st, st_text;
+    char *data;
+    float **ccmpred;
+    int fd, i, Nres2;
+    int64_t source[3];
+    size_t size;
+
+    sprintf(filename,"%s.ccmpred.bin",target);
+    sprintf(textname,"%s.ccmpred",target);
+    if(stat(filename,&st)!=0)
+    {
+        return NULL;
+    }
+    size=64+(size_t) Nres*Nres*sizeof(float);
+    if((size_t) st.st_size!=size)
+    {
+        return NULL;
+    }
+
+    fd=open(filename,O_RDONLY);
+    if(fd<0)
+    {
+        return NULL;
+    }
+    data=(char *) mmap(NULL,size,PROT_READ,MAP_SHARED,fd,0);
+    close(fd);
+    if(data==MAP_FAILED)
+    {
+        return NULL;
+    }
+    memcpy(&Nres2,data+8,sizeof(int));
+    if((memcmp(data,"CONDOCCM",8)!=0)||(Nres2!=Nres))
+    {
+        munmap(data,size);
+        return NULL;
+    }
+    memcpy(source,data+32,sizeof(source));
+    if((stat(textname,&st_text)==0)&&((source[0]!=(int64_t) st_text.st_size)
+        ||(source[1]!=(int64_t) st_text.st_mtim.tv_sec)||(source[2]!=(int64_t) st_text.st_mtim.tv_nsec)))
+    {
+        munmap(data,size);
+        return NULL;
+    }
+    memcpy(ave,data+16,sizeof(double));
+    memcpy(stddev,data+24,sizeof(double));
+
+    ccmpred=(float **) malloc(Nres*sizeof(float *));
+    ccmpred[0]=(float *) (data+64);
+    for(i=1;i<Nres;i++)
+    {
+        ccmpred[i]=ccmpred[i-1]+Nres;
+    }
+    return ccmpred;
+}
 
-    ccm_cut=ave+2*stddev;
-//    printf("Nedge: %f ave: %f stddev: %f, ccm_cut: %f \n",Nedge,ave,stddev,ccm_cut);
+// the band-zeroed CCMpred matrix and its coupling statistics. The text file
+// is parsed once and cached as %s.ccmpred.bin; later runs map the cache.
+// If the cache cannot be written the parsed matrix is used directly.
+float **read_ccmpred(char *target, int Nres, double *ave, double *stddev)
+{
+    char textname[1000];
+    struct stat st_text;
+    float **ccmpred;
+    float *data;
+    int i, has_text;
+
+    ccmpred=map_ccmpred_bin(target,Nres,ave,stddev);
+    if(ccmpred!=NULL)
+    {
+        return ccmpred;
+    }
 
-    return ccm_cut;
+    sprintf(textname,"%s.ccmpred",target);
+    has_text=(stat(textname,&st_text)==0);
+    data=parse_ccmpred(target,Nres,ave,stddev);
+    if(write_ccmpred_bin(target,data,Nres,*ave,*stddev,has_text ? &st_text : NULL)==0)
+    {
+        ccmpred=map_ccmpred_bin(target,Nres,ave,stddev);
+        if(ccmpred!=NULL)
+        {
+            free(data);
+            return ccmpred;
+        }
+    }
+
+    ccmpred=(float **) malloc(Nres*sizeof(float *));
+    ccmpred[0]=data;
+    for(i=1;i<Nres;i++)
+    {
+        ccmpred[i]=ccmpred[i-1]+Nres;
+    }
+    return ccmpred;
 }
 
 
-double *cal_ccm_community(double **ccmpred,double ccm_cut, int Nres ) 
+// community profile of the CCMpred contact graph for each of Ncut cutoffs.
+// The couplings above the lowest cutoff are gathered once as CSR rows in
+// column order, so every cutoff only walks the edge list: O(E + Nres) per
+// cutoff instead of two dense Nres x Nres scans. Sums are accumulated in the
+// same order as the dense scan. The matrix is not exactly symmetric, so both
+// triangles are kept.
+double **cal_ccm_community(float **ccmpred, double *ccm_cut, int Ncut, int Nres)
 {
 
-    int i, j,k ;
-    int Nedge1, Nedge2;
-    double sum_con, M;
-    double *community;
+    int i, j, k, c, e ;
+    int Nedge;
+    int *rowptr, *col;
+    float *val;
+    double cut, cut_min, M;
+    double **community;
     double community1, community2;
 
     double ddd1,ddd2,dm1,dm2,dd1,dd2,dd0;
 
-    community=darray1(Nres);
+    community=darray2(Ncut,Nres);
 
-    sum_con=0;
+    cut_min=ccm_cut[0];
+    for(c=1;c<Ncut;c++)
+    {
+        if(ccm_cut[c]<cut_min)
+        {
+            cut_min=ccm_cut[c];
+        }
+    }
 
+    rowptr=iarray1(Nres+1);
+    rowptr[0]=0;
+    #pragma omp parallel for private(i,j)
     for(i=0;i<Nres;i++)
     {
-        for(j=i+1;j<Nres;j++)
+        rowptr[i+1]=0;
+        for(j=0;j<Nres;j++)
         {
-            if(ccmpred[i][j]>ccm_cut)
+            if(ccmpred[i][j]>cut_min)
             {
-               sum_con+=ccmpred[i][j] ;
+                rowptr[i+1]+=1;
             }
-        } 
+        }
     }
+    for(i=0;i<Nres;i++)
+    {
+        rowptr[i+1]+=rowptr[i];
+    }
+    Nedge=rowptr[Nres];
 
-    M=sum_con ;
-
-    ddd1=0;
-    ddd2=M;
-    dm1=0;
-    dm2=2*M;
-
-
-    for(k=0;k<Nres;k++)
+    col=iarray1(Nedge+1);
+    val=(float *) malloc((Nedge+1)*sizeof(float));
+    #pragma omp parallel for private(i,j,e)
+    for(i=0;i<Nres;i++)
     {
-        dd1=0;
-        dd2=0;
-        dd0=0;
-        for(i=0;i<k;i++)
+        e=rowptr[i];
+        for(j=0;j<Nres;j++)
         {
-            if(ccmpred[k][i]>ccm_cut)
+            if(ccmpred[i][j]>cut_min)
             {
-                dd1+=ccmpred[k][i];
-                dd0+=ccmpred[k][i];
+                col[e]=j;
+                val[e]=ccmpred[i][j];
+                e+=1;
             }
         }
+    }
+    printf("[feature] ccm edges: %d\n",Nedge);
 
-        for(i=k+1;i<Nres;i++)
+    #pragma omp parallel for private(c,i,k,e,cut,M,ddd1,ddd2,dm1,dm2,dd1,dd2,dd0,community1,community2)
+    for(c=0;c<Ncut;c++)
+    {
+        cut=ccm_cut[c];
+
+        M=0;
+        for(i=0;i<Nres;i++)
         {
-            if(ccmpred[k][i]>ccm_cut)
+            for(e=rowptr[i];e<rowptr[i+1];e++)
             {
-                dd2+=ccmpred[k][i];
-                dd0+=ccmpred[k][i];
+                if((col[e]>i)&&(val[e]>cut))
+                {
+                    M+=val[e];
+                }
             }
         }
 
-        ddd1+=dd1;
-        ddd2-=dd2;
-        dm1+=dd0;
-        dm2-=dd0;
-        community1=ddd1/M+ddd2/M;
-        community2=pow(dm1/(2*M),2)+pow(dm2/(2*M),2);
-        community[k]=community1-community2;
+        ddd1=0;
+        ddd2=M;
+        dm1=0;
+        dm2=2*M;
+
+        for(k=0;k<Nres;k++)
+        {
+            dd1=0;
+            dd2=0;
+            dd0=0;
+            for(e=rowptr[k];e<rowptr[k+1];e++)
+            {
+                if(val[e]>cut)
+                {
+                    if(col[e]<k)
+                    {
+                        dd1+=val[e];
+                    }
+                    else if(col[e]>k)
+                    {
+                        dd2+=val[e];
+                    }
+                    else
+                    {
+                        continue;
+                    }
+                    dd0+=val[e];
+                }
+            }
+
+            ddd1+=dd1;
+            ddd2-=dd2;
+            dm1+=dd0;
+            dm2-=dd0;
+            community1=ddd1/M+ddd2/M;
+            community2=pow(dm1/(2*M),2)+pow(dm2/(2*M),2);
+            community[c][k]=community1-community2;
+        }
     }
 
+    free_iarray1(rowptr);
+    free_iarray1(col);
+    free(val);
+
     return community;
 }
 
@@ -1123,7 +2157,7 @@ void find_ccm_comm_min_max(double *ccm_community, double *comm_min, double *comm
 }
 
 
-void write_ccm(double **ccmpred, double ccm_cut, char *out_ccm, int Nres)
+void write_ccm(float **ccmpred, double ccm_cut, char *out_ccm, int Nres)
 {
     FILE *fp_ccm;
     int i,j;
@@ -1164,10 +2198,75 @@ void write_community(double *ccm_community, char *out_community, int Nres)
    
 }
 
+// the feature matrix as text: index column, exist flags as integers and
+// %6.4f for everything else
+void write_feature(double **feature, int Nexist, char *out_feature, int Nres, int Nfeature)
+{
+    FILE *fp_feature;
+    int i,n;
+
+    fp_feature=fopen(out_feature,"w");
+
+    for(i=0;i<Nres;i++)
+    {
+        fprintf(fp_feature,"%4d", i+1);
+        for(n=0;n<Nexist;n++)
+        {
+            fprintf(fp_feature," %d", (int) feature[i][n]);
+        }
+        for(n=Nexist;n<Nfeature;n++)
+        {
+            fprintf(fp_feature," %6.4f", feature[i][n]);
+        }
+        fprintf(fp_feature,"\n");
+    }
+
+    fclose(fp_feature) ;
+}
+
+// the feature matrix as a float32 Nres x Nfeature .npy (format 1.0) that
+// np.load can read or memory-map. Values are rounded to 4 decimals so they
+// are the same as the ones parsed back from the text file.
+void write_feature_npy(double **feature, char *out_feature, int Nres, int Nfeature)
+{
+    FILE *fp_feature;
+    char header[128];
+    unsigned char magic[10]={0x93,'N','U','M','P','Y',1,0,0,0};
+    unsigned int one=1;
+    float *row;
+    int i,n,len;
+
+    len=sprintf(header,"{'descr': '%cf4', 'fortran_order': False, 'shape': (%d, %d), }",
+                *((unsigned char *) &one)==1 ? '<' : '>', Nres, Nfeature);
+    while((10+len+1)%64!=0)
+    {
+        header[len++]=' ';
+    }
+    header[len++]='\n';
+    magic[8]=len&0xff;
+    magic[9]=(len>>8)&0xff;
+
+    fp_feature=fopen(out_feature,"wb");
+    fwrite(magic,1,10,fp_feature);
+    fwrite(header,1,len,fp_feature);
+
+    row=(float *) malloc(Nfeature*sizeof(float));
+    for(i=0;i<Nres;i++)
+    {
+        for(n=0;n<Nfeature;n++)
+        {
+            row[n]=(float) (rint(feature[i][n]*10000.0)/10000.0);
+        }
+        fwrite(row,sizeof(float),Nfeature,fp_feature);
+    }
+    free(row);
+
+    fclose(fp_feature) ;
+}
+
 
 int main(int argc, char *argv[])
 {
-    FILE *fp_feature ;
     FILE *fp_feature2 ;
 
     FILE *fp_PAS, *fp_PAS2, *fp_PAS3 ;
@@ -1178,31 +2277,41 @@ int main(int argc, char *argv[])
     char *target ;
     char *seq, line[maxline] ;
     int *seqn;
-    int **msa, **msa2;
+    unsigned char **msa;
     double **ss2;
     double **sa2;
     int **Nsig;
     int **Nsite;
     double **psig5, **msig5;
 
-    int ****fc ;
+    int **fc ;
     int **fs ;
     int **fz ;
     double **profile;
 
     int *pasinfo;
+    int *segptr, **seg;
     double **PAS, **PAS2, **PAS3;
     double **PASaveN, **PASaveC ;
     double **PASaveN2, **PASaveC2 ;
     double *PASmaxN, *PASmaxC;
 
-    double **ccmpred ;
-    double *ccm_community;
+    float **ccmpred ;
+    double ccm_ave, ccm_std;
+    double **ccm_community;
     double *ccm_comm;
     double comm_max, comm_min;
-    double ccm_cut ;
+    double *ccm_cut ;
+    double *ccm_sigma ;
+    int Nsigma ;
+    char *tok, *saveptr ;
 
     int Npasinfo;
+    double **feature;
+    int Nfeature;
+    double **feature_base;
+    int *base_col;
+    int Nbase;
 
     char out_PAS[1000], out_PAS2[1000], out_PAS3[1000] ;
     char out_ccm[1000], out_community[1000];
@@ -1219,15 +2328,41 @@ int main(int argc, char *argv[])
     int win_ccm2=100;
 
     int Ncpu ;
-
-    int i,j,k, l, m,n ; 
+    int dense_pas=0;
+    int stream=0;
+    int Nchunk=10000;
+    int binary=0;
+    int base=0;
+    int feature2=0;
+    int profile_msa=0;
+    int profile_only=0;
+    char *qij_file=NULL;
+    double **qij;
+    double pseudo=10.0;
+    char out_profile[1000];
+
+    int i,j,k, l, m,n, c ; 
     int fsim,fsjn;
     time_t time_0, time_now, running_time;
 
 
     if(argc==1)
     {
-        printf("mi target\n");
+        printf("feature target [Ncpu] [-dense_pas] [-stream [-chunk N]] [-ccm_sigma f1,f2,...] [-binary] [-base] [-feature2]\n");
+        printf("               [-profile ck2|msa [-qij file] [-pseudo f] [-profile_only]]\n");
+        printf("  -dense_pas  build the Nres x Nres PAS matrices, as the original code did\n");
+        printf("  -stream     fold the .msa into the counts N rows at a time (-chunk, default 10000)\n");
+        printf("              instead of reading it into memory\n");
+        printf("  -ccm_sigma  coupling cutoffs ave+f*std for the ccm community (default 2);\n");
+        printf("              the first goes to %%s.feature.txt, the others to %%s.feature.sigma<f>.txt\n");
+        printf("  -binary     write %%s.feature.npy (float32 Nres x 1129) instead of %%s.feature.txt\n");
+        printf("  -base       write only the per-residue base columns as %%s.base.npy (float32 Nres x 249);\n");
+        printf("              scripts/features.py expands them to the full feature rows\n");
+        printf("  -feature2   also write %%s.feature2.txt\n");
+        printf("  -profile    ck2: read the PSI-BLAST profile from %%s.ck2 (default); msa: compute it from\n");
+        printf("              the weighted %%s.msa with -qij pseudocounts of weight -pseudo (default 10)\n");
+        printf("              and write it to %%s.msa.ck2, so no PSI-BLAST search is needed\n");
+        printf("  -profile_only  write %%s.msa.ck2 and stop, before the psipred and SANN inputs are read\n");
         abort();
     }
     target=argv[1];
@@ -1235,9 +2370,104 @@ int main(int argc, char *argv[])
     printf("[feature] target: %s\n",target);
 
     Ncpu=1 ;
-    if(argc>=3)
+    Nsigma=1;
+    ccm_sigma=darray1(1);
+    ccm_sigma[0]=2.0;
+    l=2;
+    if((argc>=3)&&(argv[2][0]!='-'))
     {
         Ncpu=atoi(argv[2]);
+        l=3;
+    }
+    for(;l<argc;l++)
+    {
+        if(strcmp(argv[l],"-dense_pas")==0)
+        {
+            dense_pas=1;
+        }
+        else if(strcmp(argv[l],"-stream")==0)
+        {
+            stream=1;
+        }
+        else if(strcmp(argv[l],"-binary")==0)
+        {
+            binary=1;
+        }
+        else if(strcmp(argv[l],"-base")==0)
+        {
+            base=1;
+        }
+        else if(strcmp(argv[l],"-feature2")==0)
+        {
+            feature2=1;
+        }
+        else if((strcmp(argv[l],"-profile")==0)&&(l+1<argc))
+        {
+            l+=1;
+            if(strcmp(argv[l],"msa")==0)
+            {
+                profile_msa=1;
+            }
+            else if(strcmp(argv[l],"ck2")!=0)
+            {
+                printf("[feature] unknown profile: %s\n",argv[l]);
+                abort();
+            }
+        }
+        else if(strcmp(argv[l],"-profile_only")==0)
+        {
+            profile_msa=1;
+            profile_only=1;
+        }
+        else if((strcmp(argv[l],"-qij")==0)&&(l+1<argc))
+        {
+            l+=1;
+            qij_file=argv[l];
+        }
+        else if((strcmp(argv[l],"-pseudo")==0)&&(l+1<argc))
+        {
+            l+=1;
+            pseudo=atof(argv[l]);
+        }
+        else if((strcmp(argv[l],"-chunk")==0)&&(l+1<argc))
+        {
+            l+=1;
+            Nchunk=atoi(argv[l]);
+            if(Nchunk<1)
+            {
+                Nchunk=1;
+            }
+        }
+        else if((strcmp(argv[l],"-ccm_sigma")==0)&&(l+1<argc))
+        {
+            l+=1;
+            free_darray1(ccm_sigma);
+            Nsigma=1;
+            for(k=0;argv[l][k]!='\0';k++)
+            {
+                if(argv[l][k]==',')
+                {
+                    Nsigma+=1;
+                }
+            }
+            ccm_sigma=darray1(Nsigma);
+            Nsigma=0;
+            for(tok=strtok_r(argv[l],",",&saveptr);tok!=NULL;tok=strtok_r(NULL,",",&saveptr))
+            {
+                ccm_sigma[Nsigma]=atof(tok);
+                Nsigma+=1;
+            }
+            if(Nsigma==0)
+            {
+                printf("[feature] empty -ccm_sigma list\n");
+                abort();
+            }
+        }
+        else
+        {
+            printf("[feature] unknown option: %s\n",argv[l]);
+            abort();
+        }
     }
     omp_set_num_threads(Ncpu);
     printf("[feature] Ncpu: %d\n",Ncpu);
@@ -1245,11 +2475,27 @@ int main(int argc, char *argv[])
     //time(&time_0);
     //printf("[feature] %s",ctime(&time_0));
 
+    init_seqindex();
     seq=read_seq(target,&Nres);
     seqn=mod_seq(seq,Nres);
 
     printf("[feature] Nres: %d\n",Nres) ;
 
+    if(profile_only)
+    {
+        if(qij_file==NULL)
+        {
+            printf("[feature] -profile msa needs -qij\n");
+            abort();
+        }
+        qij=read_qij(qij_file);
+        profile=stream_profile(target,Nres,Nchunk,seqn,qij,pseudo);
+        sprintf(out_profile,"%s.msa.ck2",target);
+        write_profile(profile,seq,Nres,out_profile);
+        printf("[feature] profile from the msa written to %s\n",out_profile);
+        return 0;
+    }
+
     ss2=read_ss2(target,Nres);
     //printf("[feature] SS2"); 
  
@@ -1263,30 +2509,69 @@ int main(int argc, char *argv[])
 //        printf("%4d %5.3f %5.3f %5.3f %5.3f\n",i, sa2[i][0],sa2[i][1],sa2[i][2],sa2[i][3]);
 //    }
 
-    Nmsa=find_Nmsa(target);
-    msa=iarray2(Nmsa+1,Nres+1);
-    msa2=iarray2(Nmsa+1,Nres+1);
-    pasinfo=iarray1(Nmsa+1);
-    read_msa(target,msa,msa2,pasinfo,Nres,Nmsa);
+    Nsig=iarray2(Nres,3);
+    for(i=0;i<Nres;i++)
+    {
+        for(j=0;j<=2;j++)
+        {
+            Nsig[i][j]=0;
+        }
+    }
 
-//    for(k=0;k<Nmsa;k++)
-//    {
-//        printf("%4d ",k);
-//        for(i=0;i<Nres;i++)
+    fc=NULL;
+    if(stream||dense_pas)
+    {
+        fc=iarray2(Nres+1,Nres+1);
+        for(i=0;i<=Nres;i++)
+        {
+            for(j=0;j<=Nres;j++)
+            {
+                fc[i][j]=0;
+            }
+        }
+    }
+
+    if(stream)
+    {
+        msa=NULL;
+        segptr=NULL;
+        seg=NULL;
+        pasinfo=NULL;
+        stream_msa(target,Nres,Nchunk,Nsig,fc,&Nmsa,&Npasinfo);
+    }
+    else
+    {
+        msa=read_msa(target,Nres,&Nmsa,&segptr,&seg,&pasinfo);
+
+//        for(k=0;k<Nmsa;k++)
 //        {
-//            printf("%d",msa2[k][i]);
+//            printf("%4d ",k);
+//            for(l=segptr[k];l<segptr[k+1];l++)
+//            {
+//                printf(" %d-%d",seg[l][0]+1,seg[l][1]+1);
+//            }
+//            printf("\n");
 //        }
-//        printf("\n");
-//    }
 
-    Npasinfo=0;
-    for(k=0;k<Nmsa;k++)
-    {
-        if(pasinfo[k]!=0)
+        Npasinfo=0;
+        for(k=0;k<Nmsa;k++)
+        {
+            if(pasinfo[k]!=0)
+            {
+                Npasinfo+=1;
+            }
+        }
+
+        add_n_signal(Nsig,segptr,seg,Nres,Nmsa);
+        if(fc!=NULL)
         {
-            Npasinfo+=1;
+            add_PAS_count(fc,segptr,seg,pasinfo,Nres,Nmsa);
         }
     }
+    if(fc!=NULL)
+    {
+        sum_PAS_count(fc,Nres);
+    }
 
     if(Nmsa<10)
     {
@@ -1327,8 +2612,31 @@ int main(int argc, char *argv[])
     printf("[feature] Npas: %d dpas: %f rpas: %f \n", Npasinfo,dpas,rpas);
 
 
-//    profile=gen_profile(msa,Nres,Nmsa);
-    profile=read_profile(target,Nres);
+    if(profile_msa)
+    {
+        if(qij_file==NULL)
+        {
+            printf("[feature] -profile msa needs -qij\n");
+            abort();
+        }
+        qij=read_qij(qij_file);
+        if(stream)
+        {
+            profile=stream_profile(target,Nres,Nchunk,seqn,qij,pseudo);
+        }
+        else
+        {
+            profile=gen_profile(msa,Nres,Nmsa,seqn,qij,pseudo);
+        }
+        sprintf(out_profile,"%s.msa.ck2",target);
+        write_profile(profile,seq,Nres,out_profile);
+        printf("[feature] profile from the msa written to %s\n",out_profile);
+        free_darray2(qij);
+    }
+    else
+    {
+        profile=read_profile(target,Nres);
+    }
 
 //    for(i=0;i<Nres;i++)
 //    {
@@ -1342,7 +2650,7 @@ int main(int argc, char *argv[])
     psig5=darray2(Nres,3);
     Nsite=iarray2(Nres,3);
 
-    get_n_signal(msa2,msig5,psig5,Nsite, Nres,Nmsa);
+    get_n_signal(Nsig,msig5,psig5,Nsite, Nres,Nmsa);
 //    for(i=0;i<Nres;i++)
 //    {
 //        printf("%d %d %d %d\n",i,Nsite[i][0],Nsite[i][1],Nsite[i][2]);
@@ -1353,9 +2661,6 @@ int main(int argc, char *argv[])
 //        printf("%d %f %f %f\n",i,psig5[i][0],psig5[i][1],psig5[i][2]);
 //    }
 
-    PAS      = darray2(Nres, Nres);
-    PAS2     = darray2(Nres, Nres);
-    PAS3     = darray2(Nres, Nres);
     PASaveN  = darray2(Nres, 2*win_PAS + 1);
     PASaveC  = darray2(Nres, 2*win_PAS + 1);
     PASaveN2 = darray2(Nres, win_PAS2);
@@ -1363,13 +2668,35 @@ int main(int argc, char *argv[])
     PASmaxN  = darray1(Nres);
     PASmaxC  = darray1(Nres);
 
-    if(Npasinfo>0)
+    PAS=NULL;
+    PAS2=NULL;
+    PAS3=NULL;
+    if(dense_pas)
+    {
+        PAS      = darray2(Nres, Nres);
+        PAS2     = darray2(Nres, Nres);
+        PAS3     = darray2(Nres, Nres);
+        for(i=0;i<Nres;i++)
+        {
+            for(j=0;j<Nres;j++)
+            {
+                PAS[i][j]=0.0;
+                PAS2[i][j]=0.0;
+                PAS3[i][j]=0.0;
+            }
+        }
+    }
+
+    if((Npasinfo>0)&&(dense_pas))
     {
-        make_PAS(PAS,PAS2,PAS3,msa2,pasinfo, Nres,Nmsa,Npasinfo) ;
+        make_PAS(PAS,PAS2,PAS3,fc, Nres,Npasinfo) ;
         sum_PAS(PASaveN,PASaveC,PAS3,Nres, win_PAS) ;
         sum_PAS2(PASaveN2,PASaveC2,PASmaxN,PASmaxC,PAS3,Nres, win_PAS2) ;
     }
-
+    else if(Npasinfo>0)
+    {
+        stream_PAS(PASaveN,PASaveC,PASaveN2,PASaveC2,PASmaxN,PASmaxC,fc,segptr,seg,pasinfo, Nres,Nmsa,Npasinfo, win_PAS,win_PAS2) ;
+    }
     else
     {
         for(i=0;i<Nres;i++)
@@ -1377,13 +2704,6 @@ int main(int argc, char *argv[])
             PASmaxN[i]=0;
             PASmaxC[i]=0;
 
-            for(j=0;j<Nres;j++)
-            {
-                PAS[i][j]=0.0;
-                PAS2[i][j]=0.0;
-                PAS3[i][j]=0.0;
-
-            }
             for(k=0;k<=2*win_PAS;k++)
             {
                 PASaveN[i][k]=0.0;
@@ -1407,24 +2727,27 @@ int main(int argc, char *argv[])
 //      printf("%d %f %f\n",i, PASmaxN[i], PASmaxC[i]);
 //  }
 
-    ccm_cut=0.0;
+    ccm_cut=darray1(Nsigma);
     if(Nmsa>5)
     {
-        ccmpred=read_ccmpred(target,Nres);
-        ccm_cut=cal_ccm_cut(ccmpred,Nres);
-        printf("ccm_cutoff: %f\n",ccm_cut);
-        ccm_community=cal_ccm_community(ccmpred,ccm_cut, Nres);
+        ccmpred=read_ccmpred(target,Nres,&ccm_ave,&ccm_std);
+        for(c=0;c<Nsigma;c++)
+        {
+            ccm_cut[c]=ccm_ave+ccm_sigma[c]*ccm_std;
+            printf("ccm_cutoff: %f\n",ccm_cut[c]);
+        }
+        ccm_community=cal_ccm_community(ccmpred,ccm_cut,Nsigma, Nres);
     }
     else
     {
-        ccmpred=darray2(Nres,Nres);
-        ccm_community=darray1(Nres);
-        for(i=0;i<Nres;i++)
+        ccmpred=NULL;
+        ccm_community=darray2(Nsigma,Nres);
+        for(c=0;c<Nsigma;c++)
         {
-            ccm_community[i]=0.0;
-            for(j=0;j<Nres;j++)
+            ccm_cut[c]=0.0;
+            for(i=0;i<Nres;i++)
             {
-                ccmpred[i][j]=0.0;
+                ccm_community[c][i]=0.0;
             }
         }
     }
@@ -1435,8 +2758,7 @@ int main(int argc, char *argv[])
 //        printf("%d %f\n",i, ccmpred[i][Nres-1]);
 //    }
 
-    ccm_comm=interpolation_community(ccm_community,win_ccm2, Nres);
-    find_ccm_comm_min_max(ccm_community,&comm_min,&comm_max,Nres);
+    ccm_comm=interpolation_community(ccm_community[0],win_ccm2, Nres);
 
 //    printf("max: %f, min: %f \n",comm_max, comm_min);
 
@@ -1454,226 +2776,356 @@ int main(int argc, char *argv[])
 //        printf("%d %6.4f\n",j, ccm_comm[j]);
 //    }
 
-    sprintf(out_feature,"%s.feature.txt",target);
-    sprintf(out_feature2,"%s.feature2.txt",target);
-    fp_feature=fopen(out_feature,"w");
-    fp_feature2=fopen(out_feature2,"w");
-
-//    fprintf(fp_feature,"#res exist(100) ccm_community[100] comm_max comm_min PAS_N(k,101) PAS_C(k,101) PASmaxN PASmaxC position profile(k,m) ss(41,3) sa2(41,4) dmsa dpas rpas Nter Cter Len Nsite msig5 psig5 ");
-//    fprintf(fp_feature2,"#res exist(40) ccm_comm[100] PAS_N(k,100) PAS_C(k,100) position profile(k,m) ss(41,3) sa2(41,4) dmsa dpas rpas Nter Cter Len Nsite msig5 psig5 ");
-
     win_prof=10;
     win_ss=20;
     win_sa=20;
 
+//    fprintf(fp_feature,"#res exist(100) ccm_community[100] comm_max comm_min PAS_N(k,101) PAS_C(k,101) PASmaxN PASmaxC position profile(k,m) ss(41,3) sa2(41,4) dmsa dpas rpas Nter Cter Len Nsite msig5 psig5 ");
+//    fprintf(fp_feature2,"#res exist(40) ccm_comm[100] PAS_N(k,100) PAS_C(k,100) position profile(k,m) ss(41,3) sa2(41,4) dmsa dpas rpas Nter Cter Len Nsite msig5 psig5 ");
 
-    for(i=0;i<Nres;i++)
+    Nfeature=2*win_PAS+2*win_ccm+2+2*(2*win_PAS+1)+2+1+(2*win_prof+1)*(Ntype-1)+(2*win_ss+1)*3+(2*win_sa+1)*4+15;
+
+// the base columns: the community, PAS, profile, ss2 and sa2 values at
+// the centre of their windows plus the per-residue blocks. The exist flags,
+// the position and the window neighbours follow from these and Nres.
+    base_col=iarray1(Nfeature);
+    Nbase=0;
+    n=2*win_PAS;
+    base_col[Nbase++]=n+win_ccm;
+    n+=2*win_ccm;
+    for(k=0;k<2+2*(2*win_PAS+1)+2;k++)
+    {
+        base_col[Nbase++]=n++;
+    }
+    n+=1;
+    for(m=0;m<Ntype-1;m++)
+    {
+        base_col[Nbase++]=n+win_prof*(Ntype-1)+m;
+    }
+    n+=(2*win_prof+1)*(Ntype-1);
+    for(m=0;m<3;m++)
+    {
+        base_col[Nbase++]=n+win_ss*3+m;
+    }
+    n+=(2*win_ss+1)*3;
+    for(m=0;m<4;m++)
+    {
+        base_col[Nbase++]=n+win_sa*4+m;
+    }
+    n+=(2*win_sa+1)*4;
+    for(;n<Nfeature;n++)
+    {
+        base_col[Nbase++]=n;
+    }
+    feature_base=NULL;
+    if(base)
     {
+        feature_base=darray2(Nres,Nbase);
+    }
 
-        fprintf(fp_feature,"%4d", i+1);
-        fprintf(fp_feature2,"%4d", i+1);
-//exist
-        for(j=-win_PAS;j<=win_PAS;j++)
+// one feature file per ccm cutoff; only the community columns differ
+    feature=darray2(Nres,Nfeature);
+    for(c=0;c<Nsigma;c++)
+    {
+        if(base)
         {
-            if(j==0)
-            {
-                continue;
-            }
-            k=i+j;
-            if((k>=0)&&(k<Nres))
-            {
-                fprintf(fp_feature," 1");
-            }
-            else
-            {
-                fprintf(fp_feature," 0");
-            }
+            sprintf(out_feature,"%s.base.npy",target);
+        }
+        else
+        {
+            sprintf(out_feature,"%s.feature.%s",target,binary ? "npy" : "txt");
         }
+        if(c>0)
+        {
+            sprintf(strrchr(out_feature,'.'),".sigma%g.%s",ccm_sigma[c],(binary||base) ? "npy" : "txt");
+        }
+        find_ccm_comm_min_max(ccm_community[c],&comm_min,&comm_max,Nres);
 
-        for(j=-win_ss;j<=win_ss;j++)
+        for(i=0;i<Nres;i++)
         {
-            if(j==0)
+            n=0;
+//exist
+            for(j=-win_PAS;j<=win_PAS;j++)
             {
-                continue;
+                if(j==0)
+                {
+                    continue;
+                }
+                k=i+j;
+                if((k>=0)&&(k<Nres))
+                {
+                    feature[i][n++]=1.0;
+                }
+                else
+                {
+                    feature[i][n++]=0.0;
+                }
             }
-            k=i+j;
-            if((k>=0)&&(k<Nres))
+
+// ccm_community
+            for(j=-win_ccm;j<win_ccm;j++)
             {
-                fprintf(fp_feature2," 1");
+                k=i+j;
+                if((k>=0)&&(k<Nres))
+                {
+                    if (ccm_community[c][k]>0)
+                    {
+                        feature[i][n++]=ccm_community[c][k]/comm_max;
+                    }
+                    else if (ccm_community[c][k]<0)
+                    {
+                        feature[i][n++]=-ccm_community[c][k]/comm_min;
+                    }
+                    else
+                    {
+                        feature[i][n++]=0.0;
+                    }
+                }
+                else 
+                {
+                    feature[i][n++]=0.0;
+                }
             }
-            else
+
+//community max min
+            feature[i][n++]=comm_max;
+            feature[i][n++]=comm_min;
+
+//PAS
+            for(k=0;k<=2*win_PAS;k++)
             {
-                fprintf(fp_feature2," 0");
+                feature[i][n++]=PASaveN[i][k];
+            }
+            for(k=0;k<=2*win_PAS;k++)
+            {
+                feature[i][n++]=PASaveC[i][k];
             }
-        }
 
-// ccm_community
-        for(j=-win_ccm;j<win_ccm;j++)
-        {
-            k=i+j;
-            if((k>=0)&&(k<Nres))
+//PASmax
+            feature[i][n++]=PASmaxN[i];
+            feature[i][n++]=PASmaxC[i];
+
+//position
+            feature[i][n++]=(i+1)/(double) Nres;
+
+            for(j=-win_prof;j<=win_prof;j++)
             {
-                if (ccm_community[k]>0)
-                {
-                    fprintf(fp_feature," %6.4f", ccm_community[k]/comm_max);
-                }
-                else if (ccm_community[k]<0)
+                k=i+j;
+                for(m=1;m<Ntype;m++)
                 {
-                    fprintf(fp_feature," %6.4f", -ccm_community[k]/comm_min);
+                    feature[i][n++]=((k>=0)&&(k<Nres)) ? profile[k][m] : 0.0;
                 }
-				else
+            }
+
+            for(j=-win_ss;j<=win_ss;j++)
+            {
+                k=i+j;
+                for(m=0;m<3;m++)
                 {
-                    fprintf(fp_feature," %6.4f", 0.0);
+                    feature[i][n++]=((k>=0)&&(k<Nres)) ? ss2[k][m] : 0.0;
                 }
-//                fprintf(fp_feature," %6.4f", ccm_community[k]);
             }
-            else 
+            for(j=-win_sa;j<=win_sa;j++)
             {
-                fprintf(fp_feature," %6.4f", 0.0);
+                k=i+j;
+                for(m=0;m<4;m++)
+                {
+                    feature[i][n++]=((k>=0)&&(k<Nres)) ? sa2[k][m] : 0.0;
+                }
             }
-        }
 
-        for(j=0;j<win_ccm2;j++)
-        {
-//            fprintf(fp_feature2," %6.4f", ccm_comm[j]);
-            if(ccm_comm[j]>0)
+
+            Nter=((double) i) /1000.0;
+            if(Nter>1.0)
             {
-                fprintf(fp_feature2," %6.4f", ccm_comm[j]/comm_max);
+                Nter=1.0;
             }
-            else if(ccm_comm[j]<0)
+            Cter=((double) (Nres-i-1)) /1000.0;
+            if(Cter>1.0)
             {
-                fprintf(fp_feature2," %6.4f", -ccm_comm[j]/comm_min);
+                Cter=1.0;
             }
-			else 
+            NCter=((double) Nres) / 1000.0;
+            if(NCter>1.0)
             {
-                fprintf(fp_feature2," %6.4f", 0.0);
+                NCter=1.0;
             }
 
+            feature[i][n++]=dmsa;
+            feature[i][n++]=dpas;
+            feature[i][n++]=rpas;
+            feature[i][n++]=Nter;
+            feature[i][n++]=Cter;
+            feature[i][n++]=NCter;
+            feature[i][n++]=Nsite[i][0]/22.0;
+            feature[i][n++]=Nsite[i][1]/11.0;
+            feature[i][n++]=Nsite[i][2]/11.0;
+            for(m=0;m<3;m++)
+            {
+                feature[i][n++]=msig5[i][m];
+            }
+            for(m=0;m<3;m++)
+            {
+                feature[i][n++]=psig5[i][m];
+            }
         }
 
-//community max min
-        fprintf(fp_feature," %6.4f", comm_max);
-        fprintf(fp_feature," %6.4f", comm_min);
-
-//PAS
-        for(j=-win_PAS;j<=win_PAS;j++)
-        {
-            k=j+win_PAS;
-            fprintf(fp_feature," %6.4f", PASaveN[i][k]);
-        }
-
-        for(j=-win_PAS;j<=win_PAS;j++)
+        if(base)
         {
-            k=j+win_PAS;
-            fprintf(fp_feature," %6.4f", PASaveC[i][k]);
+            for(i=0;i<Nres;i++)
+            {
+                for(n=0;n<Nbase;n++)
+                {
+                    feature_base[i][n]=feature[i][base_col[n]];
+                }
+            }
+            write_feature_npy(feature_base,out_feature,Nres,Nbase);
         }
-        for(j=0;j<win_PAS2;j++)
+        else if(binary)
         {
-            fprintf(fp_feature2," %6.4f", PASaveN2[i][j]);
+            write_feature_npy(feature,out_feature,Nres,Nfeature);
         }
-
-        for(j=0;j<win_PAS2;j++)
+        else
         {
-            fprintf(fp_feature2," %6.4f", PASaveC2[i][j]);
+            write_feature(feature,2*win_PAS,out_feature,Nres,Nfeature);
         }
+    }
 
-//PASmax
-        fprintf(fp_feature," %6.4f", PASmaxN[i]);
-        fprintf(fp_feature," %6.4f", PASmaxC[i]);
-
-//position
-        fprintf(fp_feature," %6.4f", (i+1)/(double) Nres);
-        fprintf(fp_feature2," %6.4f", (i+1)/(double) Nres);
+    if(feature2)
+    {
+        sprintf(out_feature2,"%s.feature2.txt",target);
+        fp_feature2=fopen(out_feature2,"w");
+        find_ccm_comm_min_max(ccm_community[0],&comm_min,&comm_max,Nres);
 
-        for(j=-win_prof;j<=win_prof;j++)
+        for(i=0;i<Nres;i++)
         {
-            k=i+j;
-            if((k>=0)&&(k<Nres))
+
+            fprintf(fp_feature2,"%4d", i+1);
+//exist
+            for(j=-win_ss;j<=win_ss;j++)
             {
-                for(m=1;m<Ntype;m++)
+                if(j==0)
+                {
+                    continue;
+                }
+                k=i+j;
+                if((k>=0)&&(k<Nres))
+                {
+                    fprintf(fp_feature2," 1");
+                }
+                else
                 {
-                    fprintf(fp_feature," %6.4f", profile[k][m]);
-                    fprintf(fp_feature2," %6.4f", profile[k][m]);
+                    fprintf(fp_feature2," 0");
                 }
             }
-            else
+
+// ccm_community
+            for(j=0;j<win_ccm2;j++)
             {
-                for(m=1;m<Ntype;m++)
+//            fprintf(fp_feature2," %6.4f", ccm_comm[j]);
+                if(ccm_comm[j]>0)
+                {
+                    fprintf(fp_feature2," %6.4f", ccm_comm[j]/comm_max);
+                }
+                else if(ccm_comm[j]<0)
+                {
+                    fprintf(fp_feature2," %6.4f", -ccm_comm[j]/comm_min);
+                }
+    			else 
                 {
-                    fprintf(fp_feature," %6.4f", 0.0);
                     fprintf(fp_feature2," %6.4f", 0.0);
                 }
+
             }
-        }
 
-        for(j=-win_ss;j<=win_ss;j++)
-        {
-            k=i+j;
-            if((k>=0)&&(k<Nres))
+//PAS
+            for(j=0;j<win_PAS2;j++)
             {
-                fprintf(fp_feature," %6.4f %6.4f %6.4f", ss2[k][0],ss2[k][1],ss2[k][2]);
-                fprintf(fp_feature2," %6.4f %6.4f %6.4f", ss2[k][0],ss2[k][1],ss2[k][2]);
+                fprintf(fp_feature2," %6.4f", PASaveN2[i][j]);
             }
-            else
+
+            for(j=0;j<win_PAS2;j++)
             {
-                fprintf(fp_feature," %6.4f %6.4f %6.4f", 0.0,0.0,0.0);
-                fprintf(fp_feature2," %6.4f %6.4f %6.4f", 0.0,0.0,0.0);
+                fprintf(fp_feature2," %6.4f", PASaveC2[i][j]);
             }
-        }
-        for(j=-win_sa;j<=win_sa;j++)
-        {
-            k=i+j;
-            if((k>=0)&&(k<Nres))
+
+//position
+            fprintf(fp_feature2," %6.4f", (i+1)/(double) Nres);
+
+            for(j=-win_prof;j<=win_prof;j++)
+            {
+                k=i+j;
+                if((k>=0)&&(k<Nres))
+                {
+                    for(m=1;m<Ntype;m++)
+                    {
+                        fprintf(fp_feature2," %6.4f", profile[k][m]);
+                    }
+                }
+                else
+                {
+                    for(m=1;m<Ntype;m++)
+                    {
+                        fprintf(fp_feature2," %6.4f", 0.0);
+                    }
+                }
+            }
+
+            for(j=-win_ss;j<=win_ss;j++)
             {
-                fprintf(fp_feature," %6.4f %6.4f %6.4f %6.4f",sa2[k][0],sa2[k][1],sa2[k][2],sa2[k][3]);
-                fprintf(fp_feature2," %6.4f %6.4f %6.4f %6.4f",sa2[k][0],sa2[k][1],sa2[k][2],sa2[k][3]);
+                k=i+j;
+                if((k>=0)&&(k<Nres))
+                {
+                    fprintf(fp_feature2," %6.4f %6.4f %6.4f", ss2[k][0],ss2[k][1],ss2[k][2]);
+                }
+                else
+                {
+                    fprintf(fp_feature2," %6.4f %6.4f %6.4f", 0.0,0.0,0.0);
+                }
             }
-            else
+            for(j=-win_sa;j<=win_sa;j++)
             {
-                fprintf(fp_feature," %6.4f %6.4f %6.4f %6.4f",0.0,0.0,0.0,0.0);
-                fprintf(fp_feature2," %6.4f %6.4f %6.4f %6.4f",0.0,0.0,0.0,0.0);
+                k=i+j;
+                if((k>=0)&&(k<Nres))
+                {
+                    fprintf(fp_feature2," %6.4f %6.4f %6.4f %6.4f",sa2[k][0],sa2[k][1],sa2[k][2],sa2[k][3]);
+                }
+                else
+                {
+                    fprintf(fp_feature2," %6.4f %6.4f %6.4f %6.4f",0.0,0.0,0.0,0.0);
+                }
             }
-        }
-
-
-        Nter=((double) i) /1000.0;
-        if(Nter>1.0)
-        {
-            Nter=1.0;
-        }
-        Cter=((double) (Nres-i-1)) /1000.0;
-        if(Cter>1.0)
-        {
-            Cter=1.0;
-        }
-        NCter=((double) Nres) / 1000.0;
-        if(NCter>1.0)
-        {
-            NCter=1.0;
-        }
 
-        fprintf(fp_feature," %6.4f %6.4f %6.4f",dmsa,dpas,rpas);
-        fprintf(fp_feature," %6.4f %6.4f %6.4f",Nter,Cter,NCter);
-        fprintf(fp_feature," %6.4f %6.4f %6.4f",Nsite[i][0]/22.0,Nsite[i][1]/11.0,Nsite[i][2]/11.0);
 
-        fprintf(fp_feature," %6.4f %6.4f %6.4f",msig5[i][0],msig5[i][1],msig5[i][2]);
-        fprintf(fp_feature," %6.4f %6.4f %6.4f",psig5[i][0],psig5[i][1],psig5[i][2]);
+            Nter=((double) i) /1000.0;
+            if(Nter>1.0)
+            {
+                Nter=1.0;
+            }
+            Cter=((double) (Nres-i-1)) /1000.0;
+            if(Cter>1.0)
+            {
+                Cter=1.0;
+            }
+            NCter=((double) Nres) / 1000.0;
+            if(NCter>1.0)
+            {
+                NCter=1.0;
+            }
 
-        fprintf(fp_feature,"\n");
+            fprintf(fp_feature2," %6.4f %6.4f %6.4f",dmsa,dpas,rpas);
+            fprintf(fp_feature2," %6.4f %6.4f %6.4f",Nter,Cter,NCter);
+            fprintf(fp_feature2," %6.4f %6.4f %6.4f",Nsite[i][0]/22.0,Nsite[i][1]/11.0,Nsite[i][2]/11.0);
 
-        fprintf(fp_feature2," %6.4f %6.4f %6.4f",dmsa,dpas,rpas);
-        fprintf(fp_feature2," %6.4f %6.4f %6.4f",Nter,Cter,NCter);
-        fprintf(fp_feature2," %6.4f %6.4f %6.4f",Nsite[i][0]/22.0,Nsite[i][1]/11.0,Nsite[i][2]/11.0);
+            fprintf(fp_feature2," %6.4f %6.4f %6.4f",msig5[i][0],msig5[i][1],msig5[i][2]);
+            fprintf(fp_feature2," %6.4f %6.4f %6.4f",psig5[i][0],psig5[i][1],psig5[i][2]);
 
-        fprintf(fp_feature2," %6.4f %6.4f %6.4f",msig5[i][0],msig5[i][1],msig5[i][2]);
-        fprintf(fp_feature2," %6.4f %6.4f %6.4f",psig5[i][0],psig5[i][1],psig5[i][2]);
+            fprintf(fp_feature2,"\n");
 
-        fprintf(fp_feature2,"\n");
+        }
 
+        fclose(fp_feature2) ;
     }
-
-    fclose(fp_feature) ;
-    fclose(fp_feature2) ;
     printf("[feature] Wrote feature files.\n");
 
 
@@ -1708,14 +3160,14 @@ int main(int argc, char *argv[])
     //free_darray1(PASmaxN);
     //free_darray1(PASmaxC);
 
-    //free_iarray2(msa);
-    //free_iarray2(msa2);
+    //free_ucarray2(msa);
+    //free_iarray1(segptr);
+    //free_iarray2(seg);
     //free_iarray2(Nsite);
 
     //free_darray2(ss2);
     //free_darray2(sa2);
     //free_darray2(profile);
-    //free_darray2(ccmpred);
 
     //free_darray2(msig5);
     //free_darray2(psig5);